@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+# archive.py
+# คลังแท่งย้อนหลังระยะยาว (หลายปี) ต่อ (symbol, timeframe) สำหรับ research / backtest / sweep
+#
+#   <root>/<SYMBOL>/<tf>/meta.json          จำนวนแถว, generation, ช่วงที่ exchange ไม่มีแท่ง (holes)
+#   <root>/<SYMBOL>/<tf>/<col>.<gen>.bin    1 ไฟล์ต่อ column (ts int64, ที่เหลือ float64) little-endian ดิบ
+#
+# เปิดด้วย np.memmap: query ช่วงเวลา = binary search บน ts + slice -> view ไม่ copy (1 ปีของ 1m ~ ms)
+# ต่อท้าย: เขียน column -> fsync -> meta (atomic) ; ตายกลางทาง -> ส่วนเกินถูกตัดทิ้งตอนเปิดครั้งถัดไป
+# แทรกกลาง (เติม gap / ต่อหัว): เขียน generation ใหม่ทั้งชุดแล้วสลับ meta ทีเดียว
+#
+# Downloader: ไล่หน้า fetch_ohlcv(since=, limit=) ต่อจากแท่งล่าสุดที่มี (resume ได้ทุกหน้า) ภายใต้ budget
+# ของ request weight, 429/418 -> หยุดตาม Retry-After, network error -> retry แบบ backoff
+#
+# ใช้: python archive.py download BTC/USDT:USDT 1m 5m 30m 1h --since 2023-01-01 [--until 2024-01-01]
+#      python archive.py verify BTC/USDT:USDT 1m [--fill]
+#      python archive.py info
+#      python archive.py export BTC/USDT:USDT 30m candles_30m.csv --since 2024-01-01   (ให้ backtest/sweep)
+
+import os, re, sys, json, time, logging, argparse
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+import ccxt
+
+from candles import Timeframe, TS
+from metrics import kline_weight, header
+
+ROOT = "history"
+COLUMNS = (("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<f8"))
+PAGE_LIMIT = 1000            # weight 5 ต่อ 1000 แท่ง (1500 แท่ง = weight 10)
+WEIGHT_BUDGET = 1200         # weight/นาทีที่ downloader ใช้ได้ (ครึ่งของ 2400: เหลือให้บอทที่รันอยู่)
+WEIGHT_WINDOW = 60.0
+RETRIES = 6
+ERROR_SEC = 2.0
+BAN_PAUSE_SEC = 60           # 429/418 ที่ไม่มี Retry-After
+FILL_MERGE_ROWS = 1_000_000  # fill_gaps เก็บแถวที่ดึงได้ใน memory ได้ถึงเท่านี้ก่อน merge (48 bytes/แถว)
+
+log = logging.getLogger("archive")
+
+def _dir_name(symbol):
+    return re.sub(r"[^A-Za-z0-9]+", "_", symbol).strip("_")
+
+def _fsync_append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def parse_time(s):
+    """'2024-01-01', '2024-01-01T12:00' (UTC) หรือ ms -> ms; None -> None"""
+    if s is None or isinstance(s, (int, np.integer)):
+        return s
+    if str(s).isdigit():
+        return int(s)
+    d = datetime.fromisoformat(str(s))
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return int(d.timestamp() * 1000)
+
+# ============================================================
+# Storage
+# ============================================================
+class Series:
+    """แท่งของ (symbol, timeframe) เดียวบนดิสก์ เรียงตาม ts ไม่ซ้ำ
+
+    columns(start, end) / column(name, ...)  view ของ memmap (ไม่ copy); start <= ts < end (ms)
+    frame(start, end)                        pandas DataFrame (index = ts) บน view เดียวกัน
+    ohlcv(start, end)                        (n, 6) float64 แบบที่ candles/backtest ใช้ (copy)
+    append(rows) / merge(rows)               ต่อท้าย / แทรกทุกตำแหน่ง (แถวใหม่ทับ ts ซ้ำ)
+    gaps(start, end)                         ช่วง [from, to) ที่ขาดและไม่ใช่ hole ที่รู้แล้ว
+    """
+
+    def __init__(self, path, symbol, timeframe):
+        self.path = path
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf = Timeframe(timeframe)
+        self._maps = None
+        os.makedirs(path, exist_ok=True)
+        self._load_meta()
+
+    # ---------------- meta / files ----------------
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _file(self, col, gen=None):
+        return os.path.join(self.path, f"{col}.{self.gen if gen is None else gen}.bin")
+
+    def _load_meta(self):
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {}
+        self.rows = int(meta.get("rows", 0))
+        self.gen = int(meta.get("gen", 0))
+        self.holes = [tuple(h) for h in meta.get("holes", [])]
+        # ส่วนที่เขียนไปแล้วแต่ meta ยังไม่ได้นับ (process ตายกลาง append) -> ตัดทิ้ง
+        for col, dt in COLUMNS:
+            p = self._file(col)
+            size = self.rows * np.dtype(dt).itemsize
+            if not os.path.exists(p):
+                open(p, "wb").close()
+            if os.path.getsize(p) > size:
+                with open(p, "r+b") as f:
+                    f.truncate(size)
+            elif os.path.getsize(p) < size:
+                raise IOError(f"{p}: shorter than meta rows={self.rows}")
+
+    def _save_meta(self):
+        _write_json(self._meta_path(), {"symbol": self.symbol, "timeframe": self.timeframe, "rows": self.rows,
+                                        "gen": self.gen, "columns": [c for c, _ in COLUMNS],
+                                        "holes": [list(h) for h in self.holes], "updated": int(time.time())})
+
+    def _mapped(self):
+        if self._maps is None:
+            self._maps = {col: (np.memmap(self._file(col), dt, "r", shape=(self.rows,)) if self.rows
+                                else np.zeros(0, dt)) for col, dt in COLUMNS}
+        return self._maps
+
+    # ---------------- query ----------------
+    def __len__(self):
+        return self.rows
+
+    @property
+    def first_ts(self):
+        return int(self._mapped()["ts"][0]) if self.rows else None
+
+    @property
+    def last_ts(self):
+        return int(self._mapped()["ts"][-1]) if self.rows else None
+
+    def span(self, start=None, end=None):
+        """(i, j) ของแถวที่ start <= ts < end"""
+        ts = self._mapped()["ts"]
+        i = 0 if start is None else int(np.searchsorted(ts, parse_time(start), "left"))
+        j = self.rows if end is None else int(np.searchsorted(ts, parse_time(end), "left"))
+        return i, max(i, j)
+
+    def column(self, name, start=None, end=None):
+        i, j = self.span(start, end)
+        return self._mapped()[name][i:j]
+
+    def columns(self, start=None, end=None):
+        i, j = self.span(start, end)
+        return {col: m[i:j] for col, m in self._mapped().items()}
+
+    def frame(self, start=None, end=None):
+        import pandas as pd
+        cols = self.columns(start, end)
+        ts = cols.pop("ts")
+        return pd.DataFrame(cols, index=pd.Index(ts, name="ts", copy=False), copy=False)
+
+    def ohlcv(self, start=None, end=None):
+        cols = self.columns(start, end)
+        out = np.empty((len(cols["ts"]), len(COLUMNS)))
+        for k, (col, _) in enumerate(COLUMNS):
+            out[:, k] = cols[col]
+        return out
+
+    # ---------------- write ----------------
+    def _clean(self, rows):
+        a = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+        a = a[np.argsort(a[:, TS], kind="stable")]
+        keep = np.r_[a[1:, TS] != a[:-1, TS], True]      # ts ซ้ำ -> แถวหลังสุดชนะ
+        return a[keep]
+
+    def append(self, rows):
+        """ต่อท้ายแถวที่ ts > last_ts (ที่เหลือทิ้ง) -> จำนวนแถวที่เพิ่ม"""
+        a = self._clean(rows)
+        if self.rows:
+            a = a[a[:, TS] > self.last_ts]
+        if not len(a):
+            return 0
+        for k, (col, dt) in enumerate(COLUMNS):
+            _fsync_append(self._file(col), a[:, k].astype(dt).tobytes())
+        self.rows += len(a)
+        self._maps = None
+        self._save_meta()
+        return len(a)
+
+    def merge(self, rows):
+        """แทรกแถวตรงไหนก็ได้: เขียน generation ใหม่ทั้งชุดแล้วสลับ meta -> จำนวนแถวที่เพิ่ม"""
+        new = self._clean(rows)
+        if not len(new):
+            return 0
+        if not self.rows or new[0, TS] > self.last_ts:
+            return self.append(new)
+        a = self._clean(np.vstack([self.ohlcv(), new]))
+        old_gen, old_rows = self.gen, self.rows
+        for k, (col, dt) in enumerate(COLUMNS):
+            p = self._file(col, old_gen + 1)
+            with open(p, "wb") as f:
+                f.write(a[:, k].astype(dt).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self._maps = None
+        self.gen, self.rows = old_gen + 1, len(a)
+        self._save_meta()
+        for col, _ in COLUMNS:
+            try:
+                os.remove(self._file(col, old_gen))
+            except OSError:
+                pass
+        return self.rows - old_rows
+
+    def add_hole(self, start, end):
+        """ช่วง [start, end) ที่ exchange ไม่มีแท่ง (เช่นช่วงปิดปรับปรุง) -> gaps() ไม่นับ / ไม่ดึงซ้ำ"""
+        if end <= start:
+            return
+        holes = sorted(self.holes + [(int(start), int(end))])
+        out = [holes[0]]
+        for a, b in holes[1:]:
+            if a <= out[-1][1]:
+                out[-1] = (out[-1][0], max(out[-1][1], b))
+            else:
+                out.append((a, b))
+        self.holes = out
+        self._save_meta()
+
+    # ---------------- verify ----------------
+    def _next_open(self, ts):
+        if self.tf.unit == "M":
+            return np.array([self.tf.close_time(t) for t in ts], dtype=np.int64)
+        return ts + self.tf.ms
+
+    def gaps(self, start=None, end=None):
+        """ช่วง [from, to) ระหว่างแท่งที่เก็บไว้ที่ขาดไป (หัก holes แล้ว)"""
+        ts = np.asarray(self.column("ts", start, end))
+        if len(ts) < 2:
+            return []
+        nxt = self._next_open(ts[:-1])
+        idx = np.nonzero(ts[1:] != nxt)[0]
+        out = []
+        for i in idx:
+            a, b = int(nxt[i]), int(ts[i + 1])
+            for ha, hb in self.holes:
+                if ha <= a < hb:
+                    a = hb
+                if ha < b <= hb:
+                    b = ha
+            if a < b:
+                out.append((a, b))
+        return out
+
+    def verify(self):
+        """ตรวจความถูกต้องของทั้งชุด -> dict (ok = เรียงเพิ่มขึ้นจริง, ตรงขอบแท่ง, OHLC สอดคล้องกัน)"""
+        c = self._mapped()
+        ts = np.asarray(c["ts"])
+        unsorted = int(np.count_nonzero(np.diff(ts) <= 0)) if len(ts) > 1 else 0
+        unaligned = int(np.count_nonzero(self.tf.open_times(ts) != ts)) if len(ts) else 0
+        bad = int(np.count_nonzero((c["high"] < np.maximum(c["open"], c["close"])) |
+                                   (c["low"] > np.minimum(c["open"], c["close"])) | (c["volume"] < 0)))
+        gaps = self.gaps()
+        return {"symbol": self.symbol, "timeframe": self.timeframe, "rows": self.rows,
+                "first": self.first_ts, "last": self.last_ts, "gaps": gaps,
+                "missing": int(sum((b - a) // self.tf.ms for a, b in gaps)), "holes": list(self.holes),
+                "unsorted": unsorted, "unaligned": unaligned, "bad_ohlc": bad,
+                "ok": not (unsorted or unaligned or bad)}
+
+class Archive:
+    """ชุดของ Series ใต้ root เดียว"""
+
+    def __init__(self, root=ROOT):
+        self.root = root
+        self._series = {}
+
+    def series(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        s = self._series.get(key)
+        if s is None:
+            s = self._series[key] = Series(os.path.join(self.root, _dir_name(symbol), timeframe), symbol, timeframe)
+        return s
+
+    def list(self):
+        """[(symbol, timeframe)] ที่มีอยู่บนดิสก์"""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for d in sorted(os.listdir(self.root)):
+            for tf in sorted(os.listdir(os.path.join(self.root, d))):
+                p = os.path.join(self.root, d, tf, "meta.json")
+                if os.path.exists(p):
+                    with open(p, encoding="utf-8") as f:
+                        meta = json.load(f)
+                    out.append((meta["symbol"], meta["timeframe"]))
+        return out
+
+# ============================================================
+# Download
+# ============================================================
+class Throttle:
+    """Sliding window ของ request weight แบบ sync (WeightBudget ของ runner.py แบบไม่มี priority)"""
+
+    def __init__(self, limit=WEIGHT_BUDGET, window=WEIGHT_WINDOW, clock=time.monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self.used = 0
+        self.waited = 0.0
+        self._spent = deque()        # (t, weight)
+        self._paused_until = 0.0
+
+    def _trim(self, now):
+        while self._spent and self._spent[0][0] <= now - self.window:
+            self.used -= self._spent.popleft()[1]
+
+    def acquire(self, weight):
+        while True:
+            now = self.clock()
+            self._trim(now)
+            if now < self._paused_until:
+                wait = self._paused_until - now
+            elif self.used + weight > self.limit and self._spent:
+                wait = self._spent[0][0] + self.window - now
+            else:
+                self._spent.append((now, weight))
+                self.used += weight
+                return
+            self.waited += wait
+            self.sleep(max(wait, 0.01))
+
+    def observe(self, server_used):
+        """X-MBX-USED-WEIGHT-1M ที่ server นับ (รวม process อื่นบน IP เดียวกัน) มากกว่าที่นับเอง -> ตามนั้น"""
+        if server_used > self.used:
+            extra = server_used - self.used
+            self._spent.append((self.clock(), extra))
+            self.used += extra
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+class Downloader:
+    """ดึงแท่งย้อนหลังเป็นหน้าๆ ลง Archive (ex = client แบบ ccxt เช่น main.setup_exchange())"""
+
+    def __init__(self, ex, archive, limit=PAGE_LIMIT, budget=WEIGHT_BUDGET, retries=RETRIES,
+                 clock=time.time, sleep=time.sleep, throttle=None):
+        self.ex = ex
+        self.archive = archive
+        self.limit = limit
+        self.retries = retries
+        self.clock = clock
+        self.sleep = sleep
+        self.throttle = throttle or Throttle(budget, sleep=sleep)
+        self.requests = 0
+
+    def _fetch(self, symbol, timeframe, since):
+        err = None
+        for attempt in range(self.retries + 1):
+            self.throttle.acquire(kline_weight(self.limit))
+            try:
+                self.requests += 1
+                page = self.ex.fetch_ohlcv(symbol, timeframe, since=since, limit=self.limit)
+            except (ccxt.DDoSProtection, ccxt.RateLimitExceeded) as e:
+                retry = header(getattr(self.ex, "last_response_headers", None), "Retry-After")
+                self.throttle.pause(float(retry) if retry else BAN_PAUSE_SEC)
+                log.warning(f"rate limited on {symbol} {timeframe}, pausing: {e}")
+                err = e
+                continue
+            except ccxt.NetworkError as e:
+                err = e
+                if attempt < self.retries:
+                    wait = min(ERROR_SEC * 2 ** attempt, 60.0)
+                    log.warning(f"fetch {symbol} {timeframe} since={since} failed ({e}), retry in {wait:.0f}s")
+                    self.sleep(wait)
+                continue
+            used = header(getattr(self.ex, "last_response_headers", None), "X-MBX-USED-WEIGHT-1M")
+            if used:
+                self.throttle.observe(int(used))
+            return page
+        raise err
+
+    def _closed_end(self, tf, until):
+        """ขอบบนของช่วง (ไม่รวม): แท่งที่ยังไม่ปิดไม่ถูกเก็บ"""
+        end = tf.open_time(int(self.clock() * 1000))
+        return end if until is None else min(end, parse_time(until))
+
+    def pages(self, series, start, end):
+        """ไล่หน้าแท่งใน [start, end) -> yield array (n, 6) ต่อหน้า; ช่วงที่ exchange ข้ามไปบันทึกเป็น hole"""
+        tf = series.tf
+        cursor = tf.open_time(start) if tf.open_time(start) == start else tf.close_time(start)
+        while cursor < end:
+            page = self._fetch(series.symbol, series.timeframe, cursor)
+            a = np.asarray(page, dtype=np.float64).reshape(-1, len(COLUMNS))
+            a = a[(a[:, TS] >= cursor) & (a[:, TS] < end)] if len(a) else a
+            if not len(a):
+                return
+            first = int(a[0, TS])
+            if first > cursor:
+                series.add_hole(cursor, first)
+            yield a
+            nxt = int(series._next_open(np.array([int(a[-1, TS])]))[0])
+            if nxt <= cursor:
+                return
+            cursor = nxt
+
+    def download(self, symbol, timeframe, since, until=None, progress=None):
+        """ให้ archive มีแท่งปิดทั้งหมดใน [since, until) -> จำนวนแถวที่เพิ่ม
+
+        ต่อท้ายทีละหน้าจากแท่งล่าสุดที่มี (หยุด/ตายแล้วเรียกใหม่ = ทำต่อจากเดิม);
+        ช่วงก่อนแท่งแรกที่มีดึงรวดเดียวแล้ว merge ครั้งเดียว"""
+        s = self.archive.series(symbol, timeframe)
+        since = parse_time(since)
+        end = self._closed_end(s.tf, until)
+        added = 0
+        if s.rows and since < s.first_ts and not any(a <= since and s.first_ts <= b for a, b in s.holes):
+            head = list(self.pages(s, since, s.first_ts))
+            if head:
+                added += s.merge(np.vstack(head))
+        start = since if not s.rows else max(since, int(s._next_open(np.array([s.last_ts]))[0]))
+        for a in self.pages(s, start, end):
+            added += s.append(a)
+            if progress:
+                progress(s, added)
+        return added
+
+    def fill_gaps(self, symbol, timeframe, start=None, end=None):
+        """ดึงช่วงที่ขาดระหว่างแท่งที่มีอยู่ใหม่; ที่ exchange ไม่มีจริงบันทึกเป็น hole -> จำนวนแถวที่เพิ่ม"""
+        s = self.archive.series(symbol, timeframe)
+        todo = s.gaps(start, end)
+        added, got, n = 0, [], 0
+        for a, b in todo:
+            for page in self.pages(s, a, b):
+                got.append(page)
+                n += len(page)
+            if n >= FILL_MERGE_ROWS:             # merge = เขียนทั้ง series ใหม่: รวบหลาย gap ต่อครั้ง
+                added += s.merge(np.vstack(got))
+                got, n = [], 0
+        if got:
+            added += s.merge(np.vstack(got))
+        for ga, gb in s.gaps(start, end):
+            if any(a <= ga and gb <= b for a, b in todo):
+                s.add_hole(ga, gb)
+        return added
+
+# ============================================================
+# CLI
+# ============================================================
+def _fmt(ms):
+    return "-" if ms is None else datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="historical OHLCV archive")
+    ap.add_argument("--root", default=ROOT)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    d = sub.add_parser("download")
+    d.add_argument("symbol")
+    d.add_argument("timeframes", nargs="+")
+    d.add_argument("--since", required=True)
+    d.add_argument("--until")
+    d.add_argument("--budget", type=int, default=WEIGHT_BUDGET, help="request weight ต่อนาที")
+    d.add_argument("--no-fill", action="store_true", help="ไม่เติม gap หลังดาวน์โหลด")
+    v = sub.add_parser("verify")
+    v.add_argument("symbol")
+    v.add_argument("timeframes", nargs="+")
+    v.add_argument("--fill", action="store_true")
+    sub.add_parser("info")
+    e = sub.add_parser("export")
+    e.add_argument("symbol")
+    e.add_argument("timeframe")
+    e.add_argument("out")
+    e.add_argument("--since")
+    e.add_argument("--until")
+    a = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    arc = Archive(a.root)
+
+    if a.cmd == "info":
+        for sym, tf in arc.list():
+            s = arc.series(sym, tf)
+            print(f"{sym:16s} {tf:4s} {len(s):>10,} rows  {_fmt(s.first_ts)} .. {_fmt(s.last_ts)}  holes={len(s.holes)}")
+        return 0
+    if a.cmd == "export":
+        arc.series(a.symbol, a.timeframe).frame(a.since, a.until).to_csv(a.out, header=False)
+        return 0
+
+    dl = None
+    if a.cmd == "download" or a.fill:
+        import main as live
+        dl = Downloader(live.setup_exchange(), arc, budget=getattr(a, "budget", WEIGHT_BUDGET))
+    def progress(s, added):
+        if added % (50 * dl.limit) < dl.limit:
+            log.info(f"{s.symbol} {s.timeframe}: +{added:,} .. {_fmt(s.last_ts)}")
+
+    rc = 0
+    for tf in a.timeframes:
+        if a.cmd == "download":
+            t0 = time.time()
+            n = dl.download(a.symbol, tf, a.since, a.until, progress)
+            if not a.no_fill:
+                n += dl.fill_gaps(a.symbol, tf)
+            log.info(f"{a.symbol} {tf}: +{n:,} rows in {time.time() - t0:.0f}s ({dl.requests} requests)")
+        elif a.fill:
+            log.info(f"{a.symbol} {tf}: filled +{dl.fill_gaps(a.symbol, tf):,} rows")
+        r = arc.series(a.symbol, tf).verify()
+        print(f"{a.symbol} {tf}: rows={r['rows']:,} {_fmt(r['first'])} .. {_fmt(r['last'])} gaps={len(r['gaps'])} "
+              f"missing={r['missing']:,} holes={len(r['holes'])} unsorted={r['unsorted']} "
+              f"unaligned={r['unaligned']} bad_ohlc={r['bad_ohlc']}")
+        rc |= 0 if r["ok"] else 1
+    return rc
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# backtest.py
+# Offline backtest ของ NWStrategy (logic เดียวกับ main.py) บน OHLCV ย้อนหลัง
+# indicator ทั้งหมดคำนวณล่วงหน้าแบบ vectorized แล้ว replay ทีละแท่ง ผ่าน SimExchange
+#
+# ใช้: python backtest.py candles_30m.csv [candles_5m.csv]
+#      (csv: ts,open,high,low,close,volume  ts = ms)
+
+import sys, math, logging
+import numpy as np
+
+from candles import timeframe_ms
+from nwe import get_engine
+from indicators import EMAState, MACDState
+from strategy_nw import NWStrategy
+from orders import ProtectiveOrders, STOP, TAKE
+
+log = logging.getLogger("backtest")
+# log ของ NWStrategy ระหว่าง replay (SL lock / position reset ทุก trade) ปิด INFO ไว้ไม่ให้ถ่วง replay / sweep
+# เปิดดูได้ด้วย logging.getLogger("backtest.strategy").setLevel(logging.INFO) หรือส่ง log= ให้ replay
+strategy_log = logging.getLogger("backtest.strategy")
+strategy_log.setLevel(logging.WARNING)
+
+class SimExchange:
+    """Exchange จำลอง 1 symbol สำหรับ NWStrategy (ใช้เป็น broker ได้ตรงๆ)
+
+    market order fill ที่ self.price, reduceOnly ลดได้อย่างเดียว (เกินขนาด position จะถูกตัด),
+    fee คิดจาก notional ทุก fill, order_size ใช้ free balance * margin fraction * leverage
+    STOP_MARKET / TAKE_PROFIT_MARKET ผ่าน create_order แบบ ccxt; trigger ด้วย trigger(open, high, low)
+    ต่อแท่ง หรือ tick(price) ต่อราคา
+    """
+
+    def __init__(self, balance=1000.0, fee=0.0004, leverage=10, margin_fraction=0.7, qty_step=0.001):
+        self.balance = float(balance)      # wallet balance (realized PnL - fee)
+        self.fee = fee
+        self.leverage = leverage
+        self.margin_fraction = margin_fraction
+        self.qty_step = qty_step
+        self.price = None
+        self.amount = 0.0                  # + long / - short
+        self.entry = 0.0
+        self.fees = 0.0
+        self.fills = []
+        self.macd_now = {}                 # timeframe -> snapshot ณ แท่งปัจจุบัน (engine เป็นคนตั้ง)
+        self.orders = {}                   # id -> order แบบ ccxt (เฉพาะ conditional)
+        self._next_id = 0
+        self.protective = ProtectiveOrders(self, "SIM", log)
+
+    # ---------------- broker interface ----------------
+    def last_price(self):
+        return self.price
+
+    def macd(self, timeframe):
+        return self.macd_now.get(timeframe)
+
+    def free(self):
+        return self.balance - abs(self.amount) * self.entry / self.leverage
+
+    def order_size(self, price):
+        notional = max(0.0, self.free()) * self.margin_fraction * self.leverage
+        qty = notional / price if price > 0 else 0.0
+        return round(math.floor(qty / self.qty_step + 1e-9) * self.qty_step, 10)
+
+    def market_order(self, side, qty, reduce_only=False):
+        if qty <= 0:
+            return None
+        px = self.price
+        delta = qty if side == "buy" else -qty
+        if reduce_only:
+            if self.amount == 0 or (self.amount > 0) == (delta > 0):
+                return None
+            delta = max(-abs(self.amount), min(abs(self.amount), delta))
+        amt = self.amount
+        if amt == 0 or (amt > 0) == (delta > 0):
+            new = amt + delta
+            self.entry = (self.entry * abs(amt) + px * abs(delta)) / abs(new)
+        else:
+            closed = min(abs(delta), abs(amt))
+            self.balance += (px - self.entry) * closed * (1 if amt > 0 else -1)
+            new = amt + delta
+            if abs(new) < 1e-12:
+                new = 0.0; self.entry = 0.0
+            elif (new > 0) != (amt > 0):
+                self.entry = px           # กลับฝั่ง: ส่วนที่เหลือเปิดใหม่ที่ราคานี้
+        self.amount = new
+        fee = abs(delta) * px * self.fee
+        self.balance -= fee
+        self.fees += fee
+        fill = {"side": side, "qty": abs(delta), "price": px, "fee": fee, "reduceOnly": reduce_only}
+        self.fills.append(fill)
+        return fill
+
+    # ---------------- ccxt-style orders ----------------
+    @staticmethod
+    def _down(o):
+        """STOP ฝั่ง sell / TAKE ฝั่ง buy ทำงานเมื่อราคาลงถึง stop; กลับกันเมื่อราคาขึ้นถึง"""
+        return (o["type"] == STOP) == (o["side"] == "sell")
+
+    def _triggered(self, o, px):
+        return px <= o["stopPrice"] if self._down(o) else px >= o["stopPrice"]
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        reduce_only = bool(params.get("reduceOnly"))
+        self._next_id += 1
+        oid = str(self._next_id)
+        if type.upper() == "MARKET":
+            fill = self.market_order(side, amount, reduce_only)
+            return {"id": oid, "status": "closed", "filled": fill["qty"] if fill else 0.0,
+                    "average": fill["price"] if fill else None, "fee": {"cost": fill["fee"] if fill else 0.0}}
+        o = {"id": oid, "type": type.upper(), "side": side, "amount": amount, "stopPrice": float(params["stopPrice"]),
+             "reduceOnly": reduce_only, "status": "open", "filled": 0.0, "average": None, "fee": {"cost": 0.0}}
+        if o["type"] not in (STOP, TAKE):
+            raise ValueError(f"SimExchange: unsupported order type {type}")
+        if self.price is not None and self._triggered(o, self.price):
+            raise ValueError("SimExchange: order would immediately trigger")    # Binance -2021
+        self.orders[oid] = o
+        return dict(o)
+
+    def cancel_order(self, id, symbol=None):
+        o = self.orders.get(str(id))
+        if o is None or o["status"] != "open":
+            raise ValueError(f"SimExchange: unknown order {id}")
+        o["status"] = "canceled"
+        return dict(o)
+
+    def fetch_order(self, id, symbol=None):
+        return dict(self.orders[str(id)])
+
+    def fetch_open_orders(self, symbol=None):
+        return [dict(o) for o in self.orders.values() if o["status"] == "open"]
+
+    def trigger(self, open_, high, low):
+        """ราคาวิ่งผ่าน [low, high] ของแท่ง: stop ที่แตะ fill ที่ราคา stop (หรือ open ถ้าเปิด gap เลยไปแล้ว)
+        แท่งเดียวโดนทั้ง SL และ TP ถือว่า SL ก่อน; order reduceOnly ที่ position หมดแล้ว -> expired"""
+        live = [o for o in self.orders.values() if o["status"] == "open"]
+        if not live:
+            return []
+        live.sort(key=lambda o: o["type"] != STOP)
+        done, saved = [], self.price
+        for o in live:
+            if self._triggered(o, open_):
+                px = open_
+            elif self._triggered(o, low if self._down(o) else high):
+                px = o["stopPrice"]
+            else:
+                continue
+            self.price = px
+            fill = self.market_order(o["side"], o["amount"], o["reduceOnly"])
+            if fill:
+                o.update(status="closed", filled=fill["qty"], average=fill["price"], fee={"cost": fill["fee"]})
+            else:
+                o["status"] = "expired"
+            done.append(dict(o))
+        self.price = saved
+        return done
+
+    def tick(self, price):
+        """ราคาใหม่ 1 จุด (ไม่มีช่วงในแท่ง)"""
+        self.trigger(price, price, price)
+        self.price = price
+
+# ============================================================
+# Precompute
+# ============================================================
+def macd_at(ohlcv, timeframe, at_ms, fast=12, slow=26, signal=9):
+    """MACD snapshot ของแท่งปิดล่าสุดบน timeframe ณ เวลา at_ms แต่ละจุด (None ถ้ายังไม่พร้อม)"""
+    arr = np.asarray(ohlcv, dtype=np.float64)
+    close_ms = arr[:, 0] + timeframe_ms(timeframe)
+    st = MACDState(fast, slow, signal)
+    snaps = []
+    for c in arr[:, 4].tolist():
+        st.update(c)
+        snaps.append(st.snapshot())
+    idx = np.searchsorted(close_ms, at_ms, side="right") - 1
+    return [snaps[j] if j >= 0 else None for j in idx.tolist()]
+
+def ema_at(closes, period):
+    """EMA ณ ปิดแต่ละแท่ง (เท่ากับ ema(closes[:i+1]))"""
+    st = EMAState(period)
+    return [st.update(c) for c in closes.tolist()]
+
+# ============================================================
+# Engine
+# ============================================================
+def indicator_series(ohlcv, cfg, timeframe="30m", tf_data=None, cache=None):
+    """Series ทั้งหมดที่ NWStrategy ต้องใช้ (เป็น list เพื่อให้ replay index ได้เร็ว)
+
+    cache = dict ที่ใช้ซ้ำข้ามหลายชุดพารามิเตอร์ของ ohlcv ชุดเดียวกัน
+    key ตามพารามิเตอร์ที่ series นั้นขึ้นอยู่ เช่น ("nw", h, mult, factor, repaint), ("ema", period)
+    """
+    arr = np.asarray(ohlcv, dtype=np.float64)
+
+    def cached(key, fn):
+        if cache is None:
+            return fn()
+        v = cache.get(key)
+        if v is None:
+            v = cache[key] = fn()
+        return v
+
+    def base():
+        closes = np.ascontiguousarray(arr[:, 4])
+        at_ms = arr[:, 0] + timeframe_ms(timeframe)
+        return closes, at_ms, (at_ms / 1000.0).tolist(), closes.tolist(), tuple(arr[:, k].tolist() for k in (1, 2, 3))
+
+    def nw():
+        engine = get_engine(cfg["NW_BANDWIDTH"], cfg["NW_MULT"], cfg["NW_FACTOR"])
+        bands = engine.envelope_series(closes) if cfg["USE_REPAINT"] else engine.endpoint_series(closes)
+        return tuple(b.tolist() for b in bands)
+
+    def macd(tf):
+        if tf_data and tf in tf_data:
+            return macd_at(tf_data[tf], tf, at_ms)
+        return macd_at(arr, timeframe, at_ms)
+
+    closes, at_ms, t, c, ohl = cached(("base", timeframe), base)
+    U, L, M = cached(("nw", cfg["NW_BANDWIDTH"], cfg["NW_MULT"], cfg["NW_FACTOR"], cfg["USE_REPAINT"]), nw)
+    if cfg["EMA_ENABLED"]:
+        ef = cached(("ema", cfg["EMA_FAST"]), lambda: ema_at(closes, cfg["EMA_FAST"]))
+        es = cached(("ema", cfg["EMA_SLOW"]), lambda: ema_at(closes, cfg["EMA_SLOW"]))
+    else:
+        ef = es = None
+    macd_tfs = set()
+    if cfg["MACD_ENABLED"]:
+        macd_tfs.add(cfg["MACD_TF"])
+    if cfg["USE_BREAKEVEN_MACD"]:
+        macd_tfs.add(cfg["BREAKEVEN_MACD_TF"])
+    macd_series = [(tf, cached(("macd", tf), lambda: macd(tf))) for tf in sorted(macd_tfs)]
+    return {"t": t, "c": c, "ohl": ohl, "U": U, "L": L, "M": M, "ef": ef, "es": es, "macd": macd_series}
+
+def replay(series, cfg, start=0, end=None, balance=1000.0, fee=0.0004, qty_step=0.001, log=None):
+    """Replay แท่ง [start, end) ของ series ผ่าน NWStrategy(cfg)
+
+    strategy.step() ถูกเรียกครั้งเดียวต่อแท่ง ณ เวลาปิดแท่ง ด้วยราคาปิด (last_close = last_price)
+    NATIVE_STOPS: SL/TP ที่วางบน SimExchange trigger ระหว่างแท่งจาก open/high/low ก่อน step ของแท่งนั้น
+    log = logger ของ strategy (default strategy_log: เฉพาะ WARNING ขึ้นไป)
+    คืน dict: trades (รูปแบบเดียวกับ stats["trades"]), pnl, balance, fees, fills, bars, open_position
+    """
+    t, c, U, L, M = series["t"], series["c"], series["U"], series["L"], series["M"]
+    ef, es, macd_series = series["ef"], series["es"], series["macd"]
+    O, H, Lo = series["ohl"]
+    end = len(c) if end is None else end
+
+    sim = SimExchange(balance, fee, cfg["LEVERAGE"], cfg["POSITION_MARGIN_FRACTION"], qty_step)
+    strategy = NWStrategy(cfg, sim, log=log or strategy_log)
+    step = strategy.step
+    ema_enabled = cfg["EMA_ENABLED"]
+    native = strategy.orders is not None
+
+    for i in range(start, end):
+        u = U[i]
+        if u != u:                         # NaN = NW ยังไม่พร้อม
+            continue
+        if ema_enabled:
+            e_fast, e_slow = ef[i], es[i]
+            if e_fast is None or e_slow is None:
+                continue
+        else:
+            e_fast = e_slow = None
+        if native and sim.amount:
+            sim.trigger(O[i], H[i], Lo[i])
+        sim.price = c[i]
+        for tf, snaps in macd_series:
+            sim.macd_now[tf] = snaps[i]
+        amt = sim.amount
+        step(t[i], c[i], u, L[i], M[i], amt if amt >= 0 else -amt, e_fast, e_slow)
+
+    return {
+        "trades": strategy.stats["trades"],
+        "pnl": strategy.stats["pnl"],
+        "balance": sim.balance,
+        "fees": sim.fees,
+        "fills": sim.fills,
+        "bars": end - start,
+        "open_position": strategy.position,
+    }
+
+def run_backtest(ohlcv, cfg, timeframe="30m", tf_data=None, balance=1000.0, fee=0.0004, qty_step=0.001, log=None):
+    """Backtest ทั้งชุด ohlcv (n, 6); tf_data = {timeframe: ohlcv} สำหรับ MACD_TF / BREAKEVEN_MACD_TF
+    (ถ้าไม่ให้มาจะคำนวณ MACD จาก ohlcv หลักแทน)"""
+    return replay(indicator_series(ohlcv, cfg, timeframe, tf_data), cfg, balance=balance, fee=fee, qty_step=qty_step, log=log)
+
+def summarize(res, balance=1000.0):
+    """ตัวเลขสรุปของผล replay สำหรับจัดอันดับ"""
+    pnls = [tr["pnl"] for tr in res["trades"]]
+    gross_win = sum(p for p in pnls if p > 0)
+    gross_loss = -sum(p for p in pnls if p < 0)
+    eq = peak = max_dd = 0.0
+    for p in pnls:
+        eq += p
+        peak = max(peak, eq)
+        max_dd = max(max_dd, peak - eq)
+    return {
+        "trades": len(pnls),
+        "pnl": res["pnl"],
+        "net": res["balance"] - balance,
+        "fees": res["fees"],
+        "win_rate": sum(1 for p in pnls if p > 0) / len(pnls) if pnls else 0.0,
+        "profit_factor": gross_win / gross_loss if gross_loss else (math.inf if gross_win else 0.0),
+        "max_dd": max_dd,
+    }
+
+def load_csv(path):
+    import pandas as pd
+    df = pd.read_csv(path, header=None, comment="#")
+    if not np.issubdtype(df.dtypes.iloc[0], np.number):
+        df = pd.read_csv(path)
+    return df.iloc[:, :6].to_numpy(dtype=np.float64)
+
+if __name__ == "__main__":
+    import time
+    import main as live
+    from strategy_nw import config_from
+
+    cfg = config_from(vars(live))
+    ohlcv = load_csv(sys.argv[1])
+    tf_data = {live.MACD_TF: load_csv(sys.argv[2]), live.BREAKEVEN_MACD_TF: load_csv(sys.argv[2])} if len(sys.argv) > 2 else None
+    t0 = time.perf_counter()
+    res = run_backtest(ohlcv, cfg, live.TIMEFRAME, tf_data)
+    dt = time.perf_counter() - t0
+    reasons = {}
+    for tr in res["trades"]:
+        reasons[tr["reason"]] = reasons.get(tr["reason"], 0) + 1
+    s = summarize(res)
+    print(f"bars={res['bars']} ({res['bars']/dt:,.0f} bars/s)  trades={s['trades']} {reasons}")
+    print(f"PnL={s['pnl']:+.2f}  fees={s['fees']:.2f}  net={s['net']:+.2f}  win={s['win_rate']:.1%}  "
+          f"PF={s['profit_factor']:.2f}  maxDD={s['max_dd']:.2f}")
@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+# bench.py
+# Benchmark + performance regression ของ indicator และ decision loop ของทั้งสองบอท
+#
+#   - OHLCV สังเคราะห์แบบ BTC (seed ได้): volatility เป็นช่วงๆ + หางหนา, volume ตามขนาดการเคลื่อนไหว
+#   - จับเวลาฟังก์ชัน indicator ของ main.py / main.py1 หลายขนาดประวัติ
+#   - จับเวลา 1 รอบของ main() แต่ละบอทกับ exchange ปลอมใน process (ไม่มี network)
+#   - cross-check ผลกับ implementation ดั้งเดิม (pure Python) ก่อนจับเวลา: เขียนใหม่ให้เร็วขึ้นได้อย่างปลอดภัย
+#   - จับเวลา implementation ดั้งเดิมคู่กัน: ตัวที่ช้ากว่าของเดิมเกิน threshold = fail แม้ยังไม่มี baseline
+#
+# ใช้: python bench.py                        เทียบกับ bench_baseline.json (ยังไม่มี -> บันทึกเป็น baseline)
+#      python bench.py --save                 บันทึกผลรอบนี้เป็น baseline ใหม่
+#      python bench.py --threshold 0.3 -k nwe --sizes 500,5000
+#      python bench.py --check                เฉพาะ cross-check
+# exit code 1 = cross-check ไม่ผ่าน หรือช้าลงเกิน threshold เทียบ baseline / ของเดิม
+
+import os, sys, json, math, time, types, timeit, logging, argparse, platform, tempfile, statistics
+import importlib.util, importlib.machinery
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import candles
+from candles import Timeframe, resample, TS, OPEN, HIGH, LOW, CLOSE, VOLUME
+from backtest import SimExchange
+from volume_profile import VolumeProfile
+
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+SIZES = (500, 2000, 10000)
+THRESHOLD = 0.25             # ช้าลงเกิน 25% เทียบ baseline = regression
+MIN_DELTA_US = 2.0           # ต่างกันน้อยกว่านี้ (us) ไม่นับ (noise ของ timer)
+BOT_TICKS = 40               # จำนวนรอบ main() ที่จับเวลาต่อบอท
+
+# ============================================================
+# Synthetic data
+# ============================================================
+def synthetic_ohlcv(n, timeframe="1m", seed=0, price=30000.0, end_ms=None, vol=0.0008):
+    """ohlcv (n, 6) แบบ BTC: log-return หางหนา (Student-t), volatility แบบ AR(1) บน log-vol (เป็นช่วงๆ)
+    vol = ส่วนเบี่ยงเบนต่อ 1 นาที (ขยายตาม sqrt ของความยาวแท่ง); แท่งสุดท้ายเปิดก่อน end_ms (default = ตอนนี้)"""
+    rng = np.random.default_rng(seed)
+    tf = Timeframe(timeframe)
+    sigma = vol * math.sqrt(tf.minutes)
+    shock = rng.standard_t(4, n) / math.sqrt(2.0)
+    eta = rng.normal(0.0, 0.15, n)
+    lv = np.empty(n)
+    x = 0.0
+    for i in range(n):
+        x = 0.97 * x + eta[i]
+        lv[i] = x
+    r = sigma * np.exp(lv) * shock
+    close = price * np.exp(np.cumsum(r))
+    open_ = np.r_[price, close[:-1]]
+    wick = sigma * np.exp(lv) * np.abs(rng.normal(0.0, 0.6, (2, n)))
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+    volume = rng.lognormal(0.0, 0.5, n) * tf.minutes * (1.0 + 40.0 * np.abs(r) / sigma)
+    end_ms = int(time.time() * 1000) if end_ms is None else int(end_ms)
+    last_open = tf.open_time(end_ms)
+    ts = last_open - tf.ms * np.arange(n - 1, -1, -1, dtype=np.int64)
+    return np.column_stack([ts.astype(np.float64), open_, high, low, close, volume])
+
+# ============================================================
+# Fake exchange (ccxt-like, in process)
+# ============================================================
+class FakeExchange:
+    """แท่งทุก TF ประกอบจาก base 1m ชุดเดียว (ตามขอบแท่ง Binance), order/position ผ่าน SimExchange"""
+
+    def __init__(self, base, symbol, sim):
+        self.base = base
+        self.symbol = symbol
+        self.sim = sim
+        self.calls = {}
+        self._tf = {"1m": base}
+        sim.price = float(base[-1, CLOSE])
+
+    def _c(self, k):
+        self.calls[k] = self.calls.get(k, 0) + 1
+
+    def _rows(self, timeframe):
+        a = self._tf.get(timeframe)
+        if a is None:
+            a = self._tf[timeframe] = resample(self.base, timeframe)
+        return a
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self._c("fetch_ohlcv")
+        a = self._rows(timeframe)
+        if since is not None:
+            a = a[a[:, TS] >= since][:limit]
+        elif limit:
+            a = a[-limit:]
+        return a.tolist()
+
+    def fetch_ticker(self, symbol):
+        self._c("fetch_ticker")
+        return {"last": self.sim.price}
+
+    def fetch_positions(self, symbols=None):
+        self._c("fetch_positions")
+        a = self.sim.amount
+        return [{"symbol": self.symbol, "contracts": abs(a), "side": "long" if a > 0 else "short",
+                 "entryPrice": self.sim.entry}] if a else []
+
+    def fetch_balance(self, params=None):
+        self._c("fetch_balance")
+        return {"USDT": {"free": self.sim.free()}}
+
+    def amount_to_precision(self, symbol, qty):
+        return str(math.floor(float(qty) / 0.001 + 1e-9) * 0.001)
+
+    def price_to_precision(self, symbol, px):
+        return str(round(float(px), 1))
+
+    def create_market_order(self, symbol, side, qty, price=None, params=None):
+        self._c("create_order")
+        return self.sim.market_order(side, float(qty), reduce_only=bool((params or {}).get("reduceOnly")))
+
+    def create_order(self, *a, **k):
+        self._c("create_order")
+        return self.sim.create_order(*a, **k)
+
+    def cancel_order(self, *a, **k):
+        self._c("cancel_order")
+        return self.sim.cancel_order(*a, **k)
+
+    def fetch_order(self, *a, **k):
+        self._c("fetch_order")
+        return self.sim.fetch_order(*a, **k)
+
+    def fetch_open_orders(self, *a, **k):
+        self._c("fetch_open_orders")
+        return self.sim.fetch_open_orders(*a, **k)
+
+    def market(self, symbol):
+        return {"symbol": symbol, "limits": {"amount": {"min": 0.001}, "cost": {"min": 5.0}}}
+
+    def load_markets(self, reload=False):
+        return {}
+
+    def set_markets(self, markets, currencies=None):
+        pass
+
+    def set_leverage(self, leverage, symbol=None):
+        pass
+
+# ============================================================
+# Bot modules
+# ============================================================
+def load_bot(filename, name):
+    """โหลด main.py / main.py1 เป็น module ใหม่ (state แยกจากที่ import ไว้ที่อื่น)"""
+    loader = importlib.machinery.SourceFileLoader(name, os.path.join(HERE, filename))
+    spec = importlib.util.spec_from_loader(name, loader)
+    mod = importlib.util.module_from_spec(spec)
+    loader.exec_module(mod)
+    return mod
+
+class _Done(BaseException):
+    pass
+
+def bot_ticks(filename, ticks=BOT_TICKS, seed=0):
+    """รัน main() ของบอทกับ FakeExchange จนครบ ticks รอบ -> (วินาทีของรอบแรก (cold), [วินาทีของรอบถัดๆ ไป], calls)
+    ทุกรอบจบที่ sleep (ไม่ได้ sleep จริง); error ใน loop ถือว่าล้มเหลว"""
+    mod = load_bot(filename, "bench_" + filename.replace(".", "_"))
+    mod.STATE_FILE = None
+    if hasattr(mod, "USE_STREAM"):
+        mod.USE_STREAM = False
+    base = synthetic_ohlcv(30000, "1m", seed)
+    lev = mod.LEVERAGE
+    frac = getattr(mod, "POSITION_MARGIN_FRACTION", getattr(mod, "POSITION_MARGIN_PERCENT", 0.5))
+    fx = FakeExchange(base, mod.SYMBOL, SimExchange(1000.0, 0.0004, lev, frac))
+    candles._caches.clear()
+
+    def setup(*a):
+        if hasattr(mod, "market"):           # main.py1 เก็บ exchange/market เป็น global
+            mod.exchange, mod.market = fx, fx.market(mod.SYMBOL)
+        return fx
+    mod.setup_exchange = setup
+    times, errors = [], []
+    t = [time.perf_counter()]
+
+    def sleep(s):
+        times.append(time.perf_counter() - t[0])
+        if len(times) >= ticks:
+            raise _Done()
+        t[0] = time.perf_counter()
+    mod.time = types.SimpleNamespace(time=time.time, sleep=sleep, perf_counter=time.perf_counter,
+                                     monotonic=time.monotonic)
+
+    class _Errors(logging.Handler):
+        def emit(self, rec):
+            if rec.levelno >= logging.ERROR:
+                errors.append(rec.getMessage())
+    h = _Errors()
+    root = logging.getLogger()
+    saved = root.handlers[:]
+    root.handlers = [logging.StreamHandler(open(os.devnull, "w")), h]
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="bench_"))
+    try:
+        mod.main()
+    except _Done:
+        pass
+    finally:
+        os.chdir(cwd)
+        root.handlers = saved
+        notifier = getattr(mod, "notifier", None)
+        if notifier is not None:
+            notifier.stop()
+    if errors:
+        raise RuntimeError(f"{filename}: loop error: {errors[0]}")
+    return times[0], times[1:], fx.calls
+
+# ============================================================
+# Reference implementations (ของเดิมก่อน optimize) ใช้เป็นคำตอบที่ถูกใน cross-check
+# ============================================================
+def _ref_ema(values, n):
+    if len(values) < n: return None
+    k = 2 / (n + 1)
+    e = sum(values[:n]) / n
+    for v in values[n:]:
+        e = v * k + e * (1 - k)
+    return e
+
+def _ref_ema_series(values, n):
+    if len(values) < n: return []
+    k = 2 / (n + 1)
+    e = sum(values[:n]) / n
+    out = [None] * (n - 1) + [e]
+    for v in values[n:]:
+        e = v * k + e * (1 - k)
+        out.append(e)
+    return out
+
+def _ref_nwe(closes, h, mult, factor):
+    n = len(closes)
+    if n < 200:
+        return None, None, None
+    win = min(499, n - 1)
+    coefs = [math.exp(-(i * i) / (2 * (h ** 2))) for i in range(win)]
+    den = sum(coefs)
+    num = sum(closes[-1 - j] * coefs[j] for j in range(win))
+    mean = num / den
+    win_s = min(int(h * 10), win - 1)
+    diffs = [abs(closes[-1 - i] - closes[-1 - i - 1]) for i in range(1, win_s)]
+    mae = (sum(diffs) / len(diffs)) * mult * factor if diffs else 0.0
+    return mean + mae, mean - mae, mean
+
+def _ref_macd(closes, fast=12, slow=26, signal=9):
+    if len(closes) < slow + signal + 5:
+        return None
+    ef, es = _ref_ema_series(closes, fast), _ref_ema_series(closes, slow)
+    dif = [a - b for a, b in zip(ef, es) if a is not None and b is not None]
+    if len(dif) < signal + 5:
+        return None
+    dea = _ref_ema_series(dif, signal)
+    return dif[-2], dif[-1], dea[-2], dea[-1]
+
+def _ref_macd_from_closes(closes, fast, slow, signal):
+    if len(closes) < slow + signal + 2: return None
+    ef, es = _ref_ema_series(closes, fast), _ref_ema_series(closes, slow)
+    dif = [ef[i] - es[i] for i in range(len(closes))
+           if i < len(ef) and i < len(es) and ef[i] is not None and es[i] is not None]
+    dea = _ref_ema_series(dif, signal)
+    if len(dif) < 2 or len(dea) < 2: return None
+    return dif[-2], dif[-1], dea[-2], dea[-1]
+
+def _ref_swings(ohlcv, left=2, right=2):
+    out = []; highs = [c[2] for c in ohlcv]; lows = [c[3] for c in ohlcv]
+    for i in range(left, len(ohlcv) - right):
+        if highs[i] == max(highs[i - left:i + right + 1]): out.append(('high', i, ohlcv[i][0], highs[i]))
+        if lows[i] == min(lows[i - left:i + right + 1]): out.append(('low', i, ohlcv[i][0], lows[i]))
+    return out
+
+def _ref_bos_choch(ohlcv, swings):
+    out = []; last_trend = None
+    for k in range(1, len(swings)):
+        _, _, _, pp = swings[k - 1]
+        stype, i, ts, p = swings[k]
+        close = ohlcv[i][4]
+        sig = None; trend = last_trend
+        if stype == 'high' and close > pp: sig, trend = 'BOS', 'up'
+        elif stype == 'low' and close < pp: sig, trend = 'BOS', 'down'
+        elif last_trend == 'up' and close < pp: sig, trend = 'CHOCH', 'down'
+        elif last_trend == 'down' and close > pp: sig, trend = 'CHOCH', 'up'
+        if sig:
+            out.append({'signal': sig, 'trend': trend, 'price': p, 'ts': ts, 'i': i})
+            last_trend = trend
+    return out
+
+def _ref_poc(ohlcv, low_bound, high_bound, buckets):
+    if not len(ohlcv) or high_bound <= low_bound: return None
+    lo = float(low_bound); hi = float(high_bound)
+    step = (hi - lo) / float(buckets)
+    bins = {}
+    for c in ohlcv:
+        px = min(hi, max(lo, c[4])); vol = c[5]
+        idx = max(0, min(buckets - 1, int((px - lo) / step)))
+        center = lo + (idx + 0.5) * step
+        bins[center] = bins.get(center, 0.0) + vol
+    return max(bins.items(), key=lambda kv: kv[1])[0] if bins else None
+
+# ============================================================
+# Cross-checks
+# ============================================================
+def _close(a, b, rel=1e-9):
+    if a is None or b is None:
+        return a is None and b is None
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape or not np.array_equal(np.isnan(a), np.isnan(b)):
+        return False
+    ok = np.isnan(b) | (np.abs(a - b) <= rel * np.maximum(1.0, np.abs(b)))
+    return bool(np.all(ok))
+
+def cross_check(nw, smc, sizes=SIZES, seeds=(0, 1, 2)):
+    """ผลของ implementation ปัจจุบันต้องเท่ากับของเดิม -> list ของข้อความที่ไม่ผ่าน"""
+    fails = []
+
+    def check(name, ok):
+        if not ok:
+            fails.append(name)
+
+    for seed in seeds:
+        for n in (150,) + tuple(sizes):
+            o = synthetic_ohlcv(n, "30m", seed)
+            closes = o[:, CLOSE].tolist()
+            tag = f"[n={n} seed={seed}]"
+            check(f"nwe_luxalgo_repaint {tag}", _close(
+                [x for x in nw.nwe_luxalgo_repaint(closes) if x is not None] or None,
+                [x for x in _ref_nwe(closes, nw.NW_BANDWIDTH, nw.NW_MULT, nw.NW_FACTOR) if x is not None] or None))
+            check(f"macd {tag}", _close(nw.macd(closes), _ref_macd(closes)))
+            check(f"macd_from_closes {tag}", _close(smc.macd_from_closes(closes),
+                                                    _ref_macd_from_closes(closes, smc.MACD_FAST, smc.MACD_SLOW, smc.MACD_SIGNAL)))
+            for p in (12, 50, 200):
+                check(f"ema({p}) {tag}", _close(nw.ema(closes, p), _ref_ema(closes, p)))
+                check(f"ema_series({p}) {tag}", _close([np.nan if v is None else v for v in smc.ema_series(closes, p)] or None,
+                                                       [np.nan if v is None else v for v in _ref_ema_series(closes, p)] or None)
+                      if len(closes) >= p else smc.ema_series(closes, p) == [])
+            if len(o) > 60:
+                m = smc.live_macd(f"chk{seed}_{n}", o)
+                check(f"live_macd {tag}", _close(m, _ref_macd_from_closes(closes, smc.MACD_FAST, smc.MACD_SLOW, smc.MACD_SIGNAL)))
+            rows = o.tolist()
+            for left, right in ((1, 1), (2, 2), (3, 3)):
+                sw = smc.find_swings_from_ohlcv(rows, left, right)
+                check(f"find_swings_from_ohlcv({left},{right}) {tag}", sw == _ref_swings(rows, left, right))
+                check(f"detect_bos_choch_from_swings({left},{right}) {tag}",
+                      smc.detect_bos_choch_from_swings(rows, sw) == _ref_bos_choch(rows, sw))
+            lo, hi = np.percentile(o[:, CLOSE], [10, 90])
+            for b in (10, 40):
+                ref = _ref_poc(rows, lo, hi, b)
+                check(f"calc_poc_in_range(b={b}) {tag}", smc.calc_poc_in_range(o, lo, hi, b) == ref)
+                check(f"VolumeProfile.poc(b={b}) {tag}", VolumeProfile(False).sync(o).poc(lo, hi, b) == ref)
+        # structure tracker แบบ incremental = batch ทุก window ที่เลื่อนไปทีละแท่ง
+        o = synthetic_ohlcv(700, "5m", seed)
+        for left, right, w in ((1, 1, 150), (2, 2, 400)):
+            tr = smc.StructureTracker(left, right)
+            ok = True
+            for end in range(w, len(o) + 1, 7):
+                win = o[end - w:end]
+                rows = win.tolist()
+                sig = _ref_bos_choch(rows, _ref_swings(rows, left, right))
+                if tr.sync(win).last_signal(w) != (sig[-1] if sig else None):
+                    ok = False
+                    break
+            check(f"StructureTracker({left},{right}) [seed={seed}]", ok)
+    return fails
+
+# ============================================================
+# Timing
+# ============================================================
+def measure(fn, repeat=5):
+    """(median, min) วินาทีต่อการเรียก 1 ครั้ง (จำนวนครั้งต่อรอบเลือกเองให้รอบละ >= 0.2 s)"""
+    t = timeit.Timer(fn)
+    number, _ = t.autorange()
+    samples = [x / number for x in t.repeat(repeat, number)]
+    return statistics.median(samples), min(samples)
+
+def cases(nw, smc, sizes):
+    """[(ชื่อ, callable, callable ของเดิมหรือ None)] ของทุก benchmark ย่อย"""
+    out = []
+    for n in sizes:
+        o = synthetic_ohlcv(n, "30m", 0)
+        closes = o[:, CLOSE].tolist()
+        rows = o.tolist()
+        lo, hi = (float(x) for x in np.percentile(o[:, CLOSE], [10, 90]))
+        sw = smc.find_swings_from_ohlcv(rows, 2, 2)
+        F, S, G = smc.MACD_FAST, smc.MACD_SLOW, smc.MACD_SIGNAL
+        out += [
+            (f"nwe_luxalgo_repaint[n={n}]", lambda c=closes: nw.nwe_luxalgo_repaint(c),
+             lambda c=closes: _ref_nwe(c, nw.NW_BANDWIDTH, nw.NW_MULT, nw.NW_FACTOR)),
+            (f"macd[n={n}]", lambda c=closes: nw.macd(c), lambda c=closes: _ref_macd(c)),
+            (f"macd_from_closes[n={n}]", lambda c=closes: smc.macd_from_closes(c),
+             lambda c=closes: _ref_macd_from_closes(c, F, S, G)),
+            (f"ema[n={n}]", lambda c=closes: nw.ema(c, 200), lambda c=closes: _ref_ema(c, 200)),
+            (f"ema_series[n={n}]", lambda c=closes: smc.ema_series(c, 200), lambda c=closes: _ref_ema_series(c, 200)),
+            (f"find_swings_from_ohlcv[n={n}]", lambda r=rows: smc.find_swings_from_ohlcv(r, 2, 2),
+             lambda r=rows: _ref_swings(r, 2, 2)),
+            (f"detect_bos_choch_from_swings[n={n}]", lambda r=rows, s=sw: smc.detect_bos_choch_from_swings(r, s),
+             lambda r=rows, s=sw: _ref_bos_choch(r, s)),
+            (f"calc_poc_in_range[n={n}]", lambda a=o, l=lo, h=hi: smc.calc_poc_in_range(a, l, h),
+             lambda r=rows, l=lo, h=hi: _ref_poc(r, l, h, smc.POC_BUCKETS)),
+        ]
+        # ตัวที่ loop ใช้จริงต่อ tick: state ที่ sync แล้ว + แท่งที่ยังไม่ปิดเปลี่ยน (ไม่มีของเดิมให้เทียบ)
+        tr = smc.StructureTracker(2, 2).sync(o)
+        vp = VolumeProfile(False).sync(o)
+        out += [
+            (f"structure_tick[n={n}]", lambda a=o, t=tr: t.sync(a).last_signal(len(a)), None),
+            (f"volume_profile_poc[n={n}]", lambda v=vp, l=lo, h=hi: v.poc(l, h, 40), None),
+        ]
+    return out
+
+def run(sizes=SIZES, keyword=None, repeat=5, ticks=BOT_TICKS, bots=True):
+    nw, smc = load_bot("main.py", "bench_nw"), load_bot("main.py1", "bench_smc")
+    results = {}
+    for name, fn, ref in cases(nw, smc, sizes):
+        if keyword and keyword not in name:
+            continue
+        med, best = measure(fn, repeat)
+        results[name] = {"median_us": med * 1e6, "min_us": best * 1e6}
+        line = f"{name:44s} {med * 1e6:12.1f} us  (min {best * 1e6:.1f})"
+        if ref is not None:
+            results[name]["ref_min_us"] = measure(ref, repeat)[1] * 1e6
+            line += f"  ref {results[name]['ref_min_us']:.1f}"
+        print(line, flush=True)
+    for label, filename in (("bot_nw", "main.py"), ("bot_smc", "main.py1")) if bots else ():
+        if keyword and keyword not in label:
+            continue
+        cold, warm, calls = bot_ticks(filename, ticks)
+        results[f"{label}_cold"] = {"median_us": cold * 1e6, "min_us": cold * 1e6}
+        results[f"{label}_tick"] = {"median_us": statistics.median(warm) * 1e6, "min_us": min(warm) * 1e6}
+        print(f"{label + '_cold':44s} {cold * 1e6:12.1f} us", flush=True)
+        print(f"{label + '_tick':44s} {statistics.median(warm) * 1e6:12.1f} us  (min {min(warm) * 1e6:.1f})  calls={calls}", flush=True)
+    return results
+
+# ============================================================
+# Baseline
+# ============================================================
+def meta():
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def save_baseline(results, path=BASELINE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta(), "results": results}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta_us=MIN_DELTA_US):
+    """[(ชื่อ, baseline us, ตอนนี้ us, อัตราส่วน)] ที่ช้าลงเกิน threshold (เทียบค่า min: noise น้อยสุด)"""
+    out = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        old, new = b["min_us"], r["min_us"]
+        if new > old * (1.0 + threshold) and new - old > min_delta_us:
+            out.append((name, old, new, new / old))
+    return out
+
+def vs_reference(results, threshold=THRESHOLD, min_delta_us=MIN_DELTA_US):
+    """[(ชื่อ, ของเดิม us, ตอนนี้ us, อัตราส่วน)] ที่ช้ากว่าของเดิม (_ref_*) เกิน threshold
+    baseline เทียบได้แค่กับรอบก่อนหน้า: rewrite ที่ช้ากว่าโค้ดเดิมตั้งแต่แรกจะหลุดถ้าไม่เทียบตรงนี้"""
+    out = []
+    for name, r in results.items():
+        old, new = r.get("ref_min_us"), r["min_us"]
+        if old and new > old * (1.0 + threshold) and new - old > min_delta_us:
+            out.append((name, old, new, new / old))
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="indicator / decision-loop benchmarks")
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save", action="store_true", help="บันทึกผลรอบนี้เป็น baseline")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD, help="สัดส่วนที่ยอมให้ช้าลง (0.25 = 25%%)")
+    ap.add_argument("--min-delta-us", type=float, default=MIN_DELTA_US)
+    ap.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    ap.add_argument("-k", dest="keyword", default=None, help="เฉพาะ benchmark ที่ชื่อมีคำนี้")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--ticks", type=int, default=BOT_TICKS)
+    ap.add_argument("--no-bots", action="store_true", help="ไม่จับเวลา main() ของบอท")
+    ap.add_argument("--check", action="store_true", help="เฉพาะ cross-check")
+    a = ap.parse_args(argv)
+    sizes = tuple(int(x) for x in a.sizes.split(","))
+
+    nw, smc = load_bot("main.py", "bench_nw_chk"), load_bot("main.py1", "bench_smc_chk")
+    fails = cross_check(nw, smc, sizes)
+    if fails:
+        print("CROSS-CHECK FAILED:\n  " + "\n  ".join(fails))
+        return 1
+    print("cross-check ok")
+    if a.check:
+        return 0
+
+    results = run(sizes, a.keyword, a.repeat, a.ticks, not a.no_bots)
+    slower = vs_reference(results, a.threshold, a.min_delta_us)
+    for name, old, new, ratio in slower:
+        print(f"SLOWER THAN ORIGINAL {name}: {old:.1f} -> {new:.1f} us (x{ratio:.2f})")
+    if slower:
+        return 1
+    if a.save or not os.path.exists(a.baseline):
+        base = {}
+        if os.path.exists(a.baseline) and a.keyword:
+            with open(a.baseline, encoding="utf-8") as f:
+                base = json.load(f)["results"]       # -k: อัปเดตเฉพาะตัวที่รัน
+        base.update(results)
+        save_baseline(base, a.baseline)
+        print(f"baseline saved -> {a.baseline}")
+        return 0
+    with open(a.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    slow = compare(results, baseline, a.threshold, a.min_delta_us)
+    for name, old, new, ratio in slow:
+        print(f"REGRESSION {name}: {old:.1f} -> {new:.1f} us (x{ratio:.2f})")
+    if slow:
+        return 1
+    print(f"no regression > {a.threshold:.0%} vs {a.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
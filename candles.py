@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# candles.py
+# Incremental OHLCV cache ต่อ (symbol, timeframe)
+# ดึงเฉพาะแท่งใหม่ด้วย since= แทนการโหลด 600 แท่งทุก loop, แท่งที่ยังไม่ปิดจะถูกเขียนทับในที่เดิม
+#
+# use_base_timeframe("1m"): ทุก TF ที่ใหญ่กว่าจะประกอบแท่งเองจาก base series เดียวต่อ symbol
+# (1 request ต่อ tick แทน 1 ต่อ TF และทุก TF เห็น snapshot เดียวกัน)
+
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+_TF_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000}
+_WEEK_OFFSET_MS = 4 * 86400 * 1000    # epoch เป็นวันพฤหัส; แท่ง 1w ของ Binance เปิดวันจันทร์ 00:00 UTC
+MAX_BASE_ROWS = 1500                  # limit สูงสุดต่อ request ของ Binance futures klines
+
+class Timeframe:
+    """Interval แบบ Binance ('1m' .. '12h', '1d', '3d', '1w', '1M') และขอบแท่งของมัน
+
+    m/h/d นับจาก epoch (UTC), 1w เปิดวันจันทร์, 1M เปิดวันที่ 1 ของเดือน (ยาวไม่เท่ากัน;
+    .ms ของ 1M เป็นค่าประมาณ 30 วัน ใช้แค่คำนวณจำนวนแท่ง)
+    """
+
+    def __init__(self, tf):
+        try:
+            n, unit = int(tf[:-1]), tf[-1]
+            sec = _TF_SECONDS[unit]
+        except (KeyError, ValueError, TypeError, IndexError):
+            raise ValueError(f"unsupported timeframe: {tf!r}")
+        if n <= 0 or (unit in "wM" and n != 1):
+            raise ValueError(f"unsupported timeframe: {tf!r}")
+        self.name = tf
+        self.n = n
+        self.unit = unit
+        self.seconds = n * sec
+        self.ms = self.seconds * 1000
+        self.minutes = self.seconds // 60
+        self._offset = _WEEK_OFFSET_MS if unit == "w" else 0
+
+    def __repr__(self):
+        return f"Timeframe({self.name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Timeframe) and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def open_time(self, ts_ms):
+        """เวลาเปิด (ms) ของแท่งที่ ts_ms อยู่"""
+        ts_ms = int(ts_ms)
+        if self.unit == "M":
+            d = datetime.fromtimestamp(ts_ms / 1000, timezone.utc)
+            return int(datetime(d.year, d.month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        return (ts_ms - self._offset) // self.ms * self.ms + self._offset
+
+    def close_time(self, ts_ms):
+        """เวลาปิด (ms) ของแท่งที่ ts_ms อยู่ (= เวลาเปิดของแท่งถัดไป)"""
+        if self.unit == "M":
+            d = datetime.fromtimestamp(self.open_time(ts_ms) / 1000, timezone.utc)
+            y, m = (d.year + 1, 1) if d.month == 12 else (d.year, d.month + 1)
+            return int(datetime(y, m, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        return self.open_time(ts_ms) + self.ms
+
+    def open_times(self, ts_ms):
+        """open_time แบบ vectorized (array ของ ts ms)"""
+        ts = np.asarray(ts_ms, dtype=np.int64)
+        if self.unit == "M":
+            return np.array([self.open_time(t) for t in ts], dtype=np.int64)
+        return (ts - self._offset) // self.ms * self.ms + self._offset
+
+    def divides(self, other):
+        """True ถ้าแท่งของ other ประกอบจากแท่งของ self ได้พอดี"""
+        if other.unit == "M" or other.unit == "w":
+            return self.unit not in "wM" and 86400 % self.seconds == 0
+        return self.unit not in "wM" and other.seconds % self.seconds == 0
+
+def resample(rows, timeframe):
+    """แท่ง (n, 6) เรียงตามเวลา -> แท่งของ timeframe ที่ใหญ่กว่า (m, 6) ตามขอบแท่งของ Binance:
+    open แรก, high สูงสุด, low ต่ำสุด, close สุดท้าย, volume รวม (กลุ่มสุดท้ายอาจยังไม่ครบแท่ง)"""
+    rows = np.asarray(rows, dtype=np.float64)
+    if not len(rows):
+        return np.empty((0, 6))
+    tf = timeframe if isinstance(timeframe, Timeframe) else Timeframe(timeframe)
+    keys = tf.open_times(rows[:, TS])
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(rows)] - 1
+    out = np.empty((len(starts), 6))
+    out[:, TS] = keys[starts]
+    out[:, OPEN] = rows[starts, OPEN]
+    out[:, HIGH] = np.maximum.reduceat(rows[:, HIGH], starts)
+    out[:, LOW] = np.minimum.reduceat(rows[:, LOW], starts)
+    out[:, CLOSE] = rows[ends, CLOSE]
+    out[:, VOLUME] = np.add.reduceat(rows[:, VOLUME], starts)
+    return out
+
+def timeframe_ms(tf):
+    """'30m' -> 1800000"""
+    return Timeframe(tf).ms
+
+class CandleCache:
+    """Candles ของ (symbol, timeframe) เดียว เก็บแบบ columnar ring buffer
+
+    Backing array จุได้ 2*size แท่ง: append ต่อท้ายไปเรื่อยๆ พอเต็มจะย้าย size แท่งล่าสุด
+    กลับไปต้น array (amortized O(1)) ทุก window จึงต่อเนื่องใน memory และ view ที่คืนไป
+    ไม่ต้อง copy. View ใช้ได้จนถึง refresh() ครั้งถัดไปเท่านั้น
+    """
+
+    def __init__(self, ex, symbol, timeframe, size=600, min_interval=1.0, clock=time.time):
+        self.ex = ex
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.size = int(size)
+        self.tf_ms = timeframe_ms(timeframe)
+        self.min_interval = min_interval     # refresh ซ้ำภายในช่วงนี้ (tick เดียวกัน) จะไม่ยิง request
+        self.clock = clock
+        self.fetches = 0
+        self.streaming = False               # True = มี stream ป้อนแท่งให้ผ่าน apply() แล้ว ไม่ต้องยิง REST
+        self._data = np.zeros((6, 2 * self.size), dtype=np.float64)
+        self._n = 0
+        self._last_refresh = None
+
+    def __len__(self):
+        return min(self._n, self.size)
+
+    # ---------------- fetch ----------------
+    def refresh(self, force=False):
+        p = self.refresh_params(force)
+        if p is not None:
+            self.ingest(self.ex.fetch_ohlcv(self.symbol, self.timeframe, **p), p)
+        return self
+
+    def refresh_params(self, force=False):
+        """kwargs ของ fetch_ohlcv ที่ต้องยิงตอนนี้ หรือ None ถ้ายังไม่ต้อง
+        (แยกจาก refresh() ให้ client แบบ async ยิงเองแล้วส่งผลเข้า ingest())"""
+        now = self.clock()
+        if not force and self._n and (self.streaming or (self._last_refresh is not None
+                                                          and now - self._last_refresh < self.min_interval)):
+            return None
+        if self._n:
+            last_ts = int(self._data[TS, self._n - 1])
+            missing = int((now * 1000 - last_ts) // self.tf_ms) + 1
+            if missing < self.size:
+                return {"since": last_ts, "limit": missing + 1}
+        # ว่าง หรือหลุดไปนานเกิน buffer -> โหลดใหม่ทั้งหมด
+        return {"limit": self.size}
+
+    def ingest(self, rows, params):
+        if "since" not in params:
+            self._n = 0
+        self.fetches += 1
+        self._last_refresh = self.clock()
+        self._merge(rows)
+        return self
+
+    def load(self, rows):
+        """แทนเนื้อหาด้วยแท่งจาก snapshot; refresh() ถัดไปดึงเฉพาะแท่งตั้งแต่แท่งสุดท้ายที่มี"""
+        self._n = 0
+        self._last_refresh = None
+        self._merge(np.asarray(rows, dtype=np.float64).tolist())
+        return self
+
+    def apply(self, rows):
+        """รวมแท่งที่ได้จากที่อื่น (เช่น kline stream) เข้ากับ cache; แท่งเวลาเดียวกันเขียนทับ"""
+        self._merge(rows)
+        return self
+
+    def _merge(self, rows):
+        if not rows:
+            return
+        arr = np.asarray([r[:6] for r in rows], dtype=np.float64)
+        arr[:, VOLUME] = np.nan_to_num(arr[:, VOLUME])
+        if self._n:
+            last_ts = self._data[TS, self._n - 1]
+            arr = arr[arr[:, TS] >= last_ts]
+            if len(arr) and arr[0, TS] == last_ts:
+                self._data[:, self._n - 1] = arr[0]      # แท่งที่ยังไม่ปิด: เขียนทับ
+                arr = arr[1:]
+        if len(arr) > self.size:
+            arr = arr[-self.size:]
+        k = len(arr)
+        if not k:
+            return
+        if self._n + k > self._data.shape[1]:
+            keep = min(self._n, self.size - k)
+            self._data[:, :keep] = self._data[:, self._n - keep:self._n]
+            self._n = keep
+        self._data[:, self._n:self._n + k] = arr.T
+        self._n += k
+
+    # ---------------- views ----------------
+    def _window(self, n=None):
+        end = self._n
+        start = max(0, end - self.size)
+        if n is not None:
+            start = max(start, end - int(n))
+        return start, end
+
+    def view(self, n=None):
+        """(n, 6) zero-copy view แถวละ [ts, o, h, l, c, v] เรียงเก่า -> ใหม่ (แท่งสุดท้าย = แท่งที่ยังไม่ปิด)"""
+        a, b = self._window(n)
+        return self._data[:, a:b].T
+
+    def column(self, col, n=None):
+        """array ต่อเนื่องของคอลัมน์เดียว (TS/OPEN/HIGH/LOW/CLOSE/VOLUME)"""
+        a, b = self._window(n)
+        return self._data[col, a:b]
+
+    def closes(self, n=None):
+        return self.column(CLOSE, n)
+
+    def last_ts(self):
+        return int(self._data[TS, self._n - 1]) if self._n else None
+
+    def last_closed_ts(self, now=None):
+        now_ms = (self.clock() if now is None else now) * 1000
+        for i in range(self._n - 1, max(-1, self._n - 3), -1):
+            ts = self._data[TS, i]
+            if ts + self.tf_ms <= now_ms:
+                return int(ts)
+        return None
+
+class ResampledCache(CandleCache):
+    """CandleCache ที่ประกอบแท่งจาก base cache (เช่น 1m) ของ symbol เดียวกันแทนการดึง TF นี้เอง
+
+    โหลดประวัติของ TF นี้จาก exchange ครั้งแรกครั้งเดียว หลังจากนั้น refresh() = refresh base
+    (ซึ่งดึงเฉพาะแท่ง 1m ใหม่) แล้วรวมแถว base ตั้งแต่เวลาเปิดของแท่งล่าสุดเป็นแท่ง TF นี้:
+    open แรก, high สูงสุด, low ต่ำสุด, close สุดท้าย, volume รวม (แท่งที่ยังไม่ปิดจึงถูกต้องตลอด)
+    ถ้า base ย้อนไปไม่ถึงเวลาเปิดของแท่งล่าสุด (เช่นหลุดไปนาน) จะดึง TF นี้ตรงๆ ก่อน
+    """
+
+    def __init__(self, ex, symbol, timeframe, base_tf, base_rows, size=600, min_interval=1.0, clock=time.time):
+        super().__init__(ex, symbol, timeframe, size, min_interval, clock)
+        self.tf = Timeframe(timeframe)
+        self.base_tf = base_tf
+        self.base_rows = base_rows
+
+    @property
+    def base(self):
+        # ผ่าน registry ทุกครั้ง: ทุก TF ของ symbol ใช้ base ตัวเดียวกันแม้ base ถูกสร้างใหม่ให้ใหญ่ขึ้น
+        return get_cache(self.ex, self.symbol, self.base_tf, self.base_rows)
+
+    def refresh(self, force=False):
+        if self.streaming and self._n and not force:
+            return self
+        if not self._n:
+            return super().refresh(force=True)
+        base = self.base.refresh()
+        if not len(base) or base.column(TS)[0] > self.last_ts():
+            super().refresh(force=True)
+            if not len(base) or base.column(TS)[0] > self.last_ts():
+                return self
+        self._last_refresh = self.clock()
+        self._merge(self.resample(base.view(), self.last_ts()))
+        return self
+
+    def resample(self, rows, since):
+        """แถว base (n, 6) ที่ ts >= since -> list ของแท่ง TF นี้ [ts, o, h, l, c, v]"""
+        return resample(rows[rows[:, TS] >= since], self.tf).tolist()
+
+# ================== registry ==================
+_caches = {}
+_base_tf = None
+
+def use_base_timeframe(tf):
+    """ตั้ง base TF (เช่น "1m") ให้ get_cache ประกอบ TF ที่ใหญ่กว่าจาก base; None = ดึงทุก TF ตรงๆ"""
+    global _base_tf
+    _base_tf = Timeframe(tf) if tf else None
+
+def _base_rows(tf):
+    """จำนวนแท่ง base ที่ต้องเก็บเพื่อประกอบแท่ง tf (None = ประกอบไม่ได้/ไม่คุ้ม)"""
+    if _base_tf is None or tf.ms <= _base_tf.ms or not _base_tf.divides(tf):
+        return None
+    need = 2 * (tf.ms // _base_tf.ms) + 60       # แท่งล่าสุด + แท่งก่อนหน้า + เผื่อ tick ที่หลุด
+    return need if need <= MAX_BASE_ROWS else None
+
+def _source(ex):
+    """client ที่ใช้ดึงแท่งจริงของ ex (บัญชีเสมือนของ host.py ชี้ไปที่ session ที่ทุก strategy ใช้ร่วมกัน)"""
+    return getattr(ex, "candle_source", None) or ex
+
+def caches(ex=None):
+    """cache ทั้งหมดใน registry (เฉพาะของ ex ถ้าระบุ)"""
+    ex = _source(ex) if ex is not None else None
+    return [c for c in _caches.values() if ex is None or c.ex is ex]
+
+def get_cache(ex, symbol, timeframe, size=600):
+    """Cache เดียวต่อ (symbol, timeframe); ขอ size ใหญ่กว่าเดิมจะสร้างใหม่แล้วโหลดเต็มครั้งเดียว"""
+    ex = _source(ex)
+    key = (symbol, timeframe)
+    c = _caches.get(key)
+    if c is None or c.ex is not ex or size > c.size:
+        tf = Timeframe(timeframe)
+        rows = _base_rows(tf)
+        if rows is None:
+            c = CandleCache(ex, symbol, timeframe, size)
+        else:
+            c = ResampledCache(ex, symbol, timeframe, _base_tf.name, rows, size)
+        _caches[key] = c
+    return c
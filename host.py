@@ -0,0 +1,661 @@
+# -*- coding: utf-8 -*-
+# host.py
+# รันหลาย strategy (main.py, main.py1 หรือสคริปต์ที่เขียนแบบเดียวกัน) เป็น plugin ใน process เดียว
+# บน exchange session เดียว ข้อมูลตลาดชุดเดียว และ position จริงสุทธิ 1 ตัวต่อ symbol
+#
+#   - plugin = สคริปต์บอทที่โหลดด้วย SourceFileLoader (module แยกกันต่อ plugin) แล้วรัน main() ใน thread
+#     ของมันเองแบบผลัดกัน: time.sleep() ของ plugin = จบรอบ คืนการควบคุมให้ host (ไม่มีสอง plugin รันพร้อมกัน)
+#   - ทุก tick host refresh candle cache ที่ใช้ร่วมกันครั้งเดียว (1m base -> ทุก TF) + position จริง 1 request
+#     แล้ว freeze cache ไว้: plugin ที่ตื่นใน tick นั้นเห็นแท่ง/ราคาชุดเดียวกันและไม่ยิง REST ของข้อมูลตลาดเอง
+#   - แต่ละ plugin เห็นบัญชีเสมือน (StrategyAccount) ของตัวเอง: position / free balance / SL-TP
+#     market order fill ทันทีในบัญชีเสมือนที่ราคาของ tick; SL/TP เป็น order เสมือนที่ host ตรวจทุก tick
+#     จากช่วง high/low ของแท่ง 1m ตั้งแต่ tick ก่อน
+#   - position สุทธิจริงต่อ symbol มี STOP_MARKET reduceOnly บน exchange ที่ SL กว้างสุดของ plugin ฝั่งเดียวกัน
+#     (ProtectiveOrders, ปรับทุก settle): process ค้าง/ตายระหว่าง tick ก็ยังมี stop จริงกันไว้
+#   - จบ tick: order ของทุก plugin บน symbol เดียวกันหักล้างกันก่อน (internal cross ไม่เสีย fee)
+#     แล้วส่งส่วนต่างระหว่าง position จริงกับผลรวมของบัญชีเสมือนเป็น market order เดียว
+#     (ส่วนต่างต่ำกว่า step ของ exchange -> fill เสมือนค้างไว้จนกว่า order สุทธิจะครอบมัน)
+#   - PnL แยกตาม strategy: fill ส่วนที่ออก exchange ถูกปรับเป็นราคา fill จริง + fee จริงตามสัดส่วน qty
+#
+# ใช้: python host.py main.py main.py1
+#      python host.py -c host.json
+#      host.json: {"plugins": [{"name": "nw", "path": "main.py", "capital": 500},
+#                              {"name": "smc", "path": "main.py1", "capital": 500,
+#                               "config": {"SYMBOL": "BTC/USDT:USDT", "STATE_FILE": "smc_btc.npz"}}],
+#                  "state_file": "host_state.npz"}
+#      (capital ที่ไม่ระบุ = free USDT จริงหารเท่าๆ กัน; config ทับค่า CONFIG ของสคริปต์นั้น)
+
+import os, re, sys, json, html, time, types, logging, argparse, threading
+import importlib.util, importlib.machinery
+
+import ccxt
+
+import snapshot
+from backtest import SimExchange
+from candles import CLOSE, HIGH, LOW, TS, ResampledCache, caches, get_cache, use_base_timeframe
+from metrics import metrics, instrument
+from notifier import Notifier
+from orders import STOP, ProtectiveOrders, fill_price
+from scheduler import Scheduler
+
+HOST_STATE_FILE = "host_state.npz"
+STATE_SAVE_SEC = 30
+BASE_TF = "1m"
+PRICE_ROWS = 5               # แท่ง 1m ขั้นต่ำต่อ symbol (ราคาล่าสุด + ช่วงราคาระหว่าง tick)
+FEE = 0.0004                 # taker fee ของบัญชีเสมือน (ก่อนปรับเป็น fee จริง)
+MIN_TICK_SEC = 1.0
+MAX_TICK_SEC = 30.0
+STOP_CHECK_SEC = 2.0         # ระยะห่างสูงสุดระหว่าง tick เมื่อมี position / SL-TP เสมือนค้างอยู่
+REPORT_SEC = 3600
+TG_SPOOL_FILE = "tg_unsent_host.json"
+
+# ค่าที่ host คุมเอง (ทับ config ของ plugin เสมอ)
+PLUGIN_OVERRIDES = {"USE_STREAM": False, "METRICS_PORT": None, "METRICS_JSON_FILE": None}
+
+log = logging.getLogger("host")
+
+def load_module(path, name):
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    mod = importlib.util.module_from_spec(spec)
+    loader.exec_module(mod)
+    return mod
+
+# ============================================================
+# Virtual account
+# ============================================================
+class StrategyAccount(SimExchange):
+    """บัญชีเสมือนของ plugin 1 ตัวบน symbol เดียว: interface แบบ ccxt เท่าที่บอทใช้
+
+    ราคา / market / precision มาจาก host; position, balance และ STOP/TAKE order อยู่ในบัญชีนี้
+    candle_source = client จริง: get_cache() ของ plugin ได้ cache ตัวเดียวกับที่ host refresh
+    """
+
+    def __init__(self, host, name, symbol, capital, leverage=10, margin_fraction=0.7, fee=FEE):
+        super().__init__(capital, fee, leverage, margin_fraction)
+        self.host = host
+        self.name = name
+        self.symbol = symbol
+        self.capital = float(capital)
+        self.candle_source = host.ex
+        self.slippage = 0.0          # ส่วนต่างราคา fill จริงกับราคา tick (บวก = เสีย)
+        self.crossed = 0.0           # qty ที่หักล้างกับ strategy อื่นภายใน host
+        self.tick_fills = []         # fill ที่ยังไม่ได้ settle กับ exchange
+
+    def market_order(self, side, qty, reduce_only=False):
+        fill = super().market_order(side, qty, reduce_only)
+        if fill:
+            self.tick_fills.append(fill)
+        return fill
+
+    def equity(self):
+        upnl = (self.price - self.entry) * self.amount if self.amount and self.price else 0.0
+        return self.balance + upnl
+
+    def snapshot(self):
+        return {"capital": self.capital, "balance": self.balance, "amount": self.amount, "entry": self.entry,
+                "fees": self.fees, "slippage": self.slippage, "crossed": self.crossed, "fills": len(self.fills),
+                "orders": self.orders, "next_id": self._next_id}
+
+    def restore(self, d):
+        self.capital = d["capital"]
+        self.balance, self.amount, self.entry = d["balance"], d["amount"], d["entry"]
+        self.fees, self.slippage, self.crossed = d["fees"], d["slippage"], d["crossed"]
+        self.orders = {str(k): v for k, v in d["orders"].items()}
+        self._next_id = d["next_id"]
+        return self
+
+    # ---------------- ccxt ----------------
+    def fetch_ticker(self, symbol):
+        return {"symbol": symbol, "last": self.price}
+
+    def fetch_positions(self, symbols=None):
+        if not self.amount:
+            return []
+        return [{"symbol": self.symbol, "contracts": abs(self.amount), "side": "long" if self.amount > 0 else "short",
+                 "entryPrice": self.entry, "unrealizedPnl": self.equity() - self.balance}]
+
+    def fetch_balance(self, params=None):
+        return {"USDT": {"free": self.free(), "total": self.balance}}
+
+    def create_market_order(self, symbol, side, amount, price=None, params=None):
+        return self.create_order(symbol, "MARKET", side, float(amount), price, params)
+
+    def amount_to_precision(self, symbol, amount):
+        return self.host.ex.amount_to_precision(symbol, amount)
+
+    def price_to_precision(self, symbol, price):
+        return self.host.ex.price_to_precision(symbol, price)
+
+    def market(self, symbol):
+        return self.host.ex.market(symbol)
+
+    def load_markets(self, reload=False):
+        return self.host.ex.markets
+
+    def set_markets(self, markets, currencies=None):
+        pass
+
+    def set_leverage(self, leverage, symbol=None):
+        pass                         # leverage จริงตั้งโดย host (ค่าสูงสุดของ plugin บน symbol นั้น)
+
+# ============================================================
+# Plugin
+# ============================================================
+class _Stop(BaseException):
+    pass
+
+class PluginNotifier:
+    """Notifier ของ plugin บน Notifier ตัวเดียวของ host: ข้อความขึ้นต้นด้วยชื่อ plugin, tag แยกตาม plugin"""
+
+    def __init__(self, shared, name, escape=False):
+        self.shared = shared
+        self.name = name
+        self.escape = escape         # สคริปต์ส่งข้อความธรรมดา แต่ notifier ของ host เป็น HTML
+
+    def send(self, msg, tag=None):
+        text = html.escape(msg, quote=False) if self.escape else msg
+        return self.shared.send(f"<b>[{self.name}]</b> {text}", tag and f"{self.name}:{tag}")
+
+    def clear_sent(self, prefix):
+        self.shared.clear_sent(f"{self.name}:{prefix}")
+
+    def sent_tags(self):
+        p = self.name + ":"
+        return [t[len(p):] for t in self.shared.sent_tags() if t.startswith(p)]
+
+    def restore_tags(self, tags):
+        self.shared.restore_tags([f"{self.name}:{t}" for t in tags or ()])
+
+    def start(self):
+        return self
+
+    def flush(self, timeout=10.0):
+        return self.shared.flush(timeout)
+
+    def stop(self, timeout=5.0):
+        pass
+
+class Plugin:
+    """สคริปต์บอท 1 ตัว: module ของมันเอง + thread ที่รัน main() ทีละรอบตามที่ host สั่ง
+
+    step() ปล่อยให้ main() รันจนเรียก time.sleep(s) ครั้งถัดไป -> wake = เวลาที่มันอยากตื่นรอบหน้า
+    """
+
+    def __init__(self, name, path, config=None, capital=None):
+        self.name = name
+        self.path = path
+        self.capital = capital
+        self.mod = load_module(path, "plugin_" + re.sub(r"\W", "_", name))
+        for k, v in (config or {}).items():
+            if not hasattr(self.mod, k):
+                raise ValueError(f"{name}: unknown config {k}")
+            setattr(self.mod, k, v)
+        for k, v in PLUGIN_OVERRIDES.items():
+            if hasattr(self.mod, k):
+                setattr(self.mod, k, v)
+        self.symbol = self.mod.SYMBOL
+        self.account = None
+        self.clock = time.time
+        self.wake = 0.0
+        self.alive = True
+        self.turns = 0
+        self.error = None
+        self._go = threading.Event()
+        self._done = threading.Event()
+        self._stop = False
+        self._thread = None
+
+    @property
+    def leverage(self):
+        return getattr(self.mod, "LEVERAGE", 1)
+
+    @property
+    def margin_fraction(self):
+        return getattr(self.mod, "POSITION_MARGIN_FRACTION", getattr(self.mod, "POSITION_MARGIN_PERCENT", 1.0))
+
+    def files(self):
+        """ไฟล์ state/journal/spool ของสคริปต์ (CONFIG ที่ชื่อลงท้าย _FILE)"""
+        return {k: v for k, v in vars(self.mod).items() if k.endswith("_FILE") and isinstance(v, str)}
+
+    def attach(self, account, notify, clock=time.time):
+        mod = self.mod
+        self.account = account
+        self.clock = clock
+
+        def setup_exchange(snap=None):
+            if hasattr(mod, "market"):   # main.py1 เก็บ exchange / market เป็น global
+                mod.exchange, mod.market = account, account.market(self.symbol)
+            return account
+        mod.setup_exchange = setup_exchange
+        mod.notifier = notify
+        t = types.ModuleType("time")
+        t.__dict__.update(vars(time))
+        t.sleep = self._sleep
+        t.time = clock
+        mod.time = t
+        return self
+
+    def _sleep(self, seconds):
+        self.wake = self.clock() + max(0.0, float(seconds))
+        self._done.set()
+        self._go.wait()
+        self._go.clear()
+        if self._stop:
+            raise _Stop()
+
+    def _run(self):
+        self._go.wait()
+        self._go.clear()
+        try:
+            if not self._stop:
+                self.mod.main()
+                log.error(f"{self.name}: main() returned")
+        except _Stop:
+            pass
+        except BaseException as e:               # รวม sys.exit() ของสคริปต์
+            self.error = e
+            log.exception(f"{self.name}: stopped: {e!r}")
+        finally:
+            self.alive = False
+            self._done.set()
+
+    def step(self):
+        if not self.alive:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"plugin-{self.name}", daemon=True)
+            self._thread.start()
+        self._done.clear()
+        self._go.set()
+        self._done.wait()
+        self.turns += 1
+
+    def stop(self, timeout=5.0):
+        if self._thread is not None and self.alive:
+            self._stop = True
+            self._done.clear()
+            self._go.set()
+            self._done.wait(timeout)
+
+# ============================================================
+# Host
+# ============================================================
+class Host:
+    """exchange session เดียว + plugin หลายตัว
+
+    tick():  refresh ข้อมูลตลาด/position จริง -> ตรวจ SL-TP เสมือน -> plugin ที่ถึงเวลารัน 1 รอบ
+             -> settle (ส่งส่วนต่างสุทธิต่อ symbol) -> บันทึก state -> วินาทีถึง tick ถัดไป
+    """
+
+    def __init__(self, ex, plugins, notifier=None, state_file=HOST_STATE_FILE, fee=FEE,
+                 clock=time.time, sleep=time.sleep):
+        names = [p.name for p in plugins]
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate plugin names: {names}")
+        self.ex = ex
+        self.plugins = plugins
+        self.notifier = notifier or Notifier(None, None)
+        self.fee = fee
+        self.clock = clock
+        self.sleep = sleep
+        self.symbols = sorted({p.symbol for p in plugins})
+        self.accounts = {}           # plugin name -> StrategyAccount
+        self.real = {}               # symbol -> position จริง (+ long / - short)
+        self.unowned = {}            # symbol -> position จริงที่ไม่ใช่ของ strategy ไหน (เช่นเปิดมือ) ไม่ถูกแตะ
+        self.orders = 0
+        self._pending = {s: [] for s in self.symbols}    # fill เสมือนที่ยังไม่ได้ส่งส่วนต่างออก exchange
+        self._done = {s: [] for s in self.symbols}       # fill จริง (side, qty, price, fee) ที่ยังไม่ได้แบ่งให้ fill เสมือน
+        self.guards = {s: ProtectiveOrders(ex, s, log) for s in self.symbols}   # stop จริงของ position สุทธิ
+        self._last = {}              # symbol -> (ts, high, low, price) ของแท่ง 1m ตอน tick ก่อน
+        self._last_report = clock()
+        self.sched = Scheduler(MAX_TICK_SEC, MIN_TICK_SEC)
+        self.snapper = snapshot.Snapshotter(state_file, STATE_SAVE_SEC, clock)
+        self.state_file = state_file
+
+    # ---------------- start ----------------
+    def _check_files(self):
+        seen = {}
+        for p in self.plugins:
+            for k, v in p.files().items():
+                if v in seen:
+                    raise ValueError(f"{p.name}.{k} = {v!r} is also used by {seen[v]}; set it in the plugin config")
+                seen[v] = f"{p.name}.{k}"
+
+    def start(self):
+        self._check_files()
+        use_base_timeframe(BASE_TF)
+        state, _ = snapshot.load(self.state_file)
+        state = state or {}
+        saved = state.get("accounts", {})
+        free = None
+        missing = [p for p in self.plugins if p.name not in saved and p.capital is None]
+        if missing:
+            bal = self.ex.fetch_balance({"type": "future"})
+            free = float((bal.get("USDT") or {}).get("free") or 0.0) / len(self.plugins)
+        for p in self.plugins:
+            a = StrategyAccount(self, p.name, p.symbol, p.capital if p.capital is not None else free,
+                                p.leverage, p.margin_fraction, self.fee)
+            if p.name in saved:
+                a.restore(saved[p.name])
+            self.accounts[p.name] = a
+            escape = getattr(getattr(p.mod, "notifier", None), "parse_mode", None) is None
+            p.attach(a, PluginNotifier(self.notifier, p.name, escape), self.clock)
+        for sym in self.symbols:
+            lev = max(p.leverage for p in self.plugins if p.symbol == sym)
+            try:
+                self.ex.set_leverage(lev, sym)
+            except Exception as e:
+                log.warning(f"set_leverage {sym} warn: {e}")
+        self._last = {sym: tuple(v) for sym, v in state.get("last", {}).items()}
+        self.refresh()
+        for sym, d in state.get("guards", {}).items():
+            if sym in self.guards:
+                self.guards[sym].restore(d)
+        if "unowned" in state:
+            self.unowned = state["unowned"]
+        else:
+            for sym in self.symbols:
+                u = self.real.get(sym, 0.0) - sum(a.amount for a in self._accounts(sym))
+                if abs(u) > 1e-12:
+                    self.unowned[sym] = u
+                    log.warning(f"{sym}: position {u:+g} on exchange does not belong to any strategy, left as is")
+        log.info(f"✅ host: {', '.join(f'{p.name}({p.symbol}, {self.accounts[p.name].capital:.2f} USDT)' for p in self.plugins)}")
+        return self
+
+    def _accounts(self, symbol):
+        return [a for a in self.accounts.values() if a.symbol == symbol]
+
+    # ---------------- tick ----------------
+    def refresh(self):
+        """ข้อมูลตลาดชุดเดียวของ tick: cache ทุกตัวบน session นี้ + ราคา + position จริง แล้ว freeze cache"""
+        cs = caches(self.ex)
+        try:
+            for c in cs:
+                c.streaming = False
+            with metrics.phase("candles"):
+                # base ก่อน: TF ที่ประกอบจาก base ใช้ base ที่เพิ่ง refresh (ไม่ยิงซ้ำ)
+                for c in sorted(cs, key=lambda c: isinstance(c, ResampledCache)):
+                    c.refresh(force=not isinstance(c, ResampledCache))
+                for sym in self.symbols:
+                    self._advance(sym, get_cache(self.ex, sym, BASE_TF, PRICE_ROWS).refresh())
+            with metrics.phase("positions"):
+                self.real = {s: 0.0 for s in self.symbols}
+                for p in self.ex.fetch_positions(self.symbols):
+                    if p.get("symbol") in self.real and float(p.get("contracts") or 0):
+                        c = abs(float(p["contracts"]))
+                        self.real[p["symbol"]] = c if p.get("side") == "long" else -c
+        finally:
+            for c in caches(self.ex):
+                c.streaming = True
+
+    def _advance(self, symbol, cache):
+        """ราคาใหม่ของ symbol: ตรวจ SL/TP เสมือนกับช่วงราคาตั้งแต่ tick ก่อน (เปิดที่ราคาเดิม, high/low
+        ของแท่งที่เพิ่งเห็น + ส่วนที่แท่งเดิมวิ่งเกินไป) แล้วตั้งราคาของทุกบัญชีบน symbol นี้"""
+        rows = cache.view()
+        px = float(rows[-1, CLOSE])
+        prev = self._last.get(symbol)
+        open_ = hi = lo = px
+        if prev is not None:
+            pts, phi, plo, open_ = prev
+            hi, lo = max(open_, px), min(open_, px)
+            new = rows[rows[:, TS] > pts]
+            if len(new):
+                hi, lo = max(hi, float(new[:, HIGH].max())), min(lo, float(new[:, LOW].min()))
+            same = rows[rows[:, TS] == pts]
+            if len(same):
+                if same[0, HIGH] > phi:
+                    hi = max(hi, float(same[0, HIGH]))
+                if same[0, LOW] < plo:
+                    lo = min(lo, float(same[0, LOW]))
+        self._last[symbol] = (float(rows[-1, TS]), float(rows[-1, HIGH]), float(rows[-1, LOW]), px)
+        for a in self._accounts(symbol):
+            a.price = open_
+            for o in a.trigger(open_, hi, lo):
+                log.info(f"{a.name}: {o['type']} {o['side']} {o['filled']:g} @ {o['average']} ({o['status']})")
+            a.price = px
+
+    def settle(self):
+        """ส่งส่วนต่างระหว่าง position จริงกับผลรวมบัญชีเสมือน (+ ส่วนที่ไม่ใช่ของใคร) ต่อ symbol,
+        ปรับต้นทุนของ fill เสมือนตามที่เกิดจริง แล้วปรับ stop จริงของ position สุทธิ"""
+        for sym in self.symbols:
+            accts = self._accounts(sym)
+            stopped = self._stop_fills(sym, self.guards[sym].reconcile)
+            self._stopped(sym, stopped)
+            self._done[sym] += stopped
+            for a in accts:
+                self._pending[sym] += [(a, f) for f in a.tick_fills]
+                a.tick_fills = []
+            if self._net(sym, accts):
+                self._attribute(self._pending[sym], self._done[sym])
+                self._pending[sym], self._done[sym] = [], []
+            self._protect(sym, accts)
+
+    def _net(self, sym, accts):
+        """market order สุทธิของ symbol -> True ถ้า position จริงตรงกับเป้าแล้ว (แบ่งต้นทุนได้)"""
+        real = self.real.get(sym, 0.0)
+        target = sum(a.amount for a in accts) + self.unowned.get(sym, 0.0)
+        delta = target - real
+        if abs(delta) <= 1e-12:
+            return True
+        try:
+            qty = float(self.ex.amount_to_precision(sym, abs(delta)))
+        except Exception:
+            qty = 0.0
+        if qty <= 0:
+            return False                 # ต่ำกว่า step / min ของ exchange: fill ค้างไว้รวมกับรอบหน้า
+        side = "buy" if delta > 0 else "sell"
+        params = {"newOrderRespType": "RESULT"}
+        if abs(target) < abs(real) and target * real >= 0:
+            params["reduceOnly"] = True
+        try:
+            o = self.ex.create_market_order(sym, side, qty, params=params)
+        except Exception as e:
+            log.warning(f"{sym}: net {side} {qty:g} failed, retry next tick: {e}")
+            return False
+        self.orders += 1
+        filled = float(o.get("filled") or qty)
+        px = fill_price(o, accts[0].price if accts else None)
+        fee = float((o.get("fee") or {}).get("cost") or filled * px * self.fee)
+        self.real[sym] = real + (filled if side == "buy" else -filled)
+        self._done[sym].append((side, filled, px, fee))
+        log.info(f"{sym}: net {side} {filled:g} @ {px:.2f} (target {target:+g})")
+        return True
+
+    def _stop_fills(self, sym, call):
+        """exit ของ stop จริงจาก ProtectiveOrders (reconcile / cancel_all) -> [(side, qty, price, fee)]"""
+        g = self.guards[sym]
+        side = "sell" if g.side == "long" else "buy"
+        try:
+            exits = call()
+        except Exception as e:
+            log.warning(f"{sym}: stop reconcile failed: {e}")
+            return []
+        for x in exits:
+            log.info(f"{sym}: exchange stop {side} {x['qty']:g} @ {x['price']:.2f}")
+        return [(side, x["qty"], x["price"], x["fee"]) for x in exits]
+
+    def _stopped(self, sym, fills):
+        """stop จริง fill แล้ว -> ปิดบัญชีเสมือนฝั่งนั้นที่ราคา fill ก่อนคิดส่วนต่าง (ไม่งั้น _net เปิดกลับคืน
+        เมื่อ SL เสมือนไม่เห็นช่วงราคา เช่น stop ทำงานตอน host หยุด): STOP เสมือนทำงานก่อน ที่เหลือแบ่งตามสัดส่วน"""
+        for side, qty, px, fee in fills:
+            sign = 1 if side == "sell" else -1          # ฝั่งของ position ที่ถูกปิด
+            left = qty
+            for a in self._accounts(sym):
+                if a.amount * sign > 0:
+                    for o in a.trigger(px, px, px):
+                        left -= o["filled"] if o["side"] == side else 0.0
+                        log.info(f"{a.name}: {o['type']} {o['side']} {o['filled']:g} @ {o['average']} (exchange stop)")
+            rest = [a for a in self._accounts(sym) if a.amount * sign > 0] if left > 1e-12 else []
+            total = sum(abs(a.amount) for a in rest)
+            for a in rest:
+                saved, a.price = a.price, px
+                q = min(abs(a.amount), left * abs(a.amount) / total)
+                a.market_order(side, q, reduce_only=True)
+                a.price = saved
+                log.info(f"{a.name}: {side} {q:g} @ {px} (exchange stop)")
+
+    def _protect(self, sym, accts):
+        """stop จริงของ position สุทธิของ strategy: ขนาดเต็ม position ที่ SL เสมือนที่กว้างสุดของบัญชีฝั่งเดียวกัน
+        (ไม่มี position / ไม่มี SL เสมือน -> ยกเลิก)"""
+        g = self.guards[sym]
+        net = sum(a.amount for a in accts)
+        side = "long" if net > 1e-12 else "short" if net < -1e-12 else None
+        close = "sell" if side == "long" else "buy"
+        stops = [o["stopPrice"] for a in accts if a.amount * net > 0
+                 for o in a.fetch_open_orders(sym) if o["type"] == STOP and o["side"] == close]
+        if side != g.side or not stops:
+            if g.legs:
+                self._done[sym] += self._stop_fills(sym, g.cancel_all)
+            g.side = side
+        if not stops:
+            return
+        stop = g._price(min(stops) if side == "long" else max(stops))
+        qty = g._amount(abs(net))
+        leg = g.legs.get("sl")
+        if qty <= 0 or (leg and leg["stop"] == stop and leg["qty"] == qty):
+            return
+        try:
+            g.place("sl", STOP, stop, qty, "host")
+        except Exception as e:
+            log.warning(f"{sym}: exchange stop {close} {qty:g} @ {stop} failed, retry next tick: {e}")
+
+    def _attribute(self, fills, done):
+        """fill เสมือน -> ต้นทุนจริง: ส่วนที่หักล้างกันภายในไม่เสีย fee; ส่วนที่ออก exchange (ฝั่งเดียวกับ
+        fill จริงใน done แบ่งตามสัดส่วน qty) ได้ราคาเฉลี่ยที่ fill จริงและ fee จริง"""
+        real = {}
+        for side, qty, px, fee in done:
+            q, n, f = real.get(side, (0.0, 0.0, 0.0))
+            real[side] = (q + qty, n + qty * px, f + fee)
+        total = {side: sum(f["qty"] for _, f in fills if f["side"] == side) for side in real}
+        for a, f in fills:
+            a.balance += f["fee"]
+            a.fees -= f["fee"]
+            side = f["side"]
+            qty, notional, fee = real.get(side, (0.0, 0.0, 0.0))
+            ext = f["qty"] * min(1.0, qty / total[side]) if qty and total[side] else 0.0
+            a.crossed += f["qty"] - ext
+            if ext:
+                slip = (notional / qty - f["price"]) * ext * (1 if side == "buy" else -1)
+                cost = fee * ext / qty
+                a.balance -= slip + cost
+                a.slippage += slip
+                a.fees += cost
+
+    def state(self):
+        return {"accounts": {n: a.snapshot() for n, a in self.accounts.items()}, "unowned": self.unowned,
+                "guards": {s: g.snapshot() for s, g in self.guards.items()}, "last": self._last}
+
+    def report(self, now=None):
+        """PnL แยกตาม strategy (log + metrics) -> list ของ dict"""
+        out = []
+        for n, a in self.accounts.items():
+            r = {"strategy": n, "symbol": a.symbol, "equity": a.equity(), "realized": a.balance - a.capital,
+                 "unrealized": a.equity() - a.balance, "position": a.amount, "fees": a.fees,
+                 "slippage": a.slippage, "crossed": a.crossed, "fills": len(a.fills)}
+            labels = (("strategy", n),)
+            for k in ("equity", "realized", "unrealized", "fees", "slippage"):
+                metrics.set(f"strategy_{k}", r[k], labels)
+            out.append(r)
+        for r in out:
+            log.info(f"📊 {r['strategy']} {r['symbol']}: equity={r['equity']:.2f} realized={r['realized']:+.2f} "
+                     f"unrealized={r['unrealized']:+.2f} pos={r['position']:+g} fees={r['fees']:.2f} "
+                     f"slip={r['slippage']:+.2f} crossed={r['crossed']:g}")
+        self._last_report = self.clock() if now is None else now
+        return out
+
+    def next_wake(self, now):
+        wakes = [p.wake for p in self.plugins if p.alive]
+        wait = min(wakes) - now if wakes else MAX_TICK_SEC
+        if any(a.amount or a.fetch_open_orders() for a in self.accounts.values()):
+            wait = min(wait, STOP_CHECK_SEC)
+        return min(max(wait, MIN_TICK_SEC), MAX_TICK_SEC)
+
+    def tick(self):
+        metrics.mark_tick()
+        self.refresh()
+        now = self.clock()
+        for p in self.plugins:
+            if p.alive and p.wake <= now + 0.05:
+                with metrics.phase(f"plugin_{p.name}"):
+                    p.step()
+        with metrics.phase("settle"):
+            self.settle()
+        st = self.state()
+        self.snapper.update(st, None, key=st)
+        if now - self._last_report >= REPORT_SEC:
+            self.report(now)
+        metrics.observe("tick_seconds", time.perf_counter() - metrics.tick_t0)
+        return self.next_wake(now)
+
+    def run(self):
+        self.start()
+        try:
+            while any(p.alive for p in self.plugins):
+                try:
+                    wait = self.tick()
+                    self.sched.success()
+                except Exception as e:
+                    log.exception(f"host tick error: {e}")
+                    metrics.inc("loop_errors_total")
+                    wait = self.sched.failure()
+                metrics.set("next_wake_seconds", wait)
+                self.sleep(wait)
+        finally:
+            for p in self.plugins:
+                p.stop()
+            if self.state_file:
+                snapshot.save(self.state_file, self.state(), clock=self.clock)
+            self.report()
+
+# ============================================================
+# CLI
+# ============================================================
+def setup_exchange():
+    ex = ccxt.binance({
+        "apiKey": os.getenv("BINANCE_API_KEY"),
+        "secret": os.getenv("BINANCE_SECRET"),
+        "enableRateLimit": True,
+        "options": {"defaultType": "future"},
+    })
+    instrument(ex)
+    ex.load_markets()
+    return ex
+
+def plugins_from(spec):
+    """[{"name", "path", "config", "capital"}] หรือ [path, ...] -> [Plugin]"""
+    out = []
+    for s in spec:
+        s = {"path": s} if isinstance(s, str) else s
+        name = s.get("name") or os.path.basename(s["path"]).replace(".", "_")
+        out.append(Plugin(name, s["path"], s.get("config"), s.get("capital")))
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="multi-strategy host")
+    ap.add_argument("paths", nargs="*", help="สคริปต์บอท (เช่น main.py main.py1)")
+    ap.add_argument("-c", "--config")
+    ap.add_argument("--state", default=None)
+    a = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    cfg = {}
+    if a.config:
+        with open(a.config, encoding="utf-8") as f:
+            cfg = json.load(f)
+    spec = cfg.get("plugins", []) + a.paths
+    if not spec:
+        ap.error("no plugins")
+    notifier = Notifier(os.getenv("TELEGRAM_TOKEN"), os.getenv("TELEGRAM_CHAT_ID"), parse_mode="HTML",
+                        spool_path=TG_SPOOL_FILE, on_disabled=lambda msg: log.info("[TG] " + msg))
+    host = Host(setup_exchange(), plugins_from(spec), notifier,
+                a.state or cfg.get("state_file", HOST_STATE_FILE))
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        notifier.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# indicators.py
+# Streaming EMA / MACD: seed จากประวัติครั้งเดียว แล้ว update O(1) ต่อแท่งที่ปิด
+# แท่งที่ยังไม่ปิดใช้ tentative() ซึ่งถูกแทนที่ทุก tick และทิ้งไปเมื่อแท่งปิดจริง (update)
+# ema() / macd() = ทางลัดแบบ batch สำหรับการเรียกครั้งเดียว (loop ธรรมดา ไม่สร้าง state) ค่าเท่ากับ seed().value / snapshot()
+#
+# live loop: seed จาก window ของ cache ครั้งแรก แล้ว sync() ต่อแท่งปิด -> ต่างจาก batch บน window ล่าสุด
+# แค่ส่วนของ seed ที่ลดลง (1 - k)^n ตามจำนวนแท่งที่ผ่านไป (ค่าที่ได้คือ EMA ของประวัติที่ยาวกว่า)
+
+from collections import deque
+
+def _floats(values):
+    return values.tolist() if hasattr(values, "tolist") else values
+
+def ema(values, period):
+    """EMA ของค่าสุดท้าย (seed ด้วย SMA ของ period ค่าแรก) หรือ None ถ้าข้อมูลไม่พอ"""
+    if len(values) < period:
+        return None
+    v = _floats(values)
+    k = 2 / (period + 1); a = 1 - k
+    e = sum(v[:period]) / period
+    for x in v[period:]:
+        e = x * k + e * a
+    return e
+
+def macd(closes, fast=12, slow=26, signal=9, min_bars=None):
+    """(dif_prev, dif_now, dea_prev, dea_now) ของแท่งสุดท้าย หรือ None (เงื่อนไขเดียวกับ MACDState.snapshot())"""
+    n = len(closes)
+    if n < (slow + signal + 5 if min_bars is None else min_bars) or n < slow + signal:
+        return None
+    v = _floats(closes)
+    kf, ks, kg = 2 / (fast + 1), 2 / (slow + 1), 2 / (signal + 1)
+    af, as_, ag = 1 - kf, 1 - ks, 1 - kg
+    ef = sum(v[:fast]) / fast
+    for x in v[fast:slow]:
+        ef = x * kf + ef * af
+    es = sum(v[:slow]) / slow
+    difs = [ef - es]
+    for x in v[slow:]:
+        ef = x * kf + ef * af
+        es = x * ks + es * as_
+        difs.append(ef - es)
+    dea = prev = sum(difs[:signal]) / signal
+    for d in difs[signal:]:
+        prev, dea = dea, d * kg + dea * ag
+    return difs[-2], difs[-1], prev, dea
+
+class _Streaming:
+    last_ts = None
+
+    def seed(self, values, last_ts=None):
+        self.reset()
+        for v in _floats(values):
+            self.update(v)
+        self.last_ts = last_ts
+        return self
+
+    def sync(self, ts, closes):
+        """ตามให้ทันแท่งปิดใน (ts, closes) เช่นจาก candle cache; ประวัติขาดช่วง -> seed ใหม่"""
+        if not len(ts):
+            return self
+        if self.last_ts is None or self.last_ts < ts[0]:
+            return self.seed(closes, ts[-1])
+        ts = _floats(ts); closes = _floats(closes)
+        for i in range(len(ts)):
+            if ts[i] > self.last_ts:
+                self.update(closes[i], ts[i])
+        return self
+
+class EMAState(_Streaming):
+    """EMA seed ด้วย SMA ของ period ค่าแรก (เหมือน ema() เดิม)
+
+    value   = ค่า ณ แท่งปิดล่าสุด
+    current = ค่ารวมแท่งที่ยังไม่ปิด (tentative) หรือเท่ากับ value
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2 / (period + 1)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.value = None
+        self.current = None
+        self.last_ts = None
+        self._sum = 0.0
+
+    def _next(self, v):
+        if self.value is not None:
+            return v * self.k + self.value * (1 - self.k)
+        if self.count + 1 == self.period:
+            return (self._sum + v) / self.period
+        return None
+
+    def update(self, v, ts=None):
+        nv = self._next(v)
+        if self.value is None:
+            self._sum += v
+        self.count += 1
+        self.value = self.current = nv
+        if ts is not None:
+            self.last_ts = ts
+        return nv
+
+    def tentative(self, v):
+        self.current = self._next(v)
+        return self.current
+
+    def rollback(self):
+        self.current = self.value
+
+class MACDState(_Streaming):
+    """MACD (DIF = EMA fast - EMA slow, DEA = EMA signal ของ DIF) แบบ streaming
+
+    history เก็บ (dif, dea) ของแท่งปิดล่าสุด N แท่ง
+    snapshot() คืน (dif_prev, dif_now, dea_prev, dea_now) สำหรับ macd_up/macd_down
+    min_bars = จำนวนแท่งขั้นต่ำก่อนให้สัญญาณ (ค่า default ตรงกับ macd() ใน main.py)
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9, history=50, min_bars=None):
+        self.fast = EMAState(fast)
+        self.slow = EMAState(slow)
+        self.signal = EMAState(signal)
+        self.min_bars = slow + signal + 5 if min_bars is None else min_bars
+        self.history = deque(maxlen=max(2, history))
+        self.reset()
+
+    def reset(self):
+        self.fast.reset(); self.slow.reset(); self.signal.reset()
+        self.history.clear()
+        self.last_ts = None
+        self._forming = None
+
+    @property
+    def count(self):
+        return self.slow.count
+
+    def update(self, close, ts=None):
+        f = self.fast.update(close)
+        s = self.slow.update(close)
+        self.signal.rollback()
+        self._forming = None
+        if ts is not None:
+            self.last_ts = ts
+        if f is None or s is None:
+            return None
+        dif = f - s
+        dea = self.signal.update(dif)
+        if dea is not None:
+            self.history.append((dif, dea))
+        return dif, dea
+
+    def tentative(self, close):
+        f = self.fast.tentative(close)
+        s = self.slow.tentative(close)
+        self._forming = None
+        if f is None or s is None:
+            return None
+        dif = f - s
+        dea = self.signal.tentative(dif)
+        if dea is not None:
+            self._forming = (dif, dea)
+        return self._forming
+
+    def rollback(self):
+        self.fast.rollback(); self.slow.rollback(); self.signal.rollback()
+        self._forming = None
+
+    def snapshot(self, forming=False):
+        if forming and self._forming is not None:
+            if self.count + 1 < self.min_bars or not self.history:
+                return None
+            (dp, ep), (dn, en) = self.history[-1], self._forming
+        else:
+            if self.count < self.min_bars or len(self.history) < 2:
+                return None
+            (dp, ep), (dn, en) = self.history[-2], self.history[-1]
+        return dp, dn, ep, en
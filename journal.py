@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# journal.py
+# Trade journal แบบ append-only แทนการ rewrite daily_pnl.json ทั้งไฟล์ทุก loop
+#
+#   <path>           WAL: JSON 1 บรรทัดต่อ record (trade / เปลี่ยนเดือน), fsync เฉพาะตอนมี trade
+#   <path>.snap      snapshot หลัง compaction: aggregate รายวัน + trade ของเดือนปัจจุบัน
+#   <path>.archive   trade ดิบทุกตัวที่ถูก compact ออกจาก WAL (ไว้ย้อนดู ไม่ถูกอ่านตอนเริ่ม)
+#
+# aggregate (pnl, จำนวน, จำนวนต่อ reason) เก็บใน memory ต่อวันและต่อเดือน -> report ไม่ต้องสแกน trade
+
+import os, json, time, bisect, logging
+from datetime import datetime
+
+COMPACT_EVERY = 500          # จำนวน record ใน WAL ก่อน compact
+
+log = logging.getLogger("journal")
+
+def _month(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m")
+
+def _day(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+def _empty():
+    return {"pnl": 0.0, "n": 0, "reasons": {}}
+
+def _add(agg, pnl, reason, n=1):
+    agg["pnl"] += pnl
+    agg["n"] += n
+    agg["reasons"][reason] = agg["reasons"].get(reason, 0) + n
+
+def _merge(dst, src):
+    dst["pnl"] += src["pnl"]
+    dst["n"] += src["n"]
+    for r, c in src["reasons"].items():
+        dst["reasons"][r] = dst["reasons"].get(r, 0) + c
+
+def reason_counts(agg):
+    """(TP, SL, BE) แบบเดียวกับ monthly report เดิม"""
+    rs = agg["reasons"]
+    return (sum(c for r, c in rs.items() if r.startswith("TP")), rs.get("SL", 0), rs.get("BE", 0))
+
+class Journal:
+    """Trade journal ของบอท 1 ตัว
+
+    stats = dict รูปแบบเดิม {"month", "pnl", "trades"} ที่ส่งให้ NWStrategy ใช้ได้ตรงๆ
+    (strategy append trade เข้า stats["trades"] เอง) แล้ว commit() บันทึกเฉพาะ trade ที่ยังไม่ได้บันทึก:
+    ไม่มี trade ใหม่ = ไม่แตะ disk
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY, clock=time.time):
+        self.path = path
+        self.snap_path = path + ".snap"
+        self.archive_path = path + ".archive"
+        self.compact_every = compact_every
+        self.clock = clock
+        self.seq = 0
+        self.days = {}               # "YYYY-MM-DD" -> aggregate
+        self.months = {}             # "YYYY-MM" -> aggregate
+        self._day_keys = []          # เรียงแล้ว สำหรับ query ช่วงวัน
+        self._wal = []               # record ใน WAL ที่ยังไม่ถูก compact
+        self.stats = {"month": None, "pnl": 0.0, "trades": []}
+        self._stamps = []            # ts ของ stats["trades"] แต่ละตัว
+        self._load()
+        self._committed = len(self.stats["trades"])
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    # ---------------- load ----------------
+    def _load(self):
+        snap_seq = 0
+        if os.path.exists(self.snap_path):
+            with open(self.snap_path, encoding="utf-8") as f:
+                snap = json.load(f)
+            snap_seq = self.seq = snap["seq"]
+            for day, agg in snap["days"].items():
+                self._add_day(day, agg)
+            self.stats["month"] = snap["month"]
+            for rec in snap["trades"]:
+                self.stats["trades"].append(rec["trade"])
+                self._stamps.append(rec["ts"])
+                self.stats["pnl"] += rec["trade"]["pnl"]
+        if os.path.exists(self.path):
+            good = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break                    # เขียนไม่จบ (แม้จะเป็น JSON ครบ): ไม่ตัดทิ้ง append ถัดไปจะต่อบรรทัดเดียวกัน
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break                    # บรรทัดสุดท้ายที่เขียนไม่จบ (crash ระหว่าง write)
+                    good += len(line)
+                    if rec["seq"] > snap_seq:
+                        self._apply(rec)
+                        self._wal.append(rec)
+            if good != os.path.getsize(self.path):
+                log.warning(f"journal: dropping torn tail of {self.path}")
+                with open(self.path, "r+b") as f:
+                    f.truncate(good)
+                    f.flush()
+                    os.fsync(f.fileno())
+        if self.stats["month"] is None:
+            self.stats["month"] = _month(self.clock())
+
+    def _add_day(self, day, agg):
+        d = self.days.get(day)
+        if d is None:
+            d = self.days[day] = _empty()
+            bisect.insort(self._day_keys, day)
+        _merge(d, agg)
+        _merge(self.months.setdefault(day[:7], _empty()), agg)
+
+    def _apply(self, rec):
+        self.seq = rec["seq"]
+        if rec["k"] == "trade":
+            tr = rec["trade"]
+            agg = _empty()
+            _add(agg, tr["pnl"], tr.get("reason", ""))
+            self._add_day(_day(rec["ts"]), agg)
+            self.stats["trades"].append(tr)
+            self._stamps.append(rec["ts"])
+            self.stats["pnl"] += tr["pnl"]
+        elif rec["k"] == "month":
+            self.stats["month"] = rec["month"]
+            self.stats["pnl"] = 0.0
+            self.stats["trades"].clear()
+            self._stamps.clear()
+
+    # ---------------- write ----------------
+    def _append(self, recs, sync):
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs))
+        self._f.flush()
+        if sync:
+            os.fsync(self._f.fileno())
+        self._wal.extend(recs)
+
+    def _record(self, kind, ts, **data):
+        self.seq += 1
+        return dict(seq=self.seq, ts=ts, k=kind, **data)
+
+    def commit(self, ts=None):
+        """บันทึก trade ที่ strategy เพิ่มเข้า stats["trades"] ตั้งแต่ commit ครั้งก่อน"""
+        new = self.stats["trades"][self._committed:]
+        if not new:
+            return 0
+        ts = self.clock() if ts is None else ts
+        recs = [self._record("trade", ts, trade=tr) for tr in new]
+        self._append(recs, sync=True)
+        for tr in new:
+            agg = _empty()
+            _add(agg, tr["pnl"], tr.get("reason", ""))
+            self._add_day(_day(ts), agg)
+            self._stamps.append(ts)
+        self._committed = len(self.stats["trades"])
+        if len(self._wal) >= self.compact_every:
+            self.compact()
+        return len(new)
+
+    def roll(self, month):
+        """เริ่มเดือนใหม่: stats (dict เดิม) ถูกล้างในที่ aggregate ของเดือนเก่ายังอยู่"""
+        if self.stats["month"] == month:
+            return
+        self.commit()
+        self._append([self._record("month", self.clock(), month=month)], sync=False)
+        self.stats["month"] = month
+        self.stats["pnl"] = 0.0
+        self.stats["trades"].clear()
+        self._stamps.clear()
+        self._committed = 0
+        self.compact()
+
+    def import_stats(self, stats, ts):
+        """ย้ายข้อมูลจาก daily_pnl.json เดิม (trade มีแค่เวลา -> ใช้ ts เดียวกันทั้งหมด)"""
+        self.roll(stats.get("month") or _month(ts))
+        self.stats["trades"].extend(stats.get("trades", []))
+        self.commit(ts)
+
+    def compact(self):
+        """ย้าย trade ใน WAL ไป archive, เขียน snapshot ใหม่แบบ atomic แล้วเริ่ม WAL ว่าง
+        (crash ระหว่างทาง: record ใน WAL ที่ seq <= snapshot จะถูกข้ามตอน load)"""
+        trades = [r for r in self._wal if r["k"] == "trade"]
+        if trades:
+            with open(self.archive_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in trades))
+                f.flush()
+                os.fsync(f.fileno())
+        snap = {
+            "seq": self.seq,
+            "month": self.stats["month"],
+            "days": self.days,
+            "trades": [{"ts": ts, "trade": tr} for ts, tr in zip(self._stamps, self.stats["trades"])],
+        }
+        tmp = self.snap_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snap_path)
+        self._f.close()
+        self._f = open(self.path, "w", encoding="utf-8")
+        self._wal = []
+
+    def close(self):
+        self.commit()
+        self._f.close()
+
+    # ---------------- query ----------------
+    def empty(self):
+        return self.seq == 0
+
+    def month(self, month):
+        """aggregate ของเดือน "YYYY-MM": {"pnl", "n", "reasons": {reason: count}}"""
+        return self.months.get(month) or _empty()
+
+    def range(self, start, end):
+        """aggregate รวมของวัน start..end (รวมทั้งสองวัน, "YYYY-MM-DD")"""
+        out = _empty()
+        i = bisect.bisect_left(self._day_keys, start)
+        j = bisect.bisect_right(self._day_keys, end)
+        for day in self._day_keys[i:j]:
+            _merge(out, self.days[day])
+        return out
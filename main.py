@@ -5,8 +5,20 @@
 # + TP ใช้ Mid (เปิด/ปิดได้)
 # + สรุปรายเดือนสะสมทั้งเดือน
 
-import ccxt, time, json, math, logging, os, requests
+import ccxt, time, json, logging, os
 from datetime import datetime
+from candles import get_cache, use_base_timeframe, Timeframe, TS, CLOSE
+from nwe import get_engine, NWEndpoint
+import indicators
+from indicators import EMAState, MACDState
+from strategy_nw import NWStrategy, config_from, macd_up, macd_down
+from stream import MarketStream
+from journal import Journal, reason_counts
+from notifier import Notifier
+from metrics import metrics, instrument
+from orders import ProtectiveOrders
+from scheduler import Scheduler
+import snapshot
 
 # ============================================================
 # CONFIG (ปรับได้)
@@ -18,6 +30,7 @@ SECRET  = os.getenv("BINANCE_SECRET",    "YOUR_BINANCE_SECRET")
 SYMBOL = "BTC/USDT:USDT"
 TIMEFRAME = "30m"
 MACD_TF = "5m"                         # TF ใช้สำหรับ entry confirm (pending)
+BASE_TF = "1m"                         # ทุก TF ประกอบจากแท่ง 1m ชุดเดียว (1 request/tick); None = ดึงแต่ละ TF ตรงๆ
 MACD_ENABLED = False
 
 # --- EMA toggle (ถ้าปิด จะไม่ใช้ EMA เป็นเงื่อนไข trend) ---
@@ -28,7 +41,7 @@ EMA_SLOW = 100
 # --- Breakeven via MACD experimental ---
 USE_BREAKEVEN_MACD = False              # ถ้า True: ใช้ MACD บน BREAKEVEN_MACD_TF เพื่อตัดสินการกันทุน/ปิด
 BREAKEVEN_MACD_TF = "5m"               # TF สำหรับตรวจ MACD เพื่อ BE/close (ทดลอง)
-USE_REPAINT = True
+USE_REPAINT = True                     # False = NW endpoint (non-repaint) อัปเดตทุก tick ไม่ต้อง freeze
 
 LEVERAGE = 10
 POSITION_MARGIN_FRACTION = 0.7
@@ -37,13 +50,14 @@ POSITION_MARGIN_FRACTION = 0.7
 NW_BANDWIDTH = 8.0
 NW_MULT = 4
 NW_FACTOR = 1.5
-UPDATE_FRACTION = 0.50
+UPDATE_FRACTION = 0.50                 # ใช้เฉพาะ USE_REPAINT = True
 
 # Risk / TP / SL
 TP_BUFFER = 300                        # ใช้เมื่อ USE_MID_AS_TP = False
 SL_DISTANCE = 2000
 USE_BREAKEVEN = True
 BREAKEVEN_OFFSET = 250
+NATIVE_STOPS = True                    # SL/TP/BE เป็น STOP_MARKET / TAKE_PROFIT_MARKET (reduceOnly) บน exchange
 
 # 👉 เพิ่ม: เลือกโหมด TP
 USE_MID_AS_TP = True    # True = TP ที่ mid / False = TP ที่ upper/lower - buffer
@@ -51,14 +65,31 @@ USE_MID_AS_TP = True    # True = TP ที่ mid / False = TP ที่ upper/l
 # Monthly report (สะสมทั้งเดือน ส่งวันที่ 25)
 DAILY_REPORT_HH = 23
 DAILY_REPORT_MM = 59
-STATS_FILE = "daily_pnl.json"
+STATS_FILE = "daily_pnl.json"                # รูปแบบเดิม: อ่านครั้งเดียวเพื่อย้ายเข้า journal
+JOURNAL_FILE = "trades.journal"
 REPORT_SENT_FILE = "daily_report_sent.txt"
 
+STATE_FILE = "nw_state.npz"            # snapshot ของ state + candle cache สำหรับ warm restart (None = ไม่เก็บ)
+STATE_SAVE_SEC = 30                    # เขียน cache อย่างน้อยทุกเท่านี้ (state ของ position เขียนทันทีที่เปลี่ยน)
+MARKETS_MAX_AGE = 6 * 3600             # ใช้ market จาก snapshot แทน load_markets() ถ้า snapshot ใหม่กว่านี้
+
 LOOP_SEC = 10
+ADAPTIVE_LOOP = True                   # True = เวลาตื่นตามสภาพตลาด (ใกล้ band/SL/TP ถี่ขึ้น, ปิดแท่ง, NW freeze หมดอายุ)
+MIN_LOOP_SEC = 2                       # ถี่สุดเมื่อราคาชิดระดับ
+IDLE_LOOP_SEC = 30                     # ห่างสุดเมื่อไม่มี position/pending และราคาอยู่ไกล band
+USE_STREAM = False                     # True = WebSocket (kline/ราคา/position) ปลุก loop ทุก event, LOOP_SEC เป็นแค่ timeout
+STREAM_RECORD_FILE = None              # path สำหรับบันทึกข้อความ stream ไว้ replay
+CANDLE_LIMIT = 600 if USE_REPAINT else 1000   # endpoint ต้องมีประวัติ ~2x window ให้ MAE ตรงกับ backtest
+MACD_CANDLE_LIMIT = 200
+EMA_CANDLE_LIMIT = 600                 # window ที่ใช้ seed EMA trend (ตาม fetch_ohlcv(limit=600) เดิม)
 LOG_LEVEL = logging.INFO
+METRICS_PORT = None                    # เช่น 9108 -> http://127.0.0.1:9108/metrics (Prometheus) และ /metrics.json
+METRICS_JSON_FILE = None               # path สำหรับ dump metrics เป็น JSON ทุก METRICS_JSON_SEC
+METRICS_JSON_SEC = 60
 
 TELEGRAM_TOKEN   = os.getenv("TELEGRAM_TOKEN", "YOUR_TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "YOUR_CHAT_ID")
+TG_SPOOL_FILE    = "tg_unsent.json"      # ข้อความที่ยังส่งไม่สำเร็จ (ส่งต่อหลัง restart)
 
 # ============================================================
 # Logging & Telegram
@@ -70,98 +101,81 @@ logging.basicConfig(
 )
 log = logging.getLogger("main")
 
+notifier = None                        # สร้างตอนใช้จริง: tool ที่ import main (backtest/sweep/archive/runner) ไม่แตะ spool ของบอท
+
+def start_notifier():
+    global notifier
+    if notifier is None:
+        notifier = Notifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, spool_path=TG_SPOOL_FILE)
+    return notifier
+
 def tg(msg):
-    if not TELEGRAM_TOKEN or TELEGRAM_TOKEN.startswith("YOUR"):
-        return
-    try:
-        requests.get(
-            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-            params={"chat_id": TELEGRAM_CHAT_ID, "text": msg}
-        )
-    except:
-        pass
+    start_notifier().send(msg)
 
 # ============================================================
 # Exchange Setup
 # ============================================================
-def setup_exchange():
+def setup_exchange(snap=None):
     ex = ccxt.binance({
         "apiKey": API_KEY,
         "secret": SECRET,
         "enableRateLimit": True,
         "options": {"defaultType": "future"}
     })
-    ex.load_markets()
-    try:
-        ex.set_leverage(LEVERAGE, SYMBOL)
-    except Exception as e:
-        log.warning(f"set_leverage warn: {e}")
+    instrument(ex)
+    snap = snap or {}
+    if snap.get("market") and time.time() - snap.get("_saved", 0) < MARKETS_MAX_AGE:
+        ex.set_markets([snap["market"]])         # warm restart: ไม่ต้องโหลด exchangeInfo ทั้งก้อน
+    else:
+        with metrics.phase("load_markets"):
+            ex.load_markets()
+    if snap.get("leverage") != LEVERAGE:
+        try:
+            ex.set_leverage(LEVERAGE, SYMBOL)
+        except Exception as e:
+            log.warning(f"set_leverage warn: {e}")
     return ex
 
+def exchange_position(ex):
+    """(contracts, side, entry) ของ SYMBOL บน exchange; ไม่มี position -> (0.0, None, None)"""
+    with metrics.phase("positions"):
+        pos_list = ex.fetch_positions([SYMBOL])
+    for p in pos_list:
+        if p.get("symbol") == SYMBOL and float(p.get("contracts") or 0) != 0:
+            return float(p["contracts"]), p.get("side"), float(p.get("entryPrice") or 0.0)
+    return 0.0, None, None
+
 # ============================================================
 # Indicators
 # ============================================================
 def ema(series, period):
-    if len(series) < period:
-        return None
-    k = 2 / (period + 1)
-    e = sum(series[:period]) / period
-    for v in series[period:]:
-        e = v * k + e * (1 - k)
-    return e
+    return indicators.ema(series, period)
 
 def nwe_luxalgo_repaint(closes, h=NW_BANDWIDTH, mult=NW_MULT, factor=NW_FACTOR):
-    n = len(closes)
-    if n < 200:
-        return None, None, None
-    win = min(499, n - 1)
-    coefs = [math.exp(-(i * i) / (2 * (h ** 2))) for i in range(win)]
-    den = sum(coefs)
-    num = sum(closes[-1 - j] * coefs[j] for j in range(win))
-    mean = num / den
-    win_s = int(h * 10)
-    win_s = min(win_s, win - 1)
-    diffs = [abs(closes[-1 - i] - closes[-1 - i - 1]) for i in range(1, win_s)]
-    mae = (sum(diffs) / len(diffs)) * mult * factor if diffs else 0.0
-    return mean + mae, mean - mae, mean
+    return get_engine(h, mult, factor).envelope(closes)
 
 def macd(closes, fast=12, slow=26, signal=9):
-    if len(closes) < slow + signal + 5:
-        return None
-    kf = 2 / (fast + 1)
-    e = sum(closes[:fast]) / fast
-    ef = [None]*(fast-1) + [e]
-    for v in closes[fast:]:
-        e = v*kf + e*(1-kf)
-        ef.append(e)
-    ks = 2 / (slow + 1)
-    e = sum(closes[:slow]) / slow
-    es = [None]*(slow-1) + [e]
-    for v in closes[slow:]:
-        e = v*ks + e*(1-ks)
-        es.append(e)
-    dif = []
-    for a,b in zip(ef, es):
-        if a is not None and b is not None:
-            dif.append(a-b)
-        else:
-            dif.append(None)
-    dif_clean = [x for x in dif if x is not None]
-    if len(dif_clean) < signal+5:
-        return None
-    ks2 = 2/(signal+1)
-    e = sum(dif_clean[:signal]) / signal
-    dea = [None]*(signal-1) + [e]
-    for v in dif_clean[signal:]:
-        e = v*ks2 + e*(1-ks2)
-        dea.append(e)
-    return dif_clean[-2], dif_clean[-1], dea[-2], dea[-1]
-
-def macd_up(dp,dn,ep,en):   # ตัดขึ้น
-    return dp <= ep and dn > en
-
-def macd_down(dp,dn,ep,en): # ตัดลง
-    return dp >= ep and dn < en
+    return indicators.macd(closes, fast, slow, signal)
+
+# streaming state ที่ loop ใช้: seed จาก cache ครั้งแรก แล้ว sync() O(1) ต่อแท่งปิด, แท่งที่ยังไม่ปิดเป็น tentative
+_live = {}
+
+def live_ema(cache, period):
+    """EMA รวมแท่งที่ยังไม่ปิด (seed จาก EMA_CANDLE_LIMIT แท่งล่าสุด)"""
+    st = _live.get(("ema", cache.timeframe, period))
+    if st is None:
+        st = _live[("ema", cache.timeframe, period)] = EMAState(period)
+    rows = cache.view(EMA_CANDLE_LIMIT)
+    st.sync(rows[:-1, TS], rows[:-1, CLOSE])
+    return st.tentative(float(rows[-1, CLOSE]))
+
+def live_macd(ex, timeframe):
+    """MACD ของแท่งปิดล่าสุดบน timeframe (seed จาก MACD_CANDLE_LIMIT แท่งล่าสุด)"""
+    rows = get_cache(ex, SYMBOL, timeframe, MACD_CANDLE_LIMIT).refresh().view(MACD_CANDLE_LIMIT)
+    st = _live.get(("macd", timeframe))
+    if st is None:
+        st = _live[("macd", timeframe)] = MACDState()
+    return st.sync(rows[:-1, TS], rows[:-1, CLOSE]).snapshot()
 
 # ============================================================
 # Position sizing
@@ -180,23 +194,51 @@ def order_size(ex, price):
     except:
         return round(qty, 3)
 
+class LiveBroker:
+    """broker ของ NWStrategy บน exchange จริง (ราคาจาก stream ถ้ามีและยังสด)"""
+
+    def __init__(self, ex, stream=None):
+        self.ex = ex
+        self.stream = stream
+        self.protective = ProtectiveOrders(ex, SYMBOL, log) if NATIVE_STOPS else None
+
+    def last_price(self):
+        p = self.stream.price() if self.stream else None
+        return p if p is not None else self.ex.fetch_ticker(SYMBOL)["last"]
+
+    def macd(self, timeframe):
+        return live_macd(self.ex, timeframe)
+
+    def order_size(self, price):
+        with metrics.phase("order_size"):
+            return order_size(self.ex, price)
+
+    def market_order(self, side, qty, reduce_only=False):
+        params = {"newOrderRespType": "RESULT"}          # ให้ได้ avgPrice ที่ fill จริงกลับมา
+        if reduce_only:
+            params["reduceOnly"] = True
+        o = self.ex.create_market_order(SYMBOL, side, qty, params=params)
+        if self.stream:
+            self.stream.invalidate_position()
+        return o
+
 # ============================================================
 # Monthly Stats (แทน Daily Stats เดิม)
 # ============================================================
+journal = None
+
 def load_stats():
-    if os.path.exists(STATS_FILE):
+    global journal
+    journal = Journal(JOURNAL_FILE)
+    if journal.empty() and os.path.exists(STATS_FILE):
         try:
-            return json.load(open(STATS_FILE,"r"))
-        except:
-            pass
-    return {
-        "month": datetime.now().strftime("%Y-%m"),
-        "pnl": 0.0,
-        "trades": []   # list of dict: {time, side, entry, exit, pnl, reason}
-    }
+            journal.import_stats(json.load(open(STATS_FILE,"r")), os.path.getmtime(STATS_FILE))
+        except Exception as e:
+            log.warning(f"import {STATS_FILE} failed: {e}")
+    return journal.stats
 
 def save_stats(s):
-    json.dump(s, open(STATS_FILE,"w"), indent=2)
+    journal.commit()     # เขียนเฉพาะ trade ใหม่ (ไม่มี trade = ไม่แตะ disk)
 
 def has_sent_today():
     if not os.path.exists(REPORT_SENT_FILE):
@@ -210,10 +252,7 @@ def mark_sent_today():
 def reset_report_if_new_month(stats):
     this_month = datetime.now().strftime("%Y-%m")
     if stats.get("month") != this_month:
-        stats["month"] = this_month
-        stats["pnl"] = 0.0
-        stats["trades"] = []
-        save_stats(stats)
+        journal.roll(this_month)
         open(REPORT_SENT_FILE,"w").write("")
 
 def try_send_monthly_report(stats):
@@ -224,9 +263,7 @@ def try_send_monthly_report(stats):
     if has_sent_today():
         return
 
-    tp_count = sum(1 for t in stats["trades"] if t.get("reason","").startswith("TP"))
-    sl_count = sum(1 for t in stats["trades"] if t.get("reason","") == "SL")
-    be_count = sum(1 for t in stats["trades"] if t.get("reason","") == "BE")
+    tp_count, sl_count, be_count = reason_counts(journal.month(stats["month"]))
     total_pnl = stats["pnl"]
 
     lines = [
@@ -238,272 +275,142 @@ def try_send_monthly_report(stats):
     mark_sent_today()
     log.info("📨 Monthly report sent.")
 
+# ============================================================
+# Loop scheduling
+# ============================================================
+def next_wake(sched, strategy, price, upper, lower, mid, freeze_at):
+    """วินาทีถึงรอบถัดไป: ระดับที่ต้องเฝ้า = band + SL/TP/mid (BE) ของ position, ตื่นตอนปิดแท่งที่ใช้ตัดสิน"""
+    if not ADAPTIVE_LOOP:
+        return LOOP_SEC
+    pos = strategy.position
+    levels = [upper, lower]
+    tfs = [TIMEFRAME]
+    if pos:
+        levels += [pos["sl"], pos["tp"], mid]
+        if USE_BREAKEVEN_MACD:
+            tfs.append(BREAKEVEN_MACD_TF)
+    if MACD_ENABLED:
+        tfs.append(MACD_TF)
+    return sched.delay(price, levels, active=pos is not None or strategy.pending is not None,
+                       timeframes=tfs, deadlines=[freeze_at] if USE_REPAINT else ())
+
 # ============================================================
 # Main Loop
 # ============================================================
 def main():
-    ex = setup_exchange()
+    start_notifier()                   # ส่งข้อความที่ค้างใน spool จากรอบก่อน
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    if METRICS_JSON_FILE:
+        metrics.dump_every(METRICS_JSON_FILE, METRICS_JSON_SEC)
+    t0 = time.perf_counter()
+    snap, snap_rows = snapshot.load(STATE_FILE)
+    ex = setup_exchange(snap)
+    use_base_timeframe(BASE_TF)
+    snapshot.restore_caches(ex, snap_rows)
     log.info(f"✅ Started Binance Futures NW Bot ({TIMEFRAME}, MACD={MACD_TF}, USE_MID_AS_TP={USE_MID_AS_TP})")
 
     stats = load_stats()
-
-    position = None          # {"side","qty","entry","sl","tp"}
-    sl_lock = False
-    pending = None           # {"side","touch_price","lower","upper","mid","ts"}
+    stream = None
+    if USE_STREAM:
+        stream = MarketStream(ex, SYMBOL, [TIMEFRAME, MACD_TF, BREAKEVEN_MACD_TF],
+                              {TIMEFRAME: CANDLE_LIMIT, MACD_TF: MACD_CANDLE_LIMIT, BREAKEVEN_MACD_TF: MACD_CANDLE_LIMIT},
+                              record_path=STREAM_RECORD_FILE).start()
+    sleep = stream.wait if stream else time.sleep
+    strategy = NWStrategy(config_from(globals()), LiveBroker(ex, stream), stats, notify=tg, log=log)
 
     last_nw_update = 0
     upper = lower = mid = None
+    if snap and USE_REPAINT and snap.get("bands"):
+        upper, lower, mid = snap["bands"]
+        last_nw_update = snap["last_nw_update"]
+    restoring = True                 # tick แรก: เทียบ state จาก snapshot กับ position จริงก่อนตัดสินใจ
+    snapper = snapshot.Snapshotter(STATE_FILE, STATE_SAVE_SEC)
+    sched = Scheduler(LOOP_SEC, MIN_LOOP_SEC, IDLE_LOOP_SEC)
+    if snap:
+        log.info(f"♻ restored snapshot ({len(snap_rows)} caches) in {time.perf_counter() - t0:.3f}s")
+    nw_live = None if USE_REPAINT else NWEndpoint(NW_BANDWIDTH, NW_MULT, NW_FACTOR)
 
     while True:
         try:
+            metrics.mark_tick()
+            if stream:
+                with metrics.phase("stream_sync"):
+                    stream.sync()
             reset_report_if_new_month(stats)
             try_send_monthly_report(stats)
 
             # TF main
-            candles = ex.fetch_ohlcv(SYMBOL, TIMEFRAME, limit=600)
-            closes = [c[4] for c in candles]
+            with metrics.phase("candles"):
+                cache = get_cache(ex, SYMBOL, TIMEFRAME, CANDLE_LIMIT).refresh()
+            closes = cache.closes()
             last_close = closes[-1]
 
             # EMA Trend (if enabled)
-            e_fast = ema(closes, EMA_FAST) if EMA_ENABLED else None
-            e_slow = ema(closes, EMA_SLOW) if EMA_ENABLED else None
+            with metrics.phase("ema"):
+                e_fast = live_ema(cache, EMA_FAST) if EMA_ENABLED else None
+                e_slow = live_ema(cache, EMA_SLOW) if EMA_ENABLED else None
             if EMA_ENABLED and (e_fast is None or e_slow is None):
-                time.sleep(LOOP_SEC); continue
-            trend = "BUY" if EMA_ENABLED and e_fast > e_slow else "SELL" if EMA_ENABLED else None
+                sleep(LOOP_SEC); continue
 
-            # NW freeze
+            # NW: endpoint (non-repaint) -> คำนวณทุก tick / repaint -> freeze
             now_ts = time.time()
-            if "m" in TIMEFRAME:
-                tf_minutes = int(TIMEFRAME.replace("m",""))
-            else:
-                tf_minutes = int(TIMEFRAME.replace("h","")) * 60
-            freeze_sec = tf_minutes * 60 * UPDATE_FRACTION
+            freeze_sec = Timeframe(TIMEFRAME).seconds * UPDATE_FRACTION
 
-            if upper is None or now_ts - last_nw_update > freeze_sec:
-                u,l,m = nwe_luxalgo_repaint(closes)
+            if not USE_REPAINT:
+                with metrics.phase("nw"):
+                    nw_live.sync(cache.column(TS)[:-1], closes[:-1])
+                    u,l,m = nw_live.peek(last_close)
+                if u is None:
+                    log.info("[DEBUG] NW not ready"); sleep(LOOP_SEC); continue
+                upper,lower,mid = u,l,m
+                last_nw_update = now_ts
+            elif upper is None or now_ts - last_nw_update > freeze_sec:
+                with metrics.phase("nw"):
+                    u,l,m = nwe_luxalgo_repaint(closes)
                 if u is None:
-                    log.info("[DEBUG] NW not ready"); time.sleep(LOOP_SEC); continue
+                    log.info("[DEBUG] NW not ready"); sleep(LOOP_SEC); continue
                 upper,lower,mid = u,l,m
                 last_nw_update = now_ts
                 log.info(f"[DEBUG] NW updated: U={upper:.2f}, L={lower:.2f}, M={mid:.2f}")
             else:
                 log.info("[DEBUG] Using previous NW band (frozen)")
 
-            # MACD small TF for entry confirm
-            macd_side_ok = None
-            if MACD_ENABLED:
-                small = ex.fetch_ohlcv(SYMBOL, MACD_TF, limit=200)
-                mcloses = [c[4] for c in small[:-1]]
-                mac = macd(mcloses)
-                if mac:
-                    dp,dn,ep,en = mac
-                    if EMA_ENABLED:
-                        macd_side_ok = macd_up(dp,dn,ep,en) if trend=="BUY" else macd_down(dp,dn,ep,en)
-                    else:
-                        macd_side_ok = True
-
-            # Read live position on exchange
-            try:
-                pos_list = ex.fetch_positions([SYMBOL])
-                amt = 0.0; live_side = None
-                for p in pos_list:
-                    if p.get("symbol") == SYMBOL and float(p.get("contracts") or 0) != 0:
-                        amt = float(p["contracts"])
-                        live_side = p["side"]
-                        break
-            except:
-                amt=0.0; live_side=None
-
-            if amt == 0 and position is not None:
-                log.info("⚠ Position disappeared on exchange, reset local state.")
-                position = None
-
-            # ---------------- MANAGE OPEN POSITION ----------------
-            if position and amt > 0:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                side = position["side"]
-                entry = position["entry"]
-                sl = position["sl"]
-                tp = position.get("tp")
-
-                # --- Breakeven via MACD experimental (if enabled) ---
-                if USE_BREAKEVEN_MACD:
-                    try:
-                        small_be = ex.fetch_ohlcv(SYMBOL, BREAKEVEN_MACD_TF, limit=200)
-                        be_closes = [c[4] for c in small_be[:-1]]
-                        mac_be = macd(be_closes)
-                        if mac_be:
-                            dp,dn,ep,en = mac_be
-                            if side == "long" and macd_down(dp,dn,ep,en):
-                                unreal = (last_close - entry) * position["qty"]
-                                if unreal > 0:
-                                    if position["sl"] < entry + BREAKEVEN_OFFSET:
-                                        position["sl"] = entry + BREAKEVEN_OFFSET
-                                else:
-                                    pnl = (last_price-entry)*position["qty"]
-                                    stats["pnl"] += pnl
-                                    stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"LONG","entry": entry,"exit": last_price,"pnl": pnl,"reason": "SL"})
-                                    ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                                    position=None; sl_lock=True; save_stats(stats); time.sleep(LOOP_SEC); continue
-                            if side == "short" and macd_up(dp,dn,ep,en):
-                                unreal = (entry-last_close) * position["qty"]
-                                if unreal > 0:
-                                    if position["sl"] > entry - BREAKEVEN_OFFSET:
-                                        position["sl"] = entry - BREAKEVEN_OFFSET
-                                else:
-                                    pnl = (entry-last_price)*position["qty"]
-                                    stats["pnl"] += pnl
-                                    stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"SHORT","entry": entry,"exit": last_price,"pnl": pnl,"reason": "SL"})
-                                    ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                                    position=None; sl_lock=True; save_stats(stats); time.sleep(LOOP_SEC); continue
-                    except Exception as e:
-                        log.debug(f"[BE_MACD] fetch error: {e}")
-
-                # --- SL Touch ---
-                if side=="long" and last_price <= sl:
-                    reason = "BE" if abs(sl - (entry + BREAKEVEN_OFFSET)) < 1e-6 else "SL"
-                    pnl = (last_price-entry)*position["qty"]
-                    stats["pnl"] += pnl
-                    stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"LONG","entry": entry,"exit": last_price,"pnl": pnl,"reason": reason})
-                    ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                    tg(f"🚨 LONG {reason} {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                    position=None; sl_lock=True; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                if side=="short" and last_price >= sl:
-                    reason = "BE" if abs(sl - (entry - BREAKEVEN_OFFSET)) < 1e-6 else "SL"
-                    pnl = (entry-last_price)*position["qty"]
-                    stats["pnl"] += pnl
-                    stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"SHORT","entry": entry,"exit": last_price,"pnl": pnl,"reason": reason})
-                    ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                    tg(f"🚨 SHORT {reason} {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                    position=None; sl_lock=True; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- TP ---
-                if tp is not None:
-                    if side=="long" and last_price >= tp:
-                        pnl = (last_price-entry)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"LONG","entry": entry,"exit": last_price,"pnl": pnl,"reason": "TP_mid" if USE_MID_AS_TP else "TP_upper"})
-                        ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                        tg(f"✅ LONG TP @ {last_price:.2f} PnL={pnl:+.2f}")
-                        position=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="short" and last_price <= tp:
-                        pnl = (entry-last_price)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"SHORT","entry": entry,"exit": last_price,"pnl": pnl,"reason": "TP_mid" if USE_MID_AS_TP else "TP_lower"})
-                        ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                        tg(f"✅ SHORT TP @ {last_price:.2f} PnL={pnl:+.2f}")
-                        position=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- EMA flip TP mid ---
-                if EMA_ENABLED:
-                    trend_now = "BUY" if e_fast > e_slow else "SELL"
-                    if side=="long" and trend_now=="SELL" and last_price <= mid:
-                        pnl = (last_price-entry)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"LONG","entry": entry,"exit": last_price,"pnl": pnl,"reason": "TP_mid_trend_flip"})
-                        ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                        position=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="short" and trend_now=="BUY" and last_price >= mid:
-                        pnl = (entry-last_price)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({"time": datetime.now().strftime("%H:%M:%S"),"side":"SHORT","entry": entry,"exit": last_price,"pnl": pnl,"reason": "TP_mid_trend_flip"})
-                        ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                        position=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- Breakeven via mid ---
-                if not USE_BREAKEVEN_MACD and USE_BREAKEVEN and not sl_lock:
-                    if side=="long" and last_close > mid and position["sl"] < entry + BREAKEVEN_OFFSET:
-                        position["sl"] = entry + BREAKEVEN_OFFSET
-                    if side=="short" and last_close < mid and position["sl"] > entry - BREAKEVEN_OFFSET:
-                        position["sl"] = entry - BREAKEVEN_OFFSET
-
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            # ---------------- NO POSITION ----------------
-            if sl_lock:
-                if (last_close > mid) or (last_close < mid):
-                    sl_lock=False
-                    log.info("🔓 SL Lock released")
-                time.sleep(LOOP_SEC)
-                continue
-
-            # 1) pending from touch -> wait MACD confirm
-            if MACD_ENABLED and pending is not None:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                side = pending["side"]
-                p_lower = pending["lower"]
-                p_upper = pending["upper"]
-                p_mid   = pending["mid"]
-
-                if macd_side_ok:
-                    if not EMA_ENABLED:
-                        small = ex.fetch_ohlcv(SYMBOL, MACD_TF, limit=200)
-                        mcloses = [c[4] for c in small[:-1]]
-                        mac = macd(mcloses)
-                        if mac:
-                            dp,dn,ep,en = mac
-                            if side=="long" and not macd_up(dp,dn,ep,en):
-                                pending=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-                            if side=="short" and not macd_down(dp,dn,ep,en):
-                                pending=None; save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="long":
-                        if last_price < p_lower or last_price > p_mid:
-                            pending=None
-                        else:
-                            qty = order_size(ex, last_price)
-                            ex.create_market_order(SYMBOL,"buy",qty)
-                            tp_val = p_mid if USE_MID_AS_TP else (p_upper - TP_BUFFER)
-                            position={"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
-                            pending=None
-                    else:
-                        if last_price > p_upper or last_price < p_mid:
-                            pending=None
-                        else:
-                            qty = order_size(ex, last_price)
-                            ex.create_market_order(SYMBOL,"sell",qty)
-                            tp_val = p_mid if USE_MID_AS_TP else (p_lower + TP_BUFFER)
-                            position={"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
-                            pending=None
-
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            # 2) no pending -> detect new NW touch
-            if (not EMA_ENABLED or (EMA_ENABLED and trend=="BUY")) and last_close <= lower:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                if MACD_ENABLED:
-                    pending = {"side":"long","touch_price": last_price,"lower": lower,"upper": upper,"mid": mid,"ts": now_ts}
-                else:
-                    qty = order_size(ex, last_price)
-                    tp_val = mid if USE_MID_AS_TP else (upper - TP_BUFFER)
-                    ex.create_market_order(SYMBOL,"buy",qty)
-                    position={"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
-                save_stats(stats); time.sleep(LOOP_SEC); continue
-
-            if (not EMA_ENABLED or (EMA_ENABLED and trend=="SELL")) and last_close >= upper:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                if MACD_ENABLED:
-                    pending = {"side":"short","touch_price": last_price,"lower": lower,"upper": upper,"mid": mid,"ts": now_ts}
-                else:
-                    qty = order_size(ex, last_price)
-                    tp_val = mid if USE_MID_AS_TP else (lower + TP_BUFFER)
-                    ex.create_market_order(SYMBOL,"sell",qty)
-                    position={"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
-                save_stats(stats); time.sleep(LOOP_SEC); continue
+            # Read live position on exchange (user stream ถ้ามี)
+            amt = stream.position_amt() if stream and not restoring else None
+            if amt is None:
+                try:
+                    amt, side, entry = exchange_position(ex)
+                except:
+                    if restoring:
+                        raise        # ต้องรู้ position จริงก่อนคืน state
+                    amt=0.0
+
+            if restoring:
+                how = strategy.restore((snap or {}).get("strategy"), side, amt, entry, mid, upper, lower)
+                restoring = False
+                if how == "adopted":
+                    tg(f"♻ รับ {side.upper()} {amt:g} @ {entry:.2f} ที่ค้างบน exchange มาดูแลต่อ (SL {strategy.position['sl']:.2f})")
+                log.info(f"♻ state {how}: position={strategy.position} pending={strategy.pending}")
+
+            with metrics.phase("step"):
+                strategy.step(now_ts, last_close, upper, lower, mid, amt, e_fast, e_slow)
 
             save_stats(stats)
-            time.sleep(LOOP_SEC)
+            if STATE_FILE:
+                st = strategy.snapshot()
+                snapper.update({"strategy": st, "bands": [upper, lower, mid], "last_nw_update": last_nw_update,
+                                "market": ex.market(SYMBOL), "leverage": LEVERAGE}, ex, key=st)
+            metrics.observe("tick_seconds", time.perf_counter() - metrics.tick_t0)
+            sched.success()
+            wait = next_wake(sched, strategy, last_close, upper, lower, mid, last_nw_update + freeze_sec)
+            metrics.set("next_wake_seconds", wait)
+            sleep(wait)
 
         except Exception as e:
             log.exception(f"loop error: {e}")
-            time.sleep(2)
+            metrics.inc("loop_errors_total")
+            time.sleep(sched.failure())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# metrics.py
+# ตัวนับ / เวลาต่อ phase / latency ต่อ endpoint ของ exchange สำหรับหาว่า loop เสียเวลาไปที่ไหน
+# ดูผ่าน HTTP (Prometheus text format: /metrics, JSON: /metrics.json) หรือ dump เป็นไฟล์ JSON เป็นระยะ
+#
+# overhead: inc/observe เป็นแค่ dict lookup + บวกเลข (ไม่มี lock; GIL พอสำหรับตัวนับแบบนี้)
+#           timer ถูก cache ต่อ (ชื่อ, labels) ไม่สร้าง object ใหม่ทุกครั้ง
+
+import os, json, time, bisect, logging, threading
+
+# วินาที: ครอบตั้งแต่คำนวณใน process (~10us) ถึง REST ที่ช้ามาก
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WINDOW = 1024                # จำนวนค่าล่าสุดที่ใช้คิด quantile แบบ rolling
+
+# endpoint ของ ccxt ที่ instrument() ห่อ (ไม่ห่อ create_market_order / load_markets
+# เพราะ ccxt เรียก create_order / load_markets ต่อภายใน -> จะนับซ้ำ)
+ENDPOINTS = ("fetch_ohlcv", "fetch_ticker", "fetch_positions", "fetch_balance", "create_order",
+             "cancel_order", "fetch_order", "fetch_open_orders", "set_leverage")
+
+# Binance USDⓈ-M IP request weight (order นับแยกใน order rate limit -> weight 0)
+ENDPOINT_WEIGHT = {"fetch_ticker": 1, "fetch_positions": 5, "fetch_balance": 5, "create_order": 0,
+                   "cancel_order": 1, "fetch_order": 1, "fetch_open_orders": 1, "set_leverage": 1}
+
+log = logging.getLogger("metrics")
+
+def kline_weight(limit):
+    """weight ของ GET /fapi/v1/klines ตาม limit"""
+    limit = limit or 500
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+def request_weight(endpoint, args, kwargs):
+    if endpoint == "fetch_ohlcv":
+        limit = kwargs.get("limit", args[3] if len(args) > 3 else None)
+        return kline_weight(limit)
+    return ENDPOINT_WEIGHT.get(endpoint, 1)
+
+def header(headers, name):
+    name = name.lower()
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+class Histogram:
+    """Prometheus histogram (สะสม) + ring ของค่าล่าสุด WINDOW ค่าสำหรับ p50/p90/p99"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_ring", "_i")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # ช่องสุดท้าย = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._ring = [0.0] * WINDOW
+        self._i = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+        self._ring[self._i % WINDOW] = v
+        self._i += 1
+
+    def quantiles(self, qs=(0.5, 0.9, 0.99)):
+        vals = sorted(self._ring[:min(self._i, WINDOW)])
+        if not vals:
+            return {}
+        return {f"p{int(q * 100)}": vals[min(len(vals) - 1, int(q * len(vals)))] for q in qs}
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+class Metrics:
+    """Registry ของ counter / gauge / histogram; key = (ชื่อ, labels tuple ของ (k, v))"""
+
+    def __init__(self, prefix="bot"):
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.hists = {}
+        self._timers = {}
+        self.tick_t0 = None          # perf_counter ตอนเริ่ม tick ปัจจุบัน (mark_tick)
+        self.started = time.time()
+
+    # ---------------- record ----------------
+    def inc(self, name, v=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + v
+
+    def set(self, name, v, labels=()):
+        self.gauges[(name, labels)] = v
+
+    def hist(self, name, labels=()):
+        h = self.hists.get((name, labels))
+        if h is None:
+            h = self.hists[(name, labels)] = Histogram()
+        return h
+
+    def observe(self, name, v, labels=()):
+        self.hist(name, labels).observe(v)
+
+    def timer(self, name, labels=()):
+        """with metrics.timer(...): เวลาเข้า histogram (ไม่ reentrant ต่อ key เดียวกัน)"""
+        key = (name, labels)
+        t = self._timers.get(key)
+        if t is None:
+            t = self._timers[key] = _Timer(self.hist(name, labels))
+        return t
+
+    def phase(self, name):
+        return self.timer("phase_seconds", (("phase", name),))
+
+    def mark_tick(self):
+        self.tick_t0 = time.perf_counter()
+        self.inc("ticks_total")
+
+    # ---------------- export ----------------
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = tuple(labels) + tuple(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    def prometheus(self):
+        p = self.prefix
+        out = []
+        typed = set()
+
+        def typ(name, kind):
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {p}_{name} {kind}")
+
+        for (name, labels), v in sorted(self.counters.items()):
+            typ(name, "counter")
+            out.append(f"{p}_{name}{self._labels(labels)} {v}")
+        for (name, labels), v in sorted(self.gauges.items()):
+            typ(name, "gauge")
+            out.append(f"{p}_{name}{self._labels(labels)} {v}")
+        for (name, labels), h in sorted(self.hists.items(), key=lambda kv: kv[0]):
+            typ(name, "histogram")
+            acc = 0
+            for le, c in zip(h.buckets + ("+Inf",), h.counts):
+                acc += c
+                out.append(f"{p}_{name}_bucket{self._labels(labels, (('le', le),))} {acc}")
+            out.append(f"{p}_{name}_sum{self._labels(labels)} {h.sum}")
+            out.append(f"{p}_{name}_count{self._labels(labels)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def snapshot(self):
+        key = lambda name, labels: name + self._labels(labels)
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "counters": {key(*k): v for k, v in self.counters.items()},
+            "gauges": {key(*k): v for k, v in self.gauges.items()},
+            "histograms": {key(*k): dict(count=h.count, sum=h.sum, **h.quantiles()) for k, h in self.hists.items()},
+        }
+
+    def serve(self, port, host="127.0.0.1"):
+        """HTTP server (daemon thread): /metrics (Prometheus) และ /metrics.json -> คืน server"""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        m = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, ctype = json.dumps(m.snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = m.prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404); return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        log.info(f"metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def dump(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+
+    def dump_every(self, path, sec=60):
+        def loop():
+            while True:
+                time.sleep(sec)
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    log.warning(f"metrics dump error: {e}")
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+metrics = Metrics()
+
+def instrument(ex, m=metrics):
+    """ห่อ method REST ของ ccxt client (sync) ใน ENDPOINTS: จำนวนครั้ง, error, latency, weight
+    และ tick_to_order_seconds (จาก mark_tick() ถึง order ได้รับ ack) ทุกครั้งที่ create_order"""
+    for name in ENDPOINTS:
+        fn = getattr(ex, name, None)
+        if fn is None:
+            continue
+        setattr(ex, name, _wrap(ex, m, name, fn))
+    return ex
+
+def _wrap(ex, m, name, fn):
+    labels = (("endpoint", name),)
+    hist = m.hist("request_seconds", labels)
+
+    def wrapped(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            m.inc("request_errors_total", 1, labels)
+            raise
+        finally:
+            t1 = time.perf_counter()
+            hist.observe(t1 - t0)
+            m.inc("requests_total", 1, labels)
+            m.inc("request_weight_total", request_weight(name, args, kwargs), labels)
+            used = header(getattr(ex, "last_response_headers", None), "X-MBX-USED-WEIGHT-1M")
+            if used:
+                m.set("used_weight_1m", int(used))
+            if name == "create_order" and m.tick_t0 is not None:
+                m.observe("tick_to_order_seconds", t1 - m.tick_t0)
+    return wrapped
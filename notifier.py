@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# notifier.py
+# Telegram แบบไม่บล็อก loop เทรด: send() แค่ append เข้าคิว (O(1)) แล้ว worker thread ส่งให้
+# ผ่าน requests.Session (keep-alive) รวมข้อความที่มาติดกันเป็นข้อความเดียว, retry + backoff
+# ข้อความที่ยังส่งไม่ได้ถูกเขียนลง spool file แล้วส่งต่อตอนเริ่มรอบหน้า
+
+import os, re, json, time, random, atexit, logging, threading
+from collections import deque
+
+import requests
+
+TELEGRAM_API = "https://api.telegram.org"
+MAX_TEXT = 4096              # ความยาวสูงสุดของ sendMessage
+MAX_BACKOFF = 60.0
+
+log = logging.getLogger("notifier")
+
+_TAG = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+
+def configured(token, chat_id):
+    return bool(token) and not token.startswith("YOUR") and bool(chat_id) and not str(chat_id).startswith("YOUR")
+
+class Notifier:
+    """คิวข้อความ Telegram ของบอท 1 ตัว
+
+    send(msg, tag)   ข้อความที่มี tag ซ้ำกับที่เคยส่งจะถูกข้าม (จนกว่า clear_sent(prefix))
+                     sent_tags() / restore_tags(tags) เก็บชุด tag ข้าม restart
+    stop()           รอส่งที่ค้างอยู่ไม่เกิน timeout แล้วเขียนที่เหลือลง spool
+    ถ้า token/chat_id ยังไม่ตั้ง: ไม่ส่ง แต่เรียก on_disabled(msg) (เช่น log) แทน
+    """
+
+    def __init__(self, token, chat_id, url=TELEGRAM_API, parse_mode=None, maxsize=256, coalesce_sec=1.0,
+                 spool_path=None, timeout=10, on_disabled=None, clock=time.monotonic):
+        self.token = token
+        self.chat_id = chat_id
+        self.url = url.rstrip("/")
+        self.parse_mode = parse_mode
+        self.coalesce_sec = coalesce_sec
+        self.spool_path = spool_path
+        self.timeout = timeout
+        self.on_disabled = on_disabled
+        self.clock = clock
+        self.enabled = configured(token, chat_id)
+
+        self.sent = 0                    # ข้อความ (ก่อนรวม) ที่ส่งสำเร็จ
+        self.requests = 0
+        self.dropped = 0                 # ถูกทิ้งเพราะคิวเต็ม / Telegram ปฏิเสธถาวร
+        self._q = deque(maxlen=maxsize)
+        self._tags = set()
+        self._cv = threading.Condition()
+        self._thread = None
+        self._stop = False
+        self._busy = False
+        self._session = None
+        if self.enabled:
+            self._q.extend(self._load_spool())
+            if self._q:
+                self.start()             # ข้อความค้างจากรอบก่อน (เช่น alert ก่อน crash) ส่งทันที ไม่ต้องรอ send() ครั้งถัดไป
+
+    # ================== thread ของบอท ==================
+    def send(self, msg, tag=None):
+        if tag:
+            if tag in self._tags:
+                return False
+            self._tags.add(tag)
+        if not self.enabled:
+            if self.on_disabled:
+                self.on_disabled(msg)
+            return False
+        if len(self._q) == self._q.maxlen:
+            self.dropped += 1            # deque(maxlen) ทิ้งข้อความเก่าสุดเอง
+        self._q.append(msg)
+        if self._thread is None:
+            self.start()
+        with self._cv:
+            self._cv.notify()
+        return True
+
+    def clear_sent(self, prefix):
+        for k in [k for k in self._tags if k.startswith(prefix)]:
+            self._tags.discard(k)
+
+    def sent_tags(self):
+        return sorted(self._tags)
+
+    def restore_tags(self, tags):
+        """tag ที่ส่งไปแล้วก่อน restart (กันข้อความเดิมซ้ำ)"""
+        self._tags.update(tags or ())
+
+    def start(self):
+        if self._thread is None and self.enabled:
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def flush(self, timeout=10.0):
+        """รอจนคิวว่าง (หรือหมดเวลา); คืน True ถ้าส่งหมด"""
+        end = self.clock() + timeout
+        while (self._q or self._busy) and self.clock() < end:
+            time.sleep(0.02)
+        return not self._q and not self._busy
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._stop = True
+        with self._cv:
+            self._cv.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        self._save_spool(list(self._q))
+
+    # ================== worker ==================
+    def _run(self):
+        self._session = requests.Session()
+        backoff = 1.0
+        batch = []
+        solo = 0                                     # จำนวนข้อความที่ต้องส่งทีละข้อความ (หลัง batch ถูกปฏิเสธ)
+        while not self._stop:
+            if not batch:
+                with self._cv:
+                    while not self._q and not self._stop:
+                        self._cv.wait(1.0)
+                if self._stop:
+                    break
+                self._busy = True
+                if solo:
+                    solo -= 1
+                    batch = [self._clip(self._q.popleft())]
+                else:
+                    time.sleep(self.coalesce_sec)    # ให้ข้อความชุดเดียวกันมาต่อท้ายก่อน
+                    batch = self._take()
+            ok, retry_after = self._post("\n\n".join(batch))
+            if ok is None:                           # Telegram ปฏิเสธถาวร (เช่น HTML ผิด)
+                if len(batch) > 1:                   # แยกส่งทีละข้อความ: ทิ้งเฉพาะข้อความที่ผิดเอง
+                    for m in reversed(batch):
+                        self._q.appendleft(m)
+                    solo = len(batch)
+                else:
+                    self.dropped += 1
+                batch = []
+            elif ok:
+                self.sent += len(batch)
+                batch = []
+                backoff = 1.0
+                if self.spool_path and os.path.exists(self.spool_path):
+                    self._save_spool(list(self._q))
+            else:
+                self._save_spool(batch + list(self._q))
+                delay = retry_after or backoff * (0.5 + random.random())
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                with self._cv:
+                    self._cv.wait_for(lambda: self._stop, delay)
+            self._busy = bool(batch) or bool(self._q)
+        if batch:
+            for m in reversed(batch):
+                self._q.appendleft(m)
+        self._busy = False
+        self._session.close()
+
+    def _take(self):
+        """ดึงข้อความจากหัวคิวให้ได้ยาวที่สุดไม่เกิน MAX_TEXT"""
+        batch, size = [], 0
+        while self._q:
+            m = self._clip(self._q[0])
+            if batch and size + 2 + len(m) > MAX_TEXT:
+                break
+            self._q.popleft()
+            batch.append(m)
+            size += len(m) + (2 if size else 0)
+        return batch
+
+    def _clip(self, msg):
+        """ตัดข้อความที่ยาวเกิน MAX_TEXT; HTML ไม่ตัดกลาง tag / entity และปิด tag ที่ค้างให้ครบ"""
+        if len(msg) <= MAX_TEXT:
+            return msg
+        if (self.parse_mode or "").upper() != "HTML":
+            return msg[:MAX_TEXT]
+        cut = MAX_TEXT - 1
+        while True:
+            head = msg[:cut]
+            if head.rfind("<") > head.rfind(">"):
+                head = head[:head.rfind("<")]
+            if head.rfind("&") > head.rfind(";"):
+                head = head[:head.rfind("&")]
+            stack = []
+            for m in _TAG.finditer(head):
+                if not m.group(1):
+                    stack.append(m.group(2).lower())
+                elif m.group(2).lower() in stack:
+                    del stack[len(stack) - 1 - stack[::-1].index(m.group(2).lower()):]
+            out = head + "…" + "".join(f"</{t}>" for t in reversed(stack))
+            if len(out) <= MAX_TEXT:
+                return out
+            cut -= len(out) - MAX_TEXT
+
+    def _post(self, text):
+        """(True, None) สำเร็จ | (False, retry_after) ลองใหม่ | (None, None) ทิ้ง"""
+        data = {"chat_id": self.chat_id, "text": text}
+        if self.parse_mode:
+            data["parse_mode"] = self.parse_mode
+        self.requests += 1
+        try:
+            r = self._session.post(f"{self.url}/bot{self.token}/sendMessage", json=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning(f"TG error: {e}")
+            return False, None
+        if r.status_code == 200:
+            return True, None
+        if r.status_code == 429 or r.status_code >= 500:
+            try:
+                retry = float(r.json().get("parameters", {}).get("retry_after"))
+            except Exception:
+                retry = None
+            log.warning(f"TG HTTP {r.status_code}, retry")
+            return False, retry
+        log.error(f"TG rejected ({r.status_code}): {r.text[:200]}")
+        return None, None
+
+    # ================== spool ==================
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return []
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            log.warning(f"TG spool unreadable: {e}")
+            return []
+
+    def _save_spool(self, msgs):
+        if not self.spool_path:
+            return
+        if not msgs:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp = self.spool_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(msgs, f, ensure_ascii=False)
+        os.replace(tmp, self.spool_path)
+
+# ================== local stand-in ==================
+def serve_stub(host="127.0.0.1", port=0, fail=0, status=503, reject=None):
+    """HTTP server แทน api.telegram.org (thread) เก็บ text ที่ได้รับไว้ใน server.received
+    fail = จำนวน request แรกที่ตอบ status (ทดสอบ retry); reject(text) -> True = ตอบ 400 (เช่น HTML ผิด)
+    -> คืน (server, url) ปิดด้วย server.shutdown()"""
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            srv = self.server
+            srv.hits += 1
+            if srv.hits <= srv.fail:
+                code, out = srv.status, {"ok": False, "parameters": {"retry_after": 0.05}}
+            elif srv.reject and srv.reject(body.get("text") or ""):
+                code, out = 400, {"ok": False, "description": "Bad Request: can't parse entities"}
+            else:
+                code, out = 200, {"ok": True}
+                srv.received.append(body.get("text"))
+            payload = json.dumps(out).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    server.received, server.hits, server.fail, server.status, server.reject = [], 0, fail, status, reject
+    threading.Thread(target=server.serve_forever, name="tg-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
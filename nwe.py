@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# nwe.py
+# Nadaraya-Watson Envelope (LuxAlgo) แบบ NumPy
+# kernel คำนวณครั้งเดียวต่อ (bandwidth, mult, factor, window) แล้วใช้ dot product แทน loop
+# NWEngine = repaint (ทั้ง envelope คำนวณใหม่จากแท่งล่าสุด), NWEndpoint = non-repaint (endpoint, incremental)
+
+from collections import deque
+import numpy as np
+
+NW_WINDOW = 499          # จำนวนแท่งสูงสุดของ kernel (ตาม LuxAlgo)
+NW_MIN_BARS = 200        # น้อยกว่านี้ถือว่ายังไม่พร้อม
+
+class NWEngine:
+    """Envelope engine สำหรับพารามิเตอร์ชุดเดียว
+
+    envelope(closes)        -> (upper, lower, mid) ของแท่งสุดท้าย
+    envelope_series(closes) -> arrays (upper, lower, mid) ของทุกแท่ง (NaN ช่วง warmup)
+    endpoint_series(closes) -> เหมือนกันแต่เป็น non-repaint (ดู NWEndpoint)
+    """
+
+    def __init__(self, h, mult, factor, window=NW_WINDOW):
+        self.h = float(h)
+        self.mult = mult
+        self.factor = factor
+        self.window = int(window)
+        self.mae_scale = mult * factor
+        i = np.arange(self.window, dtype=np.float64)
+        self._coefs = np.exp(-(i * i) / (2 * self.h ** 2))
+        self._kernels = {}
+
+    def kernel(self, win):
+        """weights ที่ normalize แล้ว เรียงเก่า -> ใหม่ ใช้ dot กับ closes[-win:] ได้ตรงๆ"""
+        k = self._kernels.get(win)
+        if k is None:
+            c = self._coefs[:win]
+            k = self._kernels[win] = np.ascontiguousarray(c[::-1] / c.sum())
+        return k
+
+    def _win(self, n):
+        win = min(self.window, n - 1)
+        return win, min(int(self.h * 10), win - 1)
+
+    def envelope(self, closes):
+        closes = np.asarray(closes, dtype=np.float64)
+        n = len(closes)
+        if n < NW_MIN_BARS:
+            return None, None, None
+        win, win_s = self._win(n)
+        mean = float(closes[-win:] @ self.kernel(win))
+        if win_s > 1:
+            seg = closes[-win_s - 1:-1]
+            mae = float(np.abs(np.diff(seg)).mean()) * self.mae_scale
+        else:
+            mae = 0.0
+        return mean + mae, mean - mae, mean
+
+    def envelope_series(self, closes):
+        closes = np.ascontiguousarray(closes, dtype=np.float64)
+        n = len(closes)
+        upper = np.full(n, np.nan)
+        lower = np.full(n, np.nan)
+        mid = np.full(n, np.nan)
+        # warmup: window ยังไม่เต็ม (n-1 < window) -> kernel เปลี่ยนทุกแท่ง
+        steady = self.window + 1
+        for i in range(NW_MIN_BARS - 1, min(n, steady - 1)):
+            upper[i], lower[i], mid[i] = self.envelope(closes[:i + 1])
+        if n < steady:
+            return upper, lower, mid
+        # steady state: kernel คงที่ -> convolution ครั้งเดียว
+        win, win_s = self._win(steady)
+        k = self.kernel(win)
+        m = np.convolve(closes, k[::-1], mode="valid")[steady - 1 - (win - 1):]
+        if win_s > 1:
+            d = np.abs(np.diff(closes))
+            cs = np.concatenate(([0.0], np.cumsum(d)))
+            # แท่ง i ใช้ d[i-win_s .. i-2] (win_s-1 ค่า)
+            idx = np.arange(steady - 1, n)
+            mae = (cs[idx - 1] - cs[idx - win_s]) / (win_s - 1) * self.mae_scale
+        else:
+            mae = 0.0
+        mid[steady - 1:] = m
+        upper[steady - 1:] = m + mae
+        lower[steady - 1:] = m - mae
+        return upper, lower, mid
+
+    def endpoint_series(self, closes):
+        """non-repaint envelope ของทุกแท่ง (ค่าเดียวกับ NWEndpoint.update ทีละแท่ง)"""
+        closes = np.ascontiguousarray(closes, dtype=np.float64)
+        _, _, mid = self.envelope_series(closes)
+        res = np.abs(closes - mid)
+        valid = ~np.isnan(res)
+        cs = np.concatenate(([0.0], np.cumsum(np.where(valid, res, 0.0))))
+        cnt = np.concatenate(([0], np.cumsum(valid)))
+        end = np.arange(1, len(closes) + 1)
+        start = np.maximum(0, end - self.window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mae = (cs[end] - cs[start]) / (cnt[end] - cnt[start]) * self.mae_scale
+        return mid + mae, mid - mae, mid
+
+_engines = {}
+
+def get_engine(h, mult, factor, window=NW_WINDOW):
+    key = (float(h), mult, factor, int(window))
+    e = _engines.get(key)
+    if e is None:
+        e = _engines[key] = NWEngine(h, mult, factor, window)
+    return e
+
+class NWEndpoint:
+    """Non-repainting (endpoint) envelope แบบ incremental
+
+    mid ของแต่ละแท่ง = kernel estimate ที่ปลายขวา (เท่ากับ mid ของ repaint ณ แท่งนั้น) และไม่ถูกแก้ย้อนหลัง
+    MAE = ค่าเฉลี่ย |close - mid| ย้อนหลัง window แท่ง * mult * factor
+    แท่งปิดแล้ว: update() ทีละแท่ง O(window), แท่งที่ยังไม่ปิด: peek() ไม่แก้ state
+    ต้องมีประวัติ ~2*window แท่งถึงจะได้ค่าตรงกับ backtest ตั้งแต่แท่งแรก
+    """
+
+    def __init__(self, h, mult, factor, window=NW_WINDOW):
+        self.engine = get_engine(h, mult, factor, window)
+        self.window = self.engine.window
+        self._reset()
+
+    def _reset(self):
+        self.count = 0               # จำนวนแท่งปิดที่รับมาแล้ว
+        self.last_ts = None
+        self.value = (None, None, None)
+        self._buf = np.zeros(2 * self.window, dtype=np.float64)
+        self._n = 0
+        self._res = deque(maxlen=self.window)
+        self._res_sum = 0.0
+
+    def _push(self, close):
+        if self._n == len(self._buf):
+            keep = self.window - 1
+            self._buf[:keep] = self._buf[self._n - keep:self._n]
+            self._n = keep
+        self._buf[self._n] = close
+        self._n += 1
+
+    def _mid(self, tail, n):
+        win = min(self.window, n - 1)
+        return float(tail[-win:] @ self.engine.kernel(win))
+
+    def _bands(self, mid, res_sum, res_len):
+        mae = res_sum / res_len * self.engine.mae_scale
+        return mid + mae, mid - mae, mid
+
+    def seed(self, closes, last_ts=None):
+        """เริ่มจากประวัติแท่งปิดทั้งหมดในครั้งเดียว (vectorized)"""
+        closes = np.ascontiguousarray(closes, dtype=np.float64)
+        self._reset()
+        self.count = len(closes)
+        self.last_ts = last_ts
+        tail = closes[-self.window:]
+        self._buf[:len(tail)] = tail
+        self._n = len(tail)
+        if self.count < NW_MIN_BARS:
+            return self.value
+        _, _, mid = self.engine.envelope_series(closes)
+        res = np.abs(closes - mid)[-self.window:]
+        res = res[~np.isnan(res)]
+        self._res.extend(res.tolist())
+        self._res_sum = float(res.sum())
+        self.value = self._bands(float(mid[-1]), self._res_sum, len(self._res))
+        return self.value
+
+    def update(self, close, ts=None):
+        """รับแท่งปิดใหม่ 1 แท่ง"""
+        self._push(close)
+        self.count += 1
+        if ts is not None:
+            self.last_ts = ts
+        if self.count < NW_MIN_BARS:
+            return self.value
+        mid = self._mid(self._buf[:self._n], self.count)
+        r = abs(close - mid)
+        if len(self._res) == self.window:
+            self._res_sum -= self._res[0]
+        self._res.append(r)
+        self._res_sum += r
+        if self.count % self.window == 0:
+            self._res_sum = sum(self._res)     # กัน float drift
+        self.value = self._bands(mid, self._res_sum, len(self._res))
+        return self.value
+
+    def peek(self, close):
+        """bands ถ้าแท่งที่ยังไม่ปิดจบที่ราคา close (ไม่แก้ state)"""
+        n = self.count + 1
+        if n < NW_MIN_BARS:
+            return None, None, None
+        tail = np.append(self._buf[max(0, self._n - self.window + 1):self._n], close)
+        mid = self._mid(tail, n)
+        r = abs(close - mid)
+        if len(self._res) == self.window:
+            return self._bands(mid, self._res_sum - self._res[0] + r, self.window)
+        return self._bands(mid, self._res_sum + r, len(self._res) + 1)
+
+    def sync(self, ts, closes):
+        """ตามให้ทันแท่งปิดใน (ts, closes) เช่นจาก candle cache; ถ้าประวัติขาดช่วงจะ seed ใหม่"""
+        if not len(ts):
+            return self.value
+        if self.last_ts is None or self.last_ts < ts[0]:
+            return self.seed(closes, ts[-1])
+        for i in np.nonzero(ts > self.last_ts)[0]:
+            self.update(float(closes[i]), ts[i])
+        return self.value
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# orders.py
+# SL / TP เป็น order บน exchange (STOP_MARKET / TAKE_PROFIT_MARKET, reduceOnly) แทนการเทียบราคา ticker ทุก loop
+# position ยังได้รับการป้องกันแม้ process ช้า ค้าง หรือตาย และปิดได้ทันทีที่ราคาแตะ ไม่ต้องรอรอบ loop + REST 2 ครั้ง
+#
+# ใช้ได้กับทุกอย่างที่มี interface แบบ ccxt: create_order / cancel_order / fetch_order / fetch_open_orders
+# (ccxt.binance จริง หรือ backtest.SimExchange)
+#
+# แก้ราคา stop = สร้างตัวใหม่ก่อนแล้วค่อยยกเลิกตัวเก่า (ไม่มีช่วงที่ position ไม่มี SL; reduceOnly กันปิดเกิน)
+
+import logging
+
+STOP = "STOP_MARKET"
+TAKE = "TAKE_PROFIT_MARKET"
+DONE = ("closed", "canceled", "cancelled", "expired", "rejected")
+
+def fill_price(order, default=None):
+    """ราคาเฉลี่ยที่ fill จริงของ order ccxt (average -> price) หรือ default"""
+    for k in ("average", "price"):
+        v = (order or {}).get(k)
+        if v:
+            return float(v)
+    return default
+
+def _fee(order):
+    fee = (order or {}).get("fee") or {}
+    return float(fee.get("cost") or 0.0)
+
+class ProtectiveOrders:
+    """conditional order (ขา) ของ position เดียวบน symbol เดียว: tag -> order
+
+    open(side)                         เริ่ม position ใหม่ (ยกเลิกขาที่ค้างจาก position ก่อน)
+    place(tag, type, stop, qty, reason) วาง/แก้ขา tag (เช่น "sl", "tp", "tp1"); reason ติดไปกับ exit
+    reconcile()                        ขาที่ fill แล้ว -> list ของ exit {"tag","reason","qty","price","fee","stop"}
+    cancel_all()                       ยกเลิกทุกขา; คืน exit ที่ fill ไปก่อนยกเลิกทัน
+                                       (ยกเลิกแล้วยืนยันสถานะไม่ได้ -> ขาค้างใน _stale, reconcile() ลองใหม่)
+    snapshot() / restore(d)            ขาที่จำไว้ (ให้ restart แล้ว reconcile() ต่อจากเดิมได้)
+    cancel_stray()                     ยกเลิก STOP/TAKE reduceOnly ของ symbol ที่ไม่ใช่ขาที่จำไว้
+    """
+
+    def __init__(self, ex, symbol, log=None):
+        self.ex = ex
+        self.symbol = symbol
+        self.log = log or logging.getLogger("orders")
+        self.side = None             # side ของ position ที่ป้องกันอยู่ ("long"/"short")
+        self.legs = {}               # tag -> {"id","type","stop","qty","reason"}
+        self._exits = []             # exit ที่เจอระหว่าง place/cancel รอส่งออกใน reconcile() ถัดไป
+        self._stale = {}             # id -> ขาที่สั่งยกเลิกแล้วแต่ยังยืนยันไม่ได้ว่าจบ (อาจยังอยู่บน exchange)
+
+    def _amount(self, qty):
+        try:
+            return float(self.ex.amount_to_precision(self.symbol, qty))
+        except Exception:
+            return qty
+
+    def _price(self, px):
+        try:
+            return float(self.ex.price_to_precision(self.symbol, px))
+        except Exception:
+            return px
+
+    def open(self, side):
+        self.cancel_all()
+        self.side = side
+        return self
+
+    def snapshot(self):
+        return {"side": self.side, "legs": self.legs, "stale": self._stale}
+
+    def restore(self, d):
+        self.side = (d or {}).get("side")
+        self.legs = dict((d or {}).get("legs") or {})
+        self._stale = dict((d or {}).get("stale") or {})
+        return self
+
+    def cancel_stray(self):
+        """ขาที่ค้างจาก process ก่อนที่ไม่มี snapshot (จะไปปิด position ที่รับมาดูแลใหม่ด้วยระดับเก่า)"""
+        mine = {leg["id"] for leg in self.legs.values()}
+        n = 0
+        for o in self.ex.fetch_open_orders(self.symbol):
+            if str(o["id"]) in mine or not o.get("reduceOnly") or str(o.get("type")).upper() not in (STOP, TAKE):
+                continue
+            try:
+                self.ex.cancel_order(o["id"], self.symbol)
+                n += 1
+            except Exception as e:
+                self.log.warning(f"cancel stray {o['id']} failed: {e}")
+        return n
+
+    def place(self, tag, type_, stop, qty, reason=None):
+        """วางขาใหม่แล้วค่อยยกเลิกขาเดิมของ tag เดียวกัน (ถ้ามี); ผิดพลาด -> raise (ขาเดิมยังอยู่)"""
+        close_side = "sell" if self.side == "long" else "buy"
+        stop, qty = self._price(stop), self._amount(qty)
+        o = self.ex.create_order(self.symbol, type_, close_side, qty, None, {"stopPrice": stop, "reduceOnly": True})
+        old = self.legs.get(tag)
+        self.legs[tag] = {"id": str(o["id"]), "type": type_, "stop": stop, "qty": qty, "reason": reason or tag}
+        if old is not None:
+            self._cancel(tag, old)
+        return self.legs[tag]
+
+    def cancel(self, tag):
+        leg = self.legs.pop(tag, None)
+        if leg is not None:
+            self._cancel(tag, leg)
+
+    def cancel_all(self):
+        for tag in list(self.legs):
+            self.cancel(tag)
+        exits, self._exits = self._exits, []
+        return exits
+
+    def _cancel(self, tag, leg):
+        """True = ยืนยันแล้วว่าขาจบ; ไม่งั้นเก็บไว้ใน _stale (reduceOnly ที่ลืมไปแต่ยังอยู่บน exchange
+        จะไปปิด position ถัดไป)"""
+        try:
+            self.ex.cancel_order(leg["id"], self.symbol)
+            self._stale.pop(leg["id"], None)
+            return True
+        except Exception as e:
+            err = e
+        # ยกเลิกไม่ได้ส่วนใหญ่เพราะ trigger/fill ไปแล้ว -> ดูสถานะจริงแล้วเก็บ fill ไว้
+        try:
+            o = self.ex.fetch_order(leg["id"], self.symbol)
+        except Exception as e:
+            o = {}
+            self.log.warning(f"cancel {tag} {leg['id']} failed: {err}; fetch_order: {e}")
+        if o.get("status") in DONE:
+            self._stale.pop(leg["id"], None)
+            self._collect(tag, leg, o)
+            return True
+        if o:
+            self.log.warning(f"cancel {tag} {leg['id']} failed: {err}; still {o.get('status')}")
+        self._stale[leg["id"]] = dict(leg, tag=tag)
+        return False
+
+    def _collect(self, tag, leg, o):
+        filled = float(o.get("filled") or 0.0)
+        if filled > 0:
+            self._exits.append({"tag": tag, "reason": leg["reason"], "qty": filled, "price": fill_price(o, leg["stop"]),
+                                "fee": _fee(o), "stop": leg["stop"], "id": leg["id"]})
+        return filled
+
+    def reconcile(self):
+        """เทียบขาที่จำไว้กับ open orders บน exchange (1 request); ขาที่หายไปดูรายละเอียดด้วย fetch_order
+        ขาใน _stale ถูกยกเลิกซ้ำจนกว่าจะยืนยันได้ว่าจบ"""
+        for leg in list(self._stale.values()):
+            self._cancel(leg["tag"], leg)
+        if self.legs:
+            open_ids = {str(o["id"]) for o in self.ex.fetch_open_orders(self.symbol)}
+            for tag, leg in list(self.legs.items()):
+                if leg["id"] in open_ids:
+                    continue
+                o = self.ex.fetch_order(leg["id"], self.symbol)
+                if o.get("status") not in DONE:
+                    continue
+                del self.legs[tag]
+                if not self._collect(tag, leg, o):
+                    self.log.warning(f"protective {tag} {leg['id']} {o.get('status')} without fill")
+        exits, self._exits = self._exits, []
+        return exits
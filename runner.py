@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+# runner.py
+# รัน NWStrategy หลาย symbol ใน process เดียวบน ccxt.async_support
+# client / load_markets() ชุดเดียว, request weight budget เดียวที่มี priority (order มาก่อน candle)
+#
+# ใช้: python runner.py BTC/USDT:USDT ETH/USDT:USDT SOL/USDT:USDT
+#      python runner.py -c symbols.json
+#      symbols.json: {"symbols": {"BTC/USDT:USDT": {}, "ETH/USDT:USDT": {"SL_DISTANCE": 100, "TP_BUFFER": 15}},
+#                     "weight_limit": 2400}
+#      (ค่าที่ไม่ได้ระบุใช้ CONFIG ของ main.py)
+
+import json, time, heapq, asyncio, logging, argparse
+from datetime import datetime
+
+import ccxt
+import ccxt.async_support as ccxt_async
+
+from candles import CandleCache, TS, CLOSE, timeframe_ms
+from nwe import get_engine, NWEndpoint
+from indicators import EMAState, MACDState
+from strategy_nw import NWStrategy, config_from
+from journal import Journal
+from metrics import metrics, kline_weight, header
+
+# priority: เลขน้อยได้ก่อน
+PRIO_ORDER, PRIO_ACCOUNT, PRIO_DATA = 0, 1, 2
+# สัดส่วนของ budget ที่แต่ละ priority ใช้ได้ (ที่เหลือกันไว้ให้ order เสมอ)
+CEILING = {PRIO_ORDER: 1.0, PRIO_ACCOUNT: 0.9, PRIO_DATA: 0.8}
+
+WEIGHT_LIMIT = 2400          # Binance USDⓈ-M REQUEST_WEIGHT ต่อนาที
+WEIGHT_WINDOW = 60.0
+BALANCE_SEC = 60             # อายุสูงสุดของ free balance ที่ใช้คิดขนาด order
+BAN_PAUSE_SEC = 60           # 429/418 ที่ไม่มี Retry-After
+
+# ค่านอก strategy_nw.PARAMS ที่ตั้งต่อ symbol ได้
+SYMBOL_PARAMS = ("TIMEFRAME", "CANDLE_LIMIT", "MACD_CANDLE_LIMIT", "EMA_CANDLE_LIMIT", "UPDATE_FRACTION", "LOOP_SEC")
+
+log = logging.getLogger("runner")
+
+def symbol_config(defaults, overrides=None):
+    """CONFIG ของ symbol เดียว: PARAMS + SYMBOL_PARAMS จาก defaults (vars(main)) แล้วทับด้วย overrides
+
+    NATIVE_STOPS ถูกปิด (พร้อม warning): IntentBroker ส่ง order หลัง step แบบ async ไม่มี ProtectiveOrders
+    SL/TP ของ runner จึงเทียบราคาทุก LOOP_SEC เสมอ
+    """
+    cfg = config_from(defaults, **{k: defaults[k] for k in SYMBOL_PARAMS})
+    cfg.update(overrides or {})
+    if cfg["NATIVE_STOPS"]:
+        log.warning("⚠ NATIVE_STOPS not supported in runner, SL/TP use price polling")
+        cfg["NATIVE_STOPS"] = False
+    return cfg
+
+# ============================================================
+# Rate limit
+# ============================================================
+class WeightBudget:
+    """Sliding window ของ request weight ที่ใช้ไปใน window วินาทีล่าสุด
+
+    acquire() ถูกปล่อยตาม (priority, ลำดับที่มา): ถ้าตัวหัวคิวยังไม่พอ budget ตัวหลังต้องรอด้วย
+    (request เล็กๆ ของ priority ต่ำแซง order ที่รออยู่ไม่ได้) และแต่ละ priority ใช้ได้ไม่เกิน
+    CEILING ของ limit
+    """
+
+    def __init__(self, limit=WEIGHT_LIMIT, window=WEIGHT_WINDOW, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.used = 0
+        self.waited = 0.0            # เวลารอรวมใน acquire()
+        self._spent = []             # heap ของ (t, weight) ที่ยังอยู่ใน window
+        self._waiters = []           # heap ของ [priority, seq, weight, future]
+        self._seq = 0
+        self._paused_until = 0.0
+        self._timer = None
+
+    def _trim(self, now):
+        while self._spent and self._spent[0][0] <= now - self.window:
+            self.used -= heapq.heappop(self._spent)[1]
+
+    def _spend(self, now, weight):
+        heapq.heappush(self._spent, (now, weight))
+        self.used += weight
+
+    async def acquire(self, weight, priority=PRIO_DATA):
+        t0 = self.clock()
+        self._seq += 1
+        entry = [priority, self._seq, weight, asyncio.get_running_loop().create_future()]
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+        try:
+            await entry[3]
+        except asyncio.CancelledError:
+            entry[3].cancel()
+            raise
+        self.waited += self.clock() - t0
+
+    def _fire(self):
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self):
+        """ปล่อย waiter ที่ถึงคิวและพอ budget; ยังเหลือ -> ตั้ง timer ตัวเดียว (ไม่ซ้อนกันทุก acquire)"""
+        now = self.clock()
+        self._trim(now)
+        while self._waiters:
+            prio, _, weight, fut = self._waiters[0]
+            if fut.done():                       # ถูก cancel ไปแล้ว
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until or self.used + weight > self.limit * CEILING.get(prio, 1.0):
+                break
+            heapq.heappop(self._waiters)
+            self._spend(now, weight)
+            fut.set_result(None)
+        if self._waiters and self._timer is None:
+            wake = self._paused_until if now < self._paused_until else \
+                (self._spent[0][0] + self.window if self._spent else now)
+            self._timer = asyncio.get_running_loop().call_later(max(0.01, wake - now), self._fire)
+
+    def observe(self, server_used):
+        """ตัวเลข X-MBX-USED-WEIGHT-1M จาก response: ถ้า server นับได้มากกว่า (เช่นมี process อื่น) ให้ตามนั้น"""
+        if server_used > self.used:
+            self._spend(self.clock(), server_used - self.used)
+
+    def pause(self, seconds):
+        """หยุดปล่อยทุก request (หลังโดน 429/418)"""
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._dispatch()
+
+class AsyncAPI:
+    """ccxt async client 1 ตัวที่ทุก symbol ใช้ร่วมกัน; ทุก request ผ่าน WeightBudget ก่อน"""
+
+    def __init__(self, ex, budget):
+        self.ex = ex
+        self.budget = budget
+        self.requests = 0
+
+    async def call(self, method, *args, weight=1, priority=PRIO_DATA, **kwargs):
+        labels = (("endpoint", method),)
+        t0 = time.perf_counter()
+        await self.budget.acquire(weight, priority)      # (timer ของ metrics ไม่ reentrant -> จับเวลาเอง)
+        t1 = time.perf_counter()
+        metrics.observe("budget_wait_seconds", t1 - t0, (("priority", priority),))
+        self.requests += 1
+        try:
+            res = await getattr(self.ex, method)(*args, **kwargs)
+        except (ccxt.DDoSProtection, ccxt.RateLimitExceeded) as e:
+            metrics.inc("request_errors_total", 1, labels)
+            retry = header(getattr(self.ex, "last_response_headers", None), "Retry-After")
+            self.budget.pause(float(retry) if retry else BAN_PAUSE_SEC)
+            log.warning(f"rate limited on {method}, pausing: {e}")
+            raise
+        except Exception:
+            metrics.inc("request_errors_total", 1, labels)
+            raise
+        finally:
+            metrics.observe("request_seconds", time.perf_counter() - t1, labels)
+            metrics.inc("requests_total", 1, labels)
+            metrics.inc("request_weight_total", weight, labels)
+        used = header(getattr(self.ex, "last_response_headers", None), "X-MBX-USED-WEIGHT-1M")
+        if used:
+            self.budget.observe(int(used))
+            metrics.set("used_weight_1m", int(used))
+        return res
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None, priority=PRIO_DATA):
+        return await self.call("fetch_ohlcv", symbol, timeframe, since=since, limit=limit,
+                               weight=kline_weight(limit), priority=priority)
+
+    async def refresh(self, cache, priority=PRIO_DATA):
+        p = cache.refresh_params()
+        if p is not None:
+            cache.ingest(await self.fetch_ohlcv(cache.symbol, cache.timeframe, priority=priority, **p), p)
+        return cache
+
+def setup_exchange(api_key, secret):
+    return ccxt_async.binance({
+        "apiKey": api_key,
+        "secret": secret,
+        "enableRateLimit": False,          # WeightBudget คุมแทน (throttle ของ ccxt เป็น FIFO ไม่มี priority)
+        "options": {"defaultType": "future", "fetchMarkets": ["linear"], "fetchCurrencies": False},
+    })
+
+# ============================================================
+# Symbol
+# ============================================================
+class IntentBroker:
+    """broker ของ NWStrategy ภายใน runner: step() เป็น sync จึงแค่จด order ไว้ให้ SymbolBot ส่งต่อหลัง step
+
+    last_price = close ของแท่งที่ยังไม่ปิดที่เพิ่ง refresh (ราคาเทรดล่าสุด ไม่ต้องยิง ticker แยก)
+    macd / free balance เตรียมไว้ก่อน step เฉพาะตอนที่ step จะใช้
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.price = None
+        self.macd_now = {}
+        self.orders = []
+
+    def last_price(self):
+        return self.price
+
+    def macd(self, timeframe):
+        return self.macd_now.get(timeframe)
+
+    def order_size(self, price):
+        return self.bot.runner.reserve(self.bot.symbol, price, self.bot.cfg)
+
+    def market_order(self, side, qty, reduce_only=False):
+        self.orders.append((side, qty, reduce_only))
+
+class SymbolBot:
+    """NWStrategy + candle cache + indicator state ของ symbol เดียว"""
+
+    def __init__(self, runner, symbol, cfg):
+        self.runner = runner
+        self.api = runner.api
+        self.symbol = symbol
+        self.cfg = cfg
+        self.tf_ms = timeframe_ms(cfg["TIMEFRAME"])
+        self.cache = CandleCache(runner.ex, symbol, cfg["TIMEFRAME"], cfg["CANDLE_LIMIT"])
+        self.macd_caches = {}
+        self.broker = IntentBroker(self)
+        self.journal = Journal(f"{symbol.split(':')[0].replace('/', '')}_{runner.journal_file}")
+        self.stats = self.journal.stats
+        self.strategy = NWStrategy(cfg, self.broker, self.stats, notify=self.notify,
+                                   log=logging.getLogger(f"runner.{symbol.split('/')[0]}"))
+        self.ema = {p: EMAState(p) for p in (cfg["EMA_FAST"], cfg["EMA_SLOW"])}
+        self.macd_state = {}
+        self.nw_live = None if cfg["USE_REPAINT"] else NWEndpoint(cfg["NW_BANDWIDTH"], cfg["NW_MULT"], cfg["NW_FACTOR"])
+        self.bands = None
+        self.last_nw_update = 0.0
+        self.retry = []              # reduce-only ที่ส่งไม่ผ่าน (ต้องปิดให้ได้)
+        self._labels = (("symbol", symbol),)
+        self._tick_t0 = time.perf_counter()
+
+    def notify(self, msg):
+        self.runner.notify(f"[{self.symbol}] {msg}")
+
+    async def live_macd(self, timeframe):
+        c = self.macd_caches.get(timeframe)
+        if c is None:
+            c = self.macd_caches[timeframe] = CandleCache(self.runner.ex, self.symbol, timeframe, self.cfg["MACD_CANDLE_LIMIT"])
+        await self.api.refresh(c)
+        st = self.macd_state.get(timeframe)
+        if st is None:
+            st = self.macd_state[timeframe] = MACDState()
+        return st.sync(c.column(TS)[:-1], c.closes()[:-1]).snapshot()
+
+    def nw_bands(self, now_ts, closes):
+        cfg = self.cfg
+        if not cfg["USE_REPAINT"]:
+            self.nw_live.sync(self.cache.column(TS)[:-1], closes[:-1])
+            u, l, m = self.nw_live.peek(closes[-1])
+            return None if u is None else (u, l, m)
+        if self.bands is None or now_ts - self.last_nw_update > self.tf_ms / 1000 * cfg["UPDATE_FRACTION"]:
+            u, l, m = get_engine(cfg["NW_BANDWIDTH"], cfg["NW_MULT"], cfg["NW_FACTOR"]).envelope(closes)
+            if u is None:
+                return None
+            self.bands = (u, l, m)
+            self.last_nw_update = now_ts
+        return self.bands
+
+    async def tick(self):
+        cfg, st = self.cfg, self.strategy
+        await self.api.refresh(self.cache)
+        closes = self.cache.closes()
+        last_close = float(closes[-1])
+
+        e_fast = e_slow = None
+        if cfg["EMA_ENABLED"]:
+            rows = self.cache.view(cfg["EMA_CANDLE_LIMIT"])
+            for s in self.ema.values():
+                s.sync(rows[:-1, TS], rows[:-1, CLOSE])
+            e_fast = self.ema[cfg["EMA_FAST"]].tentative(last_close)
+            e_slow = self.ema[cfg["EMA_SLOW"]].tentative(last_close)
+            if e_fast is None or e_slow is None:
+                return
+
+        now_ts = time.time()
+        bands = self.nw_bands(now_ts, closes)
+        if bands is None:
+            return
+        upper, lower, mid = bands
+
+        amt = self.runner.positions.get(self.symbol)
+        if amt is None:
+            return                               # ยังไม่รู้ position จริง
+
+        # เตรียมเฉพาะสิ่งที่ step() รอบนี้อาจเรียก
+        self.broker.price = last_close
+        self.broker.macd_now.clear()
+        if st.position and amt > 0:
+            if cfg["USE_BREAKEVEN_MACD"]:
+                self.broker.macd_now[cfg["BREAKEVEN_MACD_TF"]] = await self.live_macd(cfg["BREAKEVEN_MACD_TF"])
+        elif not st.sl_lock:
+            if cfg["MACD_ENABLED"] and st.pending is not None:
+                self.broker.macd_now[cfg["MACD_TF"]] = await self.live_macd(cfg["MACD_TF"])
+            if st.pending is not None or last_close <= lower or last_close >= upper:
+                await self.runner.refresh_balance(max_age=2.0)
+
+        self.journal.roll(datetime.now().strftime("%Y-%m"))
+        st.step(now_ts, last_close, upper, lower, mid, amt, e_fast, e_slow)
+        self.journal.commit()
+        await self.send_orders()
+
+    async def send_orders(self):
+        orders, self.broker.orders = self.retry + self.broker.orders, []
+        self.retry = []
+        if not orders:
+            return
+        for side, qty, reduce_only in orders:
+            if reduce_only and not self.runner.positions.get(self.symbol):
+                continue
+            try:
+                await self.api.call("create_market_order", self.symbol, side, qty,
+                                    params={"reduceOnly": True} if reduce_only else {},
+                                    weight=1, priority=PRIO_ORDER)
+                metrics.observe("tick_to_order_seconds", time.perf_counter() - self._tick_t0, self._labels)
+            except Exception as e:
+                log.error(f"{self.symbol} {side} {qty} order failed: {e}")
+                if reduce_only:
+                    self.retry.append((side, qty, reduce_only))
+        self.runner.balance_time = 0.0
+        try:
+            await self.runner.refresh_positions([self.symbol], PRIO_ORDER)
+        except Exception:
+            self.runner.positions[self.symbol] = None   # ไม่ตัดสินใจบน position เก่าก่อนส่ง order
+            raise
+
+    async def run(self, delay=0.0):
+        await asyncio.sleep(delay)
+        while True:
+            t0 = time.monotonic()
+            self._tick_t0 = time.perf_counter()
+            try:
+                await self.tick()
+                metrics.observe("tick_seconds", time.perf_counter() - self._tick_t0, self._labels)
+            except Exception as e:
+                log.exception(f"{self.symbol} tick error: {e}")
+            await asyncio.sleep(max(0.0, self.cfg["LOOP_SEC"] - (time.monotonic() - t0)))
+
+# ============================================================
+# Runner
+# ============================================================
+class Runner:
+    """หลาย SymbolBot บน client เดียว; position ทุก symbol ดึงใน request เดียวต่อรอบ"""
+
+    def __init__(self, ex, symbols, defaults, weight_limit=WEIGHT_LIMIT, notify=None, journal_file="trades.journal"):
+        self.ex = ex
+        self.budget = WeightBudget(weight_limit)
+        self.api = AsyncAPI(ex, self.budget)
+        self.notify_fn = notify      # ต้องไม่บล็อก (เช่น main.tg ที่แค่เข้าคิว notifier)
+        self.journal_file = journal_file
+        self.loop_sec = defaults["LOOP_SEC"]
+        self.positions = {}          # symbol -> contracts (None = ยังไม่รู้)
+        self.free = 0.0
+        self.balance_time = 0.0
+        self._pos_seq = {}           # symbol -> จำนวนครั้งที่ refresh เฉพาะ symbol (กันผลเก่าทับผลใหม่)
+        self.bots = {s: SymbolBot(self, s, symbol_config(defaults, o)) for s, o in symbols.items()}
+
+    def notify(self, msg):
+        if self.notify_fn:
+            self.notify_fn(msg)
+
+    def reserve(self, symbol, price, cfg):
+        """ขนาด order จาก free balance ที่ cache ไว้ แล้วหัก margin ออกทันที
+        (symbol อื่นที่เปิดในรอบเดียวกันจะไม่เห็น balance ก้อนเดิมซ้ำ)"""
+        qty = max(0.0, self.free) * cfg["POSITION_MARGIN_FRACTION"] * cfg["LEVERAGE"] / price if price > 0 else 0.0
+        try:
+            qty = float(self.ex.amount_to_precision(symbol, qty))
+        except Exception:
+            qty = round(qty, 3)
+        self.free -= qty * price / cfg["LEVERAGE"]
+        return qty
+
+    async def refresh_balance(self, max_age=BALANCE_SEC, priority=PRIO_ACCOUNT):
+        if time.monotonic() - self.balance_time < max_age:
+            return self.free
+        bal = await self.api.call("fetch_balance", {"type": "future"}, weight=5, priority=priority)
+        self.free = float((bal.get("USDT") or {}).get("free") or 0.0)
+        self.balance_time = time.monotonic()
+        return self.free
+
+    async def refresh_positions(self, symbols=None, priority=PRIO_ACCOUNT):
+        symbols = list(symbols or self.bots)
+        seq = {s: self._pos_seq.get(s, 0) for s in symbols}
+        for s in symbols:
+            self._pos_seq[s] = seq[s] + 1
+        pos_list = await self.api.call("fetch_positions", symbols, weight=5, priority=priority)
+        amts = dict.fromkeys(symbols, 0.0)
+        for p in pos_list:
+            if p.get("symbol") in amts and float(p.get("contracts") or 0) != 0:
+                amts[p["symbol"]] = float(p["contracts"])
+        for s in symbols:
+            if self._pos_seq[s] == seq[s] + 1:   # ไม่มี refresh ที่เริ่มทีหลังมาก่อนแล้ว
+                self.positions[s] = amts[s]
+
+    async def account_loop(self):
+        while True:
+            try:
+                await self.refresh_positions()
+                await self.refresh_balance()
+            except Exception as e:
+                log.warning(f"account refresh error: {e}")
+            await asyncio.sleep(self.loop_sec)
+
+    async def setup(self):
+        await self.api.call("load_markets", weight=1, priority=PRIO_ACCOUNT)
+        for s, bot in self.bots.items():
+            try:
+                await self.api.call("set_leverage", bot.cfg["LEVERAGE"], s, weight=1, priority=PRIO_ACCOUNT)
+            except Exception as e:
+                log.warning(f"set_leverage {s} warn: {e}")
+
+    async def run(self):
+        await self.setup()
+        log.info(f"✅ Runner started: {', '.join(self.bots)}")
+        n = len(self.bots)
+        # กระจายจังหวะ tick ของแต่ละ symbol ไม่ให้ยิง klines พร้อมกันทุกรอบ
+        tasks = [self.account_loop()] + [bot.run(i * self.loop_sec / n) for i, bot in enumerate(self.bots.values())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await self.ex.close()
+
+if __name__ == "__main__":
+    import main as live
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("symbols", nargs="*")
+    ap.add_argument("-c", "--config", help="json: {\"symbols\": {symbol: {CONFIG overrides}}, \"weight_limit\": n}")
+    ap.add_argument("--metrics-port", type=int, default=live.METRICS_PORT)
+    args = ap.parse_args()
+
+    conf = {}
+    if args.config:
+        with open(args.config) as f:
+            conf = json.load(f)
+    symbols = dict(conf.get("symbols") or {})
+    symbols.update({s: {} for s in args.symbols if s not in symbols})
+    if not symbols:
+        symbols = {live.SYMBOL: {}}
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if live.METRICS_JSON_FILE:
+        metrics.dump_every(live.METRICS_JSON_FILE, live.METRICS_JSON_SEC)
+
+    async def _main():
+        ex = setup_exchange(live.API_KEY, live.SECRET)
+        await Runner(ex, symbols, vars(live), conf.get("weight_limit", WEIGHT_LIMIT), live.tg, live.JOURNAL_FILE).run()
+
+    asyncio.run(_main())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# scheduler.py
+# เวลาตื่นรอบถัดไปของ decision loop จากสภาพตลาด แทน sleep(LOOP_SEC) คงที่ทุกกรณี
+#
+#   - ตื่นตรงเวลาปิดแท่ง (+ lag เล็กน้อยให้ exchange ปิดแท่งเสร็จ) และเวลาที่ NW freeze หมดอายุ
+#   - ราคาใกล้ระดับสำคัญ (lower/upper/sl/tp ...) -> poll ถี่ขึ้น; ไม่มี position และอยู่ไกล -> ห่างขึ้น
+#   - exchange error ติดกัน -> exponential backoff แบบมี jitter (ไม่ยิงพร้อมกันทุก process)
+#
+# clock / rand ฉีดเข้าได้ ทดสอบแบบ deterministic ได้โดยไม่ต้อง sleep จริง
+
+import time, random
+
+from candles import Timeframe
+
+class Scheduler:
+    """คำนวณจำนวนวินาทีที่ควร sleep ก่อนรอบถัดไป
+
+    delay(price, levels, active, timeframes, deadlines)  หลังรอบที่สำเร็จ
+    failure()                                            หลังรอบที่ error (backoff; success() รีเซ็ต)
+
+    ระยะห่างจากระดับที่ใกล้ที่สุด (สัดส่วนของราคา) <= near -> min_sec, >= far -> เพดาน
+    (loop_sec ถ้า active = มี position/pending, ไม่งั้น idle_sec) ระหว่างนั้นไล่เป็นเส้นตรง
+    """
+
+    def __init__(self, loop_sec, min_sec=1.0, idle_sec=None, near=0.002, far=0.02, lag=0.5,
+                 error_sec=2.0, max_error_sec=120.0, clock=time.time, rand=random.random):
+        self.loop_sec = float(loop_sec)
+        self.min_sec = min(float(min_sec), self.loop_sec)
+        self.idle_sec = max(float(idle_sec if idle_sec is not None else loop_sec), self.loop_sec)
+        self.near = near
+        self.far = max(far, near)
+        self.lag = lag
+        self.error_sec = error_sec
+        self.max_error_sec = max_error_sec
+        self.clock = clock
+        self.rand = rand
+        self.errors = 0
+        self._tfs = {}
+
+    def _tf(self, tf):
+        t = self._tfs.get(tf)
+        if t is None:
+            t = self._tfs[tf] = tf if isinstance(tf, Timeframe) else Timeframe(tf)
+        return t
+
+    def next_close(self, timeframes, now=None):
+        """เวลา (วินาที epoch) ที่แท่งของ timeframes แท่งแรกจะปิดหลัง now หรือ None"""
+        now_ms = int((self.clock() if now is None else now) * 1000)
+        closes = [self._tf(tf).close_time(now_ms) for tf in timeframes]
+        return min(closes) / 1000.0 if closes else None
+
+    def proximity(self, price, levels):
+        """ระยะ (สัดส่วนของราคา) ถึงระดับที่ใกล้ที่สุด หรือ None"""
+        if not price:
+            return None
+        d = [abs(price - lv) for lv in levels if lv is not None]
+        return min(d) / abs(price) if d else None
+
+    def delay(self, price=None, levels=(), active=False, timeframes=(), deadlines=()):
+        now = self.clock()
+        cap = self.loop_sec if active else self.idle_sec
+        wait = cap
+        dist = self.proximity(price, levels)
+        if dist is not None and dist < self.far:
+            if dist <= self.near:
+                wait = self.min_sec
+            else:
+                wait = self.min_sec + (cap - self.min_sec) * (dist - self.near) / (self.far - self.near)
+        events = list(deadlines)
+        close = self.next_close(timeframes, now)
+        if close is not None:
+            events.append(close)
+        for t in events:
+            if t is not None and t + self.lag > now:
+                wait = min(wait, t + self.lag - now)
+        return max(wait, 0.0)
+
+    def success(self):
+        self.errors = 0
+
+    def failure(self):
+        """วินาทีที่ควรรอหลัง error ครั้งที่ n ติดกัน: error_sec * 2^(n-1) (ไม่เกิน max) * jitter 0.5..1.5"""
+        self.errors += 1
+        base = min(self.error_sec * 2 ** (self.errors - 1), self.max_error_sec)
+        return min(base * (0.5 + self.rand()), self.max_error_sec)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# snapshot.py
+# Snapshot ของ state บอท + candle cache ลงไฟล์เดียว (.npz) แบบ atomic ให้ restart แล้วเทรดต่อได้ทันที
+#
+#   "state"        JSON ของ state บอท (position / pending / phase / legs ของ SL-TP / market ...)
+#   "c0", "c1" ..  แท่งของแต่ละ candle cache (float64 (n, 6)) ; meta อยู่ใน state["_caches"]
+#
+# เขียนลง <path>.tmp -> fsync -> os.replace: process ตายกลางทางก็ยังเหลือ snapshot เก่าที่สมบูรณ์
+# indicator (EMA/MACD/NW endpoint/structure) ไม่ถูกเก็บ: seed ใหม่จาก cache ที่ restore ได้ในไม่กี่ ms
+
+import os, json, time, logging
+import numpy as np
+
+from candles import caches, get_cache
+
+log = logging.getLogger("snapshot")
+
+def save(path, state, ex=None, clock=time.time):
+    """เขียน state (dict ที่ JSON ได้) + cache ทุกตัวของ ex (None = ไม่เก็บ cache)"""
+    state = dict(state, _saved=clock(), _caches=[])
+    arrays = {}
+    for c in (caches(ex) if ex is not None else ()):
+        if not len(c):
+            continue
+        arrays[f"c{len(state['_caches'])}"] = c.view()
+        state["_caches"].append([c.symbol, c.timeframe, c.size])
+    arrays["state"] = np.frombuffer(json.dumps(state, default=float).encode("utf-8"), dtype=np.uint8)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load(path):
+    """(state, {(symbol, timeframe): (size, rows)}) หรือ (None, {}) ถ้าไม่มีไฟล์ / อ่านไม่ได้"""
+    if not path or not os.path.exists(path):
+        return None, {}
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            state = json.loads(z["state"].tobytes().decode("utf-8"))
+            rows = {(sym, tf): (size, z[f"c{i}"]) for i, (sym, tf, size) in enumerate(state.get("_caches", []))}
+        return state, rows
+    except Exception as e:
+        log.warning(f"snapshot {path} unreadable: {e}")
+        return None, {}
+
+def restore_caches(ex, rows):
+    """ใส่แท่งจาก snapshot กลับเข้า registry ของ candles; refresh() ถัดไปดึงเฉพาะแท่งที่ขาด"""
+    for (symbol, timeframe), (size, data) in rows.items():
+        get_cache(ex, symbol, timeframe, size).load(data)
+
+class Snapshotter:
+    """ตัดสินว่าเมื่อไหร่ต้องเขียน: state เปลี่ยน (เขียนทันที) หรือครบ every วินาที (เพื่อ cache)"""
+
+    def __init__(self, path, every=30.0, clock=time.time):
+        self.path = path
+        self.every = every
+        self.clock = clock
+        self.writes = 0
+        self._last = None
+        self._last_t = None
+
+    def update(self, state, ex=None, key=None):
+        """key = ส่วนของ state ที่ต้องเขียนทันทีที่เปลี่ยน (None = ทั้ง state)"""
+        if not self.path:
+            return False
+        key = json.dumps(state if key is None else key, sort_keys=True, default=float)
+        now = self.clock()
+        if key == self._last and self._last_t is not None and now - self._last_t < self.every:
+            return False
+        try:
+            save(self.path, state, ex, self.clock)
+        except Exception as e:
+            log.warning(f"snapshot {self.path} failed: {e}")
+            return False
+        self._last, self._last_t = key, now
+        self.writes += 1
+        return True
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+# strategy_nw.py
+# Decision logic ของบอท NW Envelope + MACD (main.py) แยกออกจาก loop
+# live loop (main.py) และ backtest.py ขับ NWStrategy.step() ตัวเดียวกัน
+#
+# broker ต้องมี:
+#   last_price()                          -> ราคาล่าสุด (ticker)
+#   macd(timeframe)                       -> (dif_prev, dif_now, dea_prev, dea_now) หรือ None
+#   order_size(price)                     -> qty
+#   market_order(side, qty, reduce_only)  -> ส่ง market order ("buy"/"sell") คืน order/fill (มี average หรือ price)
+#   protective (ไม่บังคับ)                 -> orders.ProtectiveOrders: ใช้เมื่อ NATIVE_STOPS = True
+#                                            SL/TP อยู่บน exchange แทนการเทียบ last_price ทุก tick
+
+import logging
+from datetime import datetime
+
+from orders import STOP, TAKE, fill_price
+
+# ค่าที่อ่านจาก CONFIG ของ main.py (ส่วนที่ strategy ไม่ใช้เป็นของฝั่งเตรียมข้อมูล/backtest)
+PARAMS = (
+    "EMA_ENABLED", "EMA_FAST", "EMA_SLOW",
+    "MACD_ENABLED", "MACD_TF", "USE_BREAKEVEN_MACD", "BREAKEVEN_MACD_TF",
+    "USE_REPAINT", "NW_BANDWIDTH", "NW_MULT", "NW_FACTOR",
+    "TP_BUFFER", "SL_DISTANCE", "USE_BREAKEVEN", "BREAKEVEN_OFFSET", "USE_MID_AS_TP",
+    "LEVERAGE", "POSITION_MARGIN_FRACTION", "NATIVE_STOPS",
+)
+
+def config_from(src, **overrides):
+    """dict ของ PARAMS จาก globals()/vars(module) ของ main.py แล้วทับด้วย overrides"""
+    cfg = {k: src[k] for k in PARAMS}
+    cfg.update(overrides)
+    return cfg
+
+def macd_up(dp,dn,ep,en):   # ตัดขึ้น
+    return dp <= ep and dn > en
+
+def macd_down(dp,dn,ep,en): # ตัดลง
+    return dp >= ep and dn < en
+
+class NWStrategy:
+    """State ของบอท: position / pending / sl_lock + stats ("pnl", "trades")
+
+    step() ถูกเรียกทุก tick ด้วยข้อมูลที่เตรียมไว้แล้ว (close ล่าสุด, NW bands, EMA, ขนาด position จริง)
+    ไม่มี sleep / fetch ของตัวเอง ทุกอย่างที่ต้องคุยกับ exchange ผ่าน broker
+    """
+
+    def __init__(self, cfg, broker, stats=None, notify=None, log=None):
+        self.broker = broker
+        self.stats = stats if stats is not None else {"pnl": 0.0, "trades": []}
+        self.notify = notify or (lambda msg: None)
+        self.log = log or logging.getLogger("main")
+        self.ema_enabled = cfg["EMA_ENABLED"]
+        self.macd_enabled = cfg["MACD_ENABLED"]
+        self.macd_tf = cfg["MACD_TF"]
+        self.use_breakeven_macd = cfg["USE_BREAKEVEN_MACD"]
+        self.breakeven_macd_tf = cfg["BREAKEVEN_MACD_TF"]
+        self.use_breakeven = cfg["USE_BREAKEVEN"]
+        self.be_offset = cfg["BREAKEVEN_OFFSET"]
+        self.sl_distance = cfg["SL_DISTANCE"]
+        self.tp_buffer = cfg["TP_BUFFER"]
+        self.use_mid_as_tp = cfg["USE_MID_AS_TP"]
+        self.orders = getattr(broker, "protective", None) if cfg["NATIVE_STOPS"] else None
+        if cfg["NATIVE_STOPS"] and self.orders is None:
+            self.log.warning("⚠ NATIVE_STOPS set but broker has no protective orders, SL/TP use price polling")
+
+        self.position = None          # {"side","qty","entry","sl","tp"} (+ "protected","exit_qty","exit_value" เมื่อ NATIVE_STOPS)
+        self.sl_lock = False
+        self.pending = None           # {"side","touch_price","lower","upper","mid","ts"}
+
+    # ---------------- snapshot ----------------
+    def snapshot(self):
+        d = {"position": self.position, "pending": self.pending, "sl_lock": self.sl_lock}
+        if self.orders is not None:
+            d["orders"] = self.orders.snapshot()
+        return d
+
+    def restore(self, d, side=None, qty=0.0, entry=None, mid=None, upper=None, lower=None):
+        """คืน state จาก snapshot แล้วเทียบกับ position จริงบน exchange (side/qty/entry; side None = ไม่มี)
+
+        - snapshot มี position ฝั่งเดียวกัน -> ใช้ต่อ (SL/TP/BE เดิม)
+        - exchange ไม่มี position -> คง position ไว้ให้ step() ถัดไปเก็บ fill จาก SL/TP บน exchange
+          (NATIVE_STOPS) หรือ reset ตามเส้นทาง "position disappeared" เดิม
+        - exchange มี position ที่ snapshot ไม่รู้จัก -> รับมาดูแล: SL = entry -/+ SL_DISTANCE,
+          TP จาก band ล่าสุด (ถ้ามี) แล้ววาง SL/TP บน exchange ใหม่
+        คืน "kept" / "adopted" / "flat"
+        """
+        d = d or {}
+        self.position = d.get("position")
+        self.pending = d.get("pending")
+        self.sl_lock = bool(d.get("sl_lock"))
+        if self.orders is not None:
+            self.orders.restore(d.get("orders"))
+        p = self.position
+        if side is None:
+            return "flat"
+        if p is not None and p["side"] == side:
+            return "kept"
+        if self.orders is not None:
+            self.orders.cancel_all()
+            self.orders.cancel_stray()
+        if self.use_mid_as_tp:
+            tp = mid
+        elif side == "long":
+            tp = None if upper is None else upper - self.tp_buffer
+        else:
+            tp = None if lower is None else lower + self.tp_buffer
+        sl = entry - self.sl_distance if side == "long" else entry + self.sl_distance
+        self.position = {"side": side, "qty": qty, "entry": entry, "sl": sl, "tp": tp}
+        self.pending = None
+        if self.orders is not None:
+            self._protect()
+        return "adopted"
+
+    # ---------------- helpers ----------------
+    def _record(self, now_ts, price, reason):
+        p = self.position
+        side, entry, qty = p["side"], p["entry"], p["qty"]
+        pnl = (price - entry) * qty if side == "long" else (entry - price) * qty
+        self.stats["pnl"] += pnl
+        self.stats["trades"].append({"time": datetime.fromtimestamp(now_ts).strftime("%H:%M:%S"),
+                                     "side": side.upper(), "entry": entry, "exit": price,
+                                     "pnl": pnl, "reason": reason})
+        return pnl
+
+    def _close(self, now_ts, price, reason):
+        if self.orders is not None:
+            return self._close_native(now_ts, price, reason)
+        p = self.position
+        pnl = self._record(now_ts, price, reason)
+        self.broker.market_order("sell" if p["side"] == "long" else "buy", p["qty"], reduce_only=True)
+        self.position = None
+        return pnl
+
+    def _open(self, side, price, tp):
+        qty = self.broker.order_size(price)
+        o = self.broker.market_order("buy" if side == "long" else "sell", qty)
+        if self.orders is not None:
+            price = fill_price(o, price)
+        sl = price - self.sl_distance if side == "long" else price + self.sl_distance
+        self.position = {"side": side, "qty": qty, "entry": price, "sl": sl, "tp": tp}
+        if self.orders is not None:
+            self._protect()
+
+    def _be_level(self, side, entry):
+        return entry + self.be_offset if side == "long" else entry - self.be_offset
+
+    def _tp_reason(self, side):
+        return "TP_mid" if self.use_mid_as_tp else ("TP_upper" if side == "long" else "TP_lower")
+
+    def _set_sl(self, pos, sl):
+        pos["sl"] = sl
+        if pos.get("protected"):
+            self._place_sl(pos)
+
+    # ---------------- NATIVE_STOPS: SL/TP บน exchange ----------------
+    def _open_qty(self, pos):
+        left = pos["qty"] - pos["exit_qty"]
+        return left if left > pos["qty"] * 1e-9 else 0.0
+
+    def _place_sl(self, pos):
+        """วาง/ขยับ SL บน exchange; ไม่สำเร็จ -> กลับไปเทียบราคาเองทั้ง SL และ TP
+        (SL เดิมบน exchange ยังอยู่เป็นตัวกันตอน process ตาย, TP ถูกยกเลิก: ไม่มี TP บน exchange ที่ไม่ตรงกับ SL)"""
+        reason = "BE" if abs(pos["sl"] - self._be_level(pos["side"], pos["entry"])) < 1e-6 else "SL"
+        try:
+            self.orders.place("sl", STOP, pos["sl"], self._open_qty(pos), reason)
+        except Exception as e:
+            self.log.warning(f"⚠ SL order {pos['sl']:.2f} failed, fallback to price polling: {e}")
+            self.orders.cancel("tp")              # fill ที่เกิดก่อนยกเลิกทันออกมาใน reconcile() ถัดไป
+            pos["protected"] = False
+
+    def _protect(self):
+        p = self.position
+        p.update(protected=True, exit_qty=0.0, exit_value=0.0)
+        self.orders.open(p["side"])
+        try:
+            self.orders.place("sl", STOP, p["sl"], p["qty"], "SL")
+            if p["tp"] is not None:
+                self.orders.place("tp", TAKE, p["tp"], p["qty"], self._tp_reason(p["side"]))
+        except Exception as e:
+            self.log.warning(f"⚠ protective orders failed, fallback to price polling: {e}")
+            self._absorb(self.orders.cancel_all())
+            p["protected"] = False
+
+    def _absorb(self, exits):
+        p = self.position
+        for e in exits:
+            p["exit_qty"] += e["qty"]
+            p["exit_value"] += e["qty"] * e["price"]
+
+    def _settle(self, now_ts, reason):
+        """บันทึก trade ด้วยราคาเฉลี่ยที่ fill จริงของทุก exit"""
+        p = self.position
+        pnl = self._record(now_ts, p["exit_value"] / p["exit_qty"], reason)
+        self.position = None
+        return pnl
+
+    def _close_native(self, now_ts, price, reason):
+        p = self.position
+        exits = self.orders.cancel_all()          # fill ที่เกิดก่อนยกเลิกทันนับเป็น exit ด้วย
+        self._absorb(exits)
+        left = self._open_qty(p)
+        if left:
+            o = self.broker.market_order("sell" if p["side"] == "long" else "buy", left, reduce_only=True)
+            self._absorb([{"qty": left, "price": fill_price(o, price)}])
+        elif exits:
+            reason = exits[-1]["reason"]
+        return self._settle(now_ts, reason)
+
+    def _sync_exchange(self, now_ts):
+        """fill ของ SL/TP บน exchange ตั้งแต่ tick ก่อน -> True ถ้า position ปิดหมดแล้ว"""
+        p = self.position
+        exits = self.orders.reconcile()
+        self._absorb(exits)
+        if self._open_qty(p):
+            if p["protected"] and "sl" not in self.orders.legs:
+                self._place_sl(p)                 # SL หายไปโดยไม่ fill (ถูกยกเลิก/expired) -> วางใหม่
+            return False
+        if not exits:
+            return False
+        self.orders.cancel_all()
+        side, entry, reason = p["side"], p["entry"], exits[-1]["reason"]
+        pnl = self._settle(now_ts, reason)
+        price = self.stats["trades"][-1]["exit"]
+        if reason in ("SL", "BE"):
+            self.notify(f"🚨 {side.upper()} {reason} {entry:.2f}->{price:.2f} PnL={pnl:+.2f}")
+            self.sl_lock = True
+        else:
+            self.notify(f"✅ {side.upper()} TP @ {price:.2f} PnL={pnl:+.2f}")
+        return True
+
+    # ---------------- tick ----------------
+    def step(self, now_ts, last_close, upper, lower, mid, amt, e_fast=None, e_slow=None):
+        trend = ("BUY" if e_fast > e_slow else "SELL") if self.ema_enabled else None
+
+        if self.orders is not None and self.position is not None:
+            if self._sync_exchange(now_ts):
+                return
+
+        if amt == 0 and self.position is not None:
+            self.log.info("⚠ Position disappeared on exchange, reset local state.")
+            if self.orders is not None:
+                self.orders.cancel_all()
+            self.position = None
+
+        if self.position and amt > 0:
+            return self._manage(now_ts, last_close, mid, trend)
+
+        # ---------------- NO POSITION ----------------
+        if self.sl_lock:
+            if (last_close > mid) or (last_close < mid):
+                self.sl_lock = False
+                self.log.info("🔓 SL Lock released")
+            return
+
+        # 1) pending from touch -> wait MACD confirm
+        if self.macd_enabled and self.pending is not None:
+            return self._confirm_pending(trend)
+
+        # 2) no pending -> detect new NW touch
+        if (not self.ema_enabled or trend == "BUY") and last_close <= lower:
+            last_price = self.broker.last_price()
+            if self.macd_enabled:
+                self.pending = {"side": "long", "touch_price": last_price, "lower": lower, "upper": upper, "mid": mid, "ts": now_ts}
+            else:
+                self._open("long", last_price, mid if self.use_mid_as_tp else (upper - self.tp_buffer))
+            return
+
+        if (not self.ema_enabled or trend == "SELL") and last_close >= upper:
+            last_price = self.broker.last_price()
+            if self.macd_enabled:
+                self.pending = {"side": "short", "touch_price": last_price, "lower": lower, "upper": upper, "mid": mid, "ts": now_ts}
+            else:
+                self._open("short", last_price, mid if self.use_mid_as_tp else (lower + self.tp_buffer))
+            return
+
+    def _confirm_pending(self, trend):
+        last_price = self.broker.last_price()
+        side = self.pending["side"]
+        p_lower = self.pending["lower"]
+        p_upper = self.pending["upper"]
+        p_mid   = self.pending["mid"]
+
+        mac = self.broker.macd(self.macd_tf)
+        if not mac:
+            return
+        if self.ema_enabled:
+            if not (macd_up(*mac) if trend == "BUY" else macd_down(*mac)):
+                return
+        else:
+            if side == "long" and not macd_up(*mac):
+                self.pending = None; return
+            if side == "short" and not macd_down(*mac):
+                self.pending = None; return
+
+        if side == "long":
+            if not (last_price < p_lower or last_price > p_mid):
+                self._open("long", last_price, p_mid if self.use_mid_as_tp else (p_upper - self.tp_buffer))
+        else:
+            if not (last_price > p_upper or last_price < p_mid):
+                self._open("short", last_price, p_mid if self.use_mid_as_tp else (p_lower + self.tp_buffer))
+        self.pending = None
+
+    # ---------------- MANAGE OPEN POSITION ----------------
+    def _manage(self, now_ts, last_close, mid, trend):
+        pos = self.position
+        last_price = self.broker.last_price()
+        side = pos["side"]
+        entry = pos["entry"]
+        sl = pos["sl"]
+        tp = pos.get("tp")
+
+        # --- Breakeven via MACD experimental (if enabled) ---
+        if self.use_breakeven_macd:
+            try:
+                mac_be = self.broker.macd(self.breakeven_macd_tf)
+                if mac_be:
+                    if side == "long" and macd_down(*mac_be):
+                        if (last_close - entry) * pos["qty"] > 0:
+                            if pos["sl"] < entry + self.be_offset:
+                                self._set_sl(pos, entry + self.be_offset)
+                        else:
+                            self._close(now_ts, last_price, "SL")
+                            self.sl_lock = True
+                            return
+                    if side == "short" and macd_up(*mac_be):
+                        if (entry - last_close) * pos["qty"] > 0:
+                            if pos["sl"] > entry - self.be_offset:
+                                self._set_sl(pos, entry - self.be_offset)
+                        else:
+                            self._close(now_ts, last_price, "SL")
+                            self.sl_lock = True
+                            return
+            except Exception as e:
+                self.log.debug(f"[BE_MACD] error: {e}")
+
+        # --- SL / TP บน exchange แล้ว: ไม่ต้องเทียบราคาเอง ---
+        if pos.get("protected"):
+            sl = tp = None
+
+        # --- SL Touch ---
+        if sl is not None and ((side == "long" and last_price <= sl) or (side == "short" and last_price >= sl)):
+            be_level = entry + self.be_offset if side == "long" else entry - self.be_offset
+            reason = "BE" if abs(sl - be_level) < 1e-6 else "SL"
+            pnl = self._close(now_ts, last_price, reason)
+            self.notify(f"🚨 {side.upper()} {reason} {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
+            self.sl_lock = True
+            return
+
+        # --- TP ---
+        if tp is not None:
+            if side == "long" and last_price >= tp:
+                pnl = self._close(now_ts, last_price, "TP_mid" if self.use_mid_as_tp else "TP_upper")
+                self.notify(f"✅ LONG TP @ {last_price:.2f} PnL={pnl:+.2f}")
+                return
+            if side == "short" and last_price <= tp:
+                pnl = self._close(now_ts, last_price, "TP_mid" if self.use_mid_as_tp else "TP_lower")
+                self.notify(f"✅ SHORT TP @ {last_price:.2f} PnL={pnl:+.2f}")
+                return
+
+        # --- EMA flip TP mid ---
+        if self.ema_enabled:
+            if (side == "long" and trend == "SELL" and last_price <= mid) or \
+               (side == "short" and trend == "BUY" and last_price >= mid):
+                self._close(now_ts, last_price, "TP_mid_trend_flip")
+                return
+
+        # --- Breakeven via mid ---
+        if not self.use_breakeven_macd and self.use_breakeven and not self.sl_lock:
+            if side == "long" and last_close > mid and pos["sl"] < entry + self.be_offset:
+                self._set_sl(pos, entry + self.be_offset)
+            if side == "short" and last_close < mid and pos["sl"] > entry - self.be_offset:
+                self._set_sl(pos, entry - self.be_offset)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+# stream.py
+# Binance Futures WebSocket: kline / aggTrade / markPrice + user data (ACCOUNT_UPDATE)
+# เก็บ state ล่าสุดใน memory แล้วปลุก decision loop ทุกครั้งที่มี event แทนการ sleep ตาม timer
+#
+# thread ของ stream แค่ parse ข้อความแล้วเข้าคิว; การแก้ candle cache และ REST resync
+# ทำบน thread ของ loop หลักใน sync() ทั้งหมด (ccxt client / cache ไม่ถูกแตะจากสอง thread)
+# listenKey ของ user stream ขอ/ต่ออายุด้วย HTTP ของ thread stream เอง (aiohttp + API key, ไม่ผ่าน ccxt)
+
+import json, time, asyncio, logging, threading
+from collections import deque
+
+import aiohttp
+
+from candles import get_cache
+
+FUTURES_WS = "wss://fstream.binance.com"
+FUTURES_REST = "https://fapi.binance.com"
+LISTEN_KEY_PATH = "/fapi/v1/listenKey"
+KEEPALIVE_SEC = 30 * 60          # ต่ออายุ listenKey
+STALE_SEC = 5.0                  # ราคาเก่ากว่านี้ถือว่าใช้ไม่ได้ -> fallback REST
+MAX_BACKOFF = 60.0
+
+log = logging.getLogger("stream")
+
+def stream_symbol(symbol):
+    """'BTC/USDT:USDT' -> 'btcusdt'"""
+    return symbol.split(":")[0].replace("/", "").lower()
+
+class MarketStream:
+    """State ล่าสุดจาก WebSocket ของ symbol เดียว
+
+    loop หลักเรียก:
+      wait(timeout)   แทน time.sleep (ตื่นเมื่อมี event หรือหมดเวลา)
+      sync()          ย้าย kline ที่เข้าคิวไปที่ candle cache + REST resync หลัง reconnect / gap
+      price()         ราคาล่าสุด หรือ None ถ้า stream หลุด/เก่า
+      position_amt()  ขนาด position จาก ACCOUNT_UPDATE หรือ None ถ้ายังไม่ sync
+    """
+
+    def __init__(self, ex, symbol, timeframes, cache_sizes=None, url=FUTURES_WS, user_data=True,
+                 min_wake=0.25, record_path=None, clock=time.time, rest_url=FUTURES_REST, api_key=None):
+        self.ex = ex
+        self.rest_url = rest_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else getattr(ex, "apiKey", None)
+        self.symbol = symbol
+        self.sid = stream_symbol(symbol)
+        self.timeframes = list(dict.fromkeys(timeframes))
+        self.cache_sizes = cache_sizes or {}
+        self.url = url.rstrip("/")
+        self.user_data = user_data
+        self.min_wake = min_wake
+        self.record_path = record_path
+        self.clock = clock
+
+        self.connected = False
+        self.user_connected = False
+        self.last_price = None
+        self.mark_price = None
+        self.last_msg = 0.0
+        self.position = None             # {"amt","side","entry"} จาก user stream
+        self.reconnects = 0
+        self._pos_updates = 0            # นับ ACCOUNT_UPDATE ของ symbol นี้
+
+        self._klines = deque()           # (tf, row) รอ sync() บน thread หลัก
+        self._resync = set()             # tf ที่ต้องดึง REST ชดเชย
+        self._resync_position = True
+        self._event = threading.Event()
+        self._last_wake = 0.0
+        self._stop = False
+        self._thread = None
+        self._loop = None                # event loop ของ thread stream
+        self._ws = set()                 # websocket ที่เปิดอยู่ (stop() ปิดให้ทันทีไม่ต้องรอข้อความถัดไป)
+        self._lk = threading.Lock()
+
+    # ================== thread หลัก ==================
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="market-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self._event.set()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            for ws in list(self._ws):
+                loop.call_soon_threadsafe(lambda ws=ws: asyncio.ensure_future(ws.close()))
+
+    def wait(self, timeout):
+        """รอ event ถัดไป (อย่างน้อย min_wake วินาทีหลังตื่นครั้งก่อน) หรือ timeout"""
+        gap = self.min_wake - (self.clock() - self._last_wake)
+        if gap > 0:
+            time.sleep(gap)
+        self._event.wait(max(0.0, timeout - max(gap, 0.0)))
+        self._event.clear()
+        self._last_wake = self.clock()
+
+    def sync(self):
+        with self._lk:
+            klines = list(self._klines); self._klines.clear()
+            resync = set(self._resync); self._resync.clear()
+            resync_pos = self._resync_position; self._resync_position = False
+        caches = {tf: get_cache(self.ex, self.symbol, tf, self.cache_sizes.get(tf, 600)) for tf in self.timeframes}
+        for tf, row in klines:
+            c = caches[tf]
+            last = c.last_ts()
+            if last is None or row[0] > last + c.tf_ms:
+                resync.add(tf)             # cache ว่าง / แท่งหายระหว่างทาง
+            if tf in resync:
+                continue
+            c.apply([row])
+        for tf in resync:
+            caches[tf].refresh(force=True)
+            for t, row in klines:
+                if t == tf:
+                    caches[tf].apply([row])
+        for c in caches.values():
+            c.streaming = self.connected and c.last_ts() is not None
+        if resync_pos and self.user_data:
+            self._position_from_rest()
+
+    def price(self):
+        if not self.connected or self.last_price is None or self.clock() - self.last_msg > STALE_SEC:
+            return None
+        return self.last_price
+
+    def position_amt(self):
+        if not self.user_connected or self.position is None:
+            return None
+        return self.position["amt"]
+
+    def invalidate_position(self):
+        """หลังส่ง order เอง: sync() ถัดไปอ่าน position จาก REST 1 ครั้ง (ACCOUNT_UPDATE มาก่อน -> ใช้ของ stream)
+        ไม่ล้าง position ทิ้ง: order ที่ไม่เปลี่ยน position ไม่มี ACCOUNT_UPDATE ตามมา -> จะยิง REST ทุก tick"""
+        with self._lk:
+            self._resync_position = True
+
+    def _position_from_rest(self):
+        seen = self._pos_updates
+        try:
+            amt, side, entry = 0.0, None, 0.0
+            for p in self.ex.fetch_positions([self.symbol]):
+                if p.get("symbol") == self.symbol and float(p.get("contracts") or 0) != 0:
+                    amt, side, entry = float(p["contracts"]), p.get("side"), float(p.get("entryPrice") or 0.0)
+                    break
+            if self._pos_updates == seen:      # ระหว่างรอ REST มี ACCOUNT_UPDATE ใหม่กว่าแล้ว -> ใช้ของ stream
+                self.position = {"amt": amt, "side": side, "entry": entry}
+        except Exception as e:
+            log.warning(f"position resync error: {e}")
+            with self._lk:
+                self._resync_position = True
+
+    # ================== thread stream ==================
+    def _wake(self):
+        self._event.set()
+
+    def _record(self, raw):
+        if self.record_path:
+            with open(self.record_path, "a") as f:
+                f.write(raw if raw.endswith("\n") else raw + "\n")
+
+    def on_message(self, raw):
+        """parse ข้อความดิบ 1 ข้อความ (ทั้ง combined market stream และ user data stream)"""
+        self._record(raw)
+        msg = json.loads(raw)
+        d = msg.get("data", msg)
+        e = d.get("e")
+        self.last_msg = self.clock()
+        if e == "aggTrade":
+            p = float(d["p"])
+            if p != self.last_price:
+                self.last_price = p
+                self._wake()
+        elif e == "markPriceUpdate":
+            self.mark_price = float(d["p"])
+        elif e == "kline":
+            k = d["k"]
+            row = [float(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"])]
+            with self._lk:
+                self._klines.append((k["i"], row))
+            if self.last_price is None or k["x"]:
+                self.last_price = row[4]
+                self._wake()
+        elif e == "ACCOUNT_UPDATE":
+            for p in d.get("a", {}).get("P", []):
+                if p.get("s", "").lower() == self.sid and p.get("ps", "BOTH") == "BOTH":   # one-way mode
+                    amt = float(p["pa"])
+                    self.position = {"amt": abs(amt), "side": "long" if amt > 0 else "short" if amt < 0 else None,
+                                     "entry": float(p.get("ep") or 0.0)}
+                    with self._lk:
+                        self._pos_updates += 1
+                        self._resync_position = False
+                    self._wake()
+        elif e == "listenKeyExpired":
+            raise ConnectionResetError("listenKey expired")
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        tasks = [self._market_loop()]
+        if self.user_data:
+            tasks.append(self._user_loop())
+        await asyncio.gather(*tasks)
+
+    def _market_url(self):
+        streams = [f"{self.sid}@kline_{tf}" for tf in self.timeframes] + [f"{self.sid}@aggTrade", f"{self.sid}@markPrice@1s"]
+        return f"{self.url}/stream?streams=" + "/".join(streams)
+
+    async def _session(self, url, on_open):
+        """ต่อ 1 ครั้งจนหลุด"""
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(url, heartbeat=30) as ws:
+                self._ws.add(ws)
+                try:
+                    on_open()
+                    async for m in ws:
+                        if self._stop:
+                            break
+                        if m.type == aiohttp.WSMsgType.TEXT:
+                            self.on_message(m.data)
+                        elif m.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                finally:
+                    self._ws.discard(ws)
+
+    async def _reconnecting(self, connect, on_open, on_close, name):
+        backoff = 1.0
+        while not self._stop:
+            opened = []
+            try:
+                await self._session(await connect(), lambda: (opened.append(1), on_open()))
+            except Exception as e:
+                log.warning(f"{name} stream error: {e}")
+            on_close()
+            if self._stop:
+                break
+            self.reconnects += 1
+            backoff = 1.0 if opened else min(backoff * 2, MAX_BACKOFF)
+            await asyncio.sleep(backoff)
+
+    async def _market_loop(self):
+        async def connect():
+            return self._market_url()
+
+        def opened():
+            with self._lk:
+                self._resync.update(self.timeframes)      # ชดเชยแท่งที่หายระหว่างหลุด
+            self.connected = True
+            self._wake()
+
+        def closed():
+            self.connected = False
+            self._wake()
+
+        await self._reconnecting(connect, opened, closed, "market")
+
+    async def _listen_key(self, session, method):
+        """POST = ขอ listenKey, PUT = ต่ออายุ (endpoint USER_STREAM ใช้แค่ API key ไม่ต้อง sign)"""
+        async with session.request(method, self.rest_url + LISTEN_KEY_PATH,
+                                   headers={"X-MBX-APIKEY": self.api_key or ""}) as r:
+            body = await r.json(content_type=None)
+            if r.status != 200:
+                raise ConnectionError(f"listenKey {method} {r.status}: {body}")
+            return body
+
+    async def _user_loop(self):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as rest:
+            await self._user_stream(rest)
+
+    async def _user_stream(self, rest):
+        async def connect():
+            key = (await self._listen_key(rest, "POST"))["listenKey"]
+            return f"{self.url}/ws/{key}"
+
+        def opened():
+            with self._lk:
+                self._resync_position = True
+            self.user_connected = True
+            self._wake()
+
+        def closed():
+            self.user_connected = False
+            self._wake()
+
+        async def keepalive():
+            while not self._stop:
+                await asyncio.sleep(KEEPALIVE_SEC)
+                try:
+                    await self._listen_key(rest, "PUT")
+                except Exception as e:
+                    log.warning(f"listenKey keepalive error: {e}")
+
+        ka = asyncio.ensure_future(keepalive())
+        try:
+            await self._reconnecting(connect, opened, closed, "user")
+        finally:
+            ka.cancel()
+
+# ================== local stand-in ==================
+async def serve_replay(messages, host="127.0.0.1", port=0, delay=0.0, close_after=True):
+    """WebSocket server ที่ส่ง messages (list ของ str) ตามลำดับให้ทุก client ที่ต่อเข้ามา
+    หรือ dict {path prefix: list} เช่น {"/stream": market, "/ws/": user}
+    POST/PUT LISTEN_KEY_PATH ตอบ listenKey ปลอม (ใช้ url เดียวกันเป็น rest_url ได้)
+
+    ใช้แทน Binance ตอนทดสอบ/replay ข้อความที่บันทึกไว้ด้วย record_path
+    คืน (runner, url) -> ปิดด้วย await runner.cleanup()
+    """
+    from aiohttp import web
+
+    def pick(path):
+        if not isinstance(messages, dict):
+            return messages
+        for prefix, msgs in messages.items():
+            if path.startswith(prefix):
+                return msgs
+        return []
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for m in pick(request.path):
+            await ws.send_str(m)
+            if delay:
+                await asyncio.sleep(delay)
+        if close_after:
+            await ws.close()
+        else:
+            async for _ in ws:
+                pass
+        return ws
+
+    async def listen_key(request):
+        return web.json_response({"listenKey": "replay"})
+
+    app = web.Application()
+    app.router.add_route("POST", LISTEN_KEY_PATH, listen_key)
+    app.router.add_route("PUT", LISTEN_KEY_PATH, listen_key)
+    app.router.add_get("/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+def load_recording(path):
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
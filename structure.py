@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# structure.py
+# Market structure (swing high/low + BOS/CHOCH) แบบ incremental ต่อ (timeframe, left, right)
+# ให้ผลเท่ากับ find_swings_from_ohlcv + detect_bos_choch_from_swings ของ main.py1 บน window เดียวกัน
+# แต่กินแท่งปิดทีละแท่ง: swing ยืนยันด้วย sliding max/min แบบ monotonic deque (O(1) ต่อแท่ง)
+#
+# ทำไม incremental ถึงตรงกับ batch ที่เริ่มนับใหม่ทุก window:
+#   batch เริ่มด้วย trend=None จึงให้ CHOCH ไม่ได้จนกว่าจะเจอ BOS แรกใน window และเงื่อนไข BOS
+#   ไม่ขึ้นกับ trend -> ตั้งแต่ BOS แรกใน window เป็นต้นไป ผลของ batch กับของ tracker (ที่เห็นประวัติยาวกว่า)
+#   เหมือนกันทุกตัว. สัญญาณล่าสุดของ window จึงเท่ากับของ tracker ถ้า BOS ล่าสุดเกิดจาก swing ที่อยู่ใน window
+
+import bisect
+from collections import deque
+
+def _step(trend, prev_price, kind, close):
+    """กติกาเดียวกับ detect_bos_choch_from_swings -> (signal หรือ None, trend ใหม่)"""
+    if kind == "high" and close > prev_price:
+        return "BOS", "up"
+    if kind == "low" and close < prev_price:
+        return "BOS", "down"
+    if trend == "up" and close < prev_price:
+        return "CHOCH", "down"
+    if trend == "down" and close > prev_price:
+        return "CHOCH", "up"
+    return None, trend
+
+class StructureTracker:
+    """Swing + BOS/CHOCH ของ timeframe เดียว
+
+    sync(o)   o = ohlcv ล่าสุด (แถวสุดท้าย = แท่งที่ยังไม่ปิด) เช่น fetch_candles(tf, n)
+              แท่งปิดใหม่ถูกกินถาวร; แท่งที่ยังไม่ปิดคิดแบบ tentative ทุกครั้ง
+    query ทุกตัวรับ window = จำนวนแท่งท้ายสุด (รวมแท่งที่ยังไม่ปิด) ที่ batch จะเห็น
+    """
+
+    def __init__(self, left=2, right=2, keep=1000):
+        self.left = left
+        self.right = right
+        self.keep = keep             # จำนวน swing ล่าสุดที่เก็บ
+        self.reset()
+
+    def reset(self):
+        self.n = 0                   # จำนวนแท่งปิดที่กินแล้ว = index ของแท่งที่ยังไม่ปิด
+        self.last_ts = None
+        self._bars = deque(maxlen=self.left + self.right + 1)     # (ts, high, low, close)
+        self._hi = deque()           # (g, high) ค่าไม่เพิ่มขึ้น -> หัว = max ของ window
+        self._lo = deque()           # (g, low)  ค่าไม่ลดลง   -> หัว = min ของ window
+        self.swings = deque()        # (kind, g, ts, price) เรียงตามลำดับเดียวกับ find_swings_from_ohlcv
+        self._index = {"high": [], "low": []}   # (price, g) เรียงตามราคา
+        self.trend = None
+        self.signal = None           # (signal, trend, price, ts, g) ล่าสุด
+        self.bos_prev = None         # g ของ swing ก่อนหน้าที่ทำให้เกิด BOS ล่าสุด
+        self._t = ([], None, None)   # tentative จากแท่งที่ยังไม่ปิด: (swings, signal, bos_prev)
+
+    # ---------------- feed ----------------
+    def sync(self, o):
+        if not len(o):
+            return self
+        closed = o[:-1]
+        if len(closed):
+            if self.last_ts is None or not closed[0][0] <= self.last_ts <= closed[-1][0]:
+                self.reset()         # ประวัติขาดช่วง / window เก่ากว่าที่กินไปแล้ว -> เริ่มใหม่จาก window นี้
+                new = closed
+            else:
+                k = len(closed)
+                while k > 0 and closed[k - 1][0] > self.last_ts:
+                    k -= 1
+                new = closed[k:]
+            rows = new.tolist() if hasattr(new, "tolist") else new
+            for r in rows:
+                self._push(r[0], r[2], r[3], r[4])
+        f = o[-1]
+        self._tentative(float(f[0]), float(f[2]), float(f[3]), float(f[4]))
+        return self
+
+    def _push(self, ts, high, low, close):
+        g = self.n
+        w = self.left + self.right
+        self._bars.append((ts, high, low, close))
+        while self._hi and self._hi[-1][1] < high:
+            self._hi.pop()
+        self._hi.append((g, high))
+        while self._hi[0][0] < g - w:
+            self._hi.popleft()
+        while self._lo and self._lo[-1][1] > low:
+            self._lo.pop()
+        self._lo.append((g, low))
+        while self._lo[0][0] < g - w:
+            self._lo.popleft()
+        self.n = g + 1
+        self.last_ts = ts
+        c = g - self.right
+        if c >= self.left:
+            bts, bh, bl, bc = self._bars[-1 - self.right]
+            if bh == self._hi[0][1]:
+                self._add(("high", c, bts, bh), bc)
+            if bl == self._lo[0][1]:
+                self._add(("low", c, bts, bl), bc)
+
+    def _add(self, sw, close):
+        kind, g, ts, price = sw
+        if self.swings:
+            prev = self.swings[-1]
+            sig, trend = _step(self.trend, prev[3], kind, close)
+            if sig:
+                self.trend = trend
+                self.signal = (sig, trend, price, ts, g)
+                if sig == "BOS":
+                    self.bos_prev = prev[1]
+        self.swings.append(sw)
+        bisect.insort(self._index[kind], (price, g))
+        if len(self.swings) > self.keep:
+            self.swings.popleft()
+            if len(self._index["high"]) + len(self._index["low"]) > 2 * self.keep:
+                oldest = self.swings[0][1]
+                for k in self._index:
+                    self._index[k] = [x for x in self._index[k] if x[1] >= oldest]
+
+    def _tentative(self, ts, high, low, close):
+        """swing ที่ index n-right ซึ่ง window ของมันรวมแท่งที่ยังไม่ปิด (ไม่บันทึกถาวร)"""
+        L, R = self.left, self.right
+        c = self.n - R
+        swings, signal, bos_prev = [], self.signal, self.bos_prev
+        if c >= L and len(self._bars) >= L + R:
+            bars = list(self._bars)[len(self._bars) - (L + R):] + [(ts, high, low, close)]
+            bts, bh, bl, bc = bars[L]
+            trend = self.trend
+            prev = self.swings[-1] if self.swings else None
+            for kind, price, hit in (("high", bh, bh == max(b[1] for b in bars)),
+                                     ("low", bl, bl == min(b[2] for b in bars))):
+                if not hit:
+                    continue
+                sw = (kind, c, bts, price)
+                if prev is not None:
+                    sig, trend = _step(trend, prev[3], kind, bc)
+                    if sig:
+                        signal = (sig, trend, price, bts, c)
+                        if sig == "BOS":
+                            bos_prev = prev[1]
+                swings.append(sw)
+                prev = sw
+        self._t = (swings, signal, bos_prev)
+
+    # ---------------- query ----------------
+    def _start(self, window):
+        return self.n + 1 - window
+
+    def last_signal(self, window):
+        """= detect_bos_choch_from_swings(o, find_swings_from_ohlcv(o, left, right))[-1] หรือ None
+        เมื่อ o = window แท่งล่าสุด (dict เดียวกัน: signal, trend, price, ts, i)"""
+        _, signal, bos_prev = self._t
+        start = self._start(window)
+        if signal is None or bos_prev is None or bos_prev < start + self.left:
+            return None
+        sig, trend, price, ts, g = signal
+        return {"signal": sig, "trend": trend, "price": price, "ts": ts, "i": g - start}
+
+    def recent_swing(self, kind, lo, hi, window):
+        """ราคาของ swing ชนิด kind ("high"/"low") ล่าสุดใน window ที่ lo <= price <= hi หรือ None"""
+        t_swings = self._t[0]
+        for sw in reversed(t_swings):
+            if sw[0] == kind and lo <= sw[3] <= hi:
+                return sw[3]
+        min_g = self._start(window) + self.left
+        idx = self._index[kind]
+        i = bisect.bisect_left(idx, (lo, -1))
+        j = bisect.bisect_right(idx, (hi, float("inf")))
+        best = None
+        for price, g in idx[i:j]:
+            if g >= min_g and (best is None or g > best[1]):
+                best = (price, g)
+        return best[0] if best else None
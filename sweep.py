@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# sweep.py
+# Parameter sweep / walk-forward ของ NWStrategy บนหลาย core
+# candle history วางใน shared memory ครั้งเดียว (worker attach เอง ไม่ต้อง pickle array ไปทุก task)
+# indicator series cache ต่อ worker ตาม key ของพารามิเตอร์ที่มันขึ้นอยู่ (ดู backtest.indicator_series)
+#
+# ใช้: python sweep.py candles_30m.csv -p SL_DISTANCE=1000,1500,2000 -p NW_MULT=3,4,5 [-j 16]
+#      python sweep.py candles_30m.csv -p NW_BANDWIDTH=6:10 -p SL_DISTANCE=500:3000 --random 500
+#      python sweep.py candles_30m.csv ... --wf 8000:2000      (train:test แท่ง, เลื่อนทีละ test)
+#      python sweep.py candles_5m.csv --timeframe 5m ...     (TF ของ csv หลัก; default = TIMEFRAME ของ main.py)
+#      --tf 5m=candles_5m.csv  (ข้อมูล MACD_TF / BREAKEVEN_MACD_TF)
+
+import os, sys, math, random, itertools, argparse
+from collections import OrderedDict
+from multiprocessing import Pool, shared_memory
+import numpy as np
+
+from backtest import indicator_series, replay, summarize
+
+CACHE_ENTRIES = 32       # จำนวน series สูงสุดที่ worker แต่ละตัวเก็บไว้
+
+# พารามิเตอร์ที่ indicator series ขึ้นอยู่ -> ใช้เรียง task ให้ชุดที่ใช้ series เดียวกันไปอยู่ worker เดียวกัน
+INDICATOR_PARAMS = ("NW_BANDWIDTH", "NW_MULT", "NW_FACTOR", "USE_REPAINT", "EMA_ENABLED", "EMA_FAST", "EMA_SLOW",
+                    "MACD_ENABLED", "MACD_TF", "USE_BREAKEVEN_MACD", "BREAKEVEN_MACD_TF")
+
+# ============================================================
+# Search space
+# ============================================================
+def grid(space):
+    """{"SL_DISTANCE": [1000, 2000], ...} -> ทุก combination"""
+    keys = list(space)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))]
+
+def random_search(space, n, seed=0):
+    """list = สุ่มเลือก, (lo, hi) = สุ่มในช่วง (int ถ้า lo/hi เป็น int ทั้งคู่)"""
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        combo = {}
+        for k, v in space.items():
+            if isinstance(v, tuple):
+                lo, hi = v
+                combo[k] = rnd.randint(lo, hi) if isinstance(lo, int) and isinstance(hi, int) else rnd.uniform(lo, hi)
+            else:
+                combo[k] = rnd.choice(v)
+        out.append(combo)
+    return out
+
+def walk_forward(n_bars, train, test, step=None, start=0):
+    """[((train_start, train_end), (test_start, test_end)), ...] เลื่อนทีละ step (default = test)"""
+    step = step or test
+    out = []
+    a = start
+    while a + train + test <= n_bars:
+        out.append(((a, a + train), (a + train, a + train + test)))
+        a += step
+    return out
+
+# ============================================================
+# Shared memory
+# ============================================================
+class SharedArrays:
+    """วาง numpy arrays หลายตัวใน SharedMemory; meta (picklable) ใช้ attach ฝั่ง worker"""
+
+    def __init__(self, arrays):
+        self._shms = []
+        self.meta = {}
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a, dtype=np.float64)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+            self._shms.append(shm)
+            self.meta[name] = (shm.name, a.shape, a.dtype.str)
+
+    @staticmethod
+    def attach(meta):
+        shms, arrays = [], {}
+        for name, (shm_name, shape, dtype) in meta.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            shms.append(shm)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        return shms, arrays
+
+    def close(self):
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+# ============================================================
+# Worker
+# ============================================================
+class _LRU(OrderedDict):
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+_W = {}
+
+def _init_worker(meta, base_cfg, timeframe, windows, bt_kwargs):
+    shms, arrays = SharedArrays.attach(meta)
+    _W.update(shms=shms, ohlcv=arrays.pop("__main__"), tf_data=arrays, base_cfg=base_cfg,
+              timeframe=timeframe, windows=windows, bt_kwargs=bt_kwargs, cache=_LRU(CACHE_ENTRIES))
+
+def _evaluate(combo):
+    cfg = dict(_W["base_cfg"], **combo)
+    series = indicator_series(_W["ohlcv"], cfg, _W["timeframe"], _W["tf_data"], _W["cache"])
+    kw = _W["bt_kwargs"]
+    rows = []
+    for w, seg in enumerate(_W["windows"]):
+        if isinstance(seg[0], tuple):
+            (a, b), (c, d) = seg
+            tr = summarize(replay(series, cfg, a, b, **kw), kw.get("balance", 1000.0))
+            te = summarize(replay(series, cfg, c, d, **kw), kw.get("balance", 1000.0))
+            row = dict(combo, window=w, **{f"train_{k}": v for k, v in tr.items()}, **{f"test_{k}": v for k, v in te.items()})
+        else:
+            a, b = seg
+            row = dict(combo, **summarize(replay(series, cfg, a, b, **kw), kw.get("balance", 1000.0)))
+        rows.append(row)
+    return rows
+
+# ============================================================
+# Runner
+# ============================================================
+def run_sweep(ohlcv, base_cfg, combos, timeframe="30m", tf_data=None, windows=None, workers=None,
+              metric="net", balance=1000.0, fee=0.0004, qty_step=0.001):
+    """รัน combos ทั้งหมดบน process pool แล้วคืน pandas DataFrame ที่เรียงตาม metric (มาก -> น้อย)
+
+    windows = None: ทั้งชุด | walk_forward(...): แต่ละแถวมี train_* / test_* ต่อ window
+    """
+    import pandas as pd
+
+    arr = np.asarray(ohlcv, dtype=np.float64)
+    windows = windows or [(0, len(arr))]
+    arrays = {"__main__": arr}
+    arrays.update(tf_data or {})
+    shared = SharedArrays(arrays)
+    # combos ที่ใช้ indicator series เดียวกันอยู่ติดกัน -> ตกไป worker เดียวกันใน chunk เดียว
+    cfg_key = lambda c: tuple(str(dict(base_cfg, **c)[k]) for k in INDICATOR_PARAMS)
+    combos = sorted(combos, key=cfg_key)
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, math.ceil(len(combos) / (workers * 4)))
+    bt_kwargs = {"balance": balance, "fee": fee, "qty_step": qty_step}
+    rows = []
+    try:
+        with Pool(workers, _init_worker, (shared.meta, base_cfg, timeframe, windows, bt_kwargs)) as pool:
+            for r in pool.imap_unordered(_evaluate, combos, chunksize=chunk):
+                rows.extend(r)
+    finally:
+        shared.close()
+    df = pd.DataFrame(rows)
+    col = f"train_{metric}" if isinstance(windows[0][0], tuple) else metric
+    return df.sort_values(col, ascending=False, ignore_index=True)
+
+def walk_forward_report(df, params, metric="net"):
+    """ต่อ window: ชุดที่ดีที่สุดบน train และผล out-of-sample บน test"""
+    best = df.loc[df.groupby("window")[f"train_{metric}"].idxmax()]
+    return best[["window"] + list(params) + [f"train_{metric}", f"test_{metric}", "test_trades"]].reset_index(drop=True)
+
+# ============================================================
+# CLI
+# ============================================================
+def _value(s):
+    for cast in (int, float):
+        try:
+            return cast(s)
+        except ValueError:
+            pass
+    return {"True": True, "False": False}.get(s, s)
+
+def parse_space(items):
+    """["SL_DISTANCE=1000,2000", "NW_BANDWIDTH=6:10"] -> {"SL_DISTANCE": [1000, 2000], "NW_BANDWIDTH": (6, 10)}"""
+    space = {}
+    for it in items:
+        k, v = it.split("=", 1)
+        if ":" in v and "," not in v:
+            lo, hi = v.split(":")
+            space[k] = (_value(lo), _value(hi))
+        else:
+            space[k] = [_value(x) for x in v.split(",")]
+    return space
+
+if __name__ == "__main__":
+    import time
+    import main as live
+    from backtest import load_csv
+    from candles import timeframe_ms
+    from strategy_nw import config_from
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("csv")
+    ap.add_argument("--timeframe", default=live.TIMEFRAME, help="TF ของ csv หลัก เช่น 5m, 30m")
+    ap.add_argument("-p", "--param", action="append", default=[], help="NAME=v1,v2,.. หรือ NAME=lo:hi")
+    ap.add_argument("--random", type=int, default=0, help="จำนวนชุดสุ่ม (0 = grid)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--wf", help="walk-forward TRAIN:TEST (แท่ง)")
+    ap.add_argument("--tf", action="append", default=[], help="TF=path.csv สำหรับ MACD_TF")
+    ap.add_argument("-j", "--workers", type=int, default=None)
+    ap.add_argument("--metric", default="net")
+    ap.add_argument("-o", "--out", default="sweep_results.csv")
+    args = ap.parse_args()
+
+    space = parse_space(args.param)
+    if args.random:
+        combos = random_search(space, args.random, args.seed)
+    else:
+        bad = [k for k, v in space.items() if isinstance(v, tuple)]
+        if bad:
+            sys.exit(f"ช่วง lo:hi ใช้ได้กับ --random เท่านั้น: {bad}")
+        combos = grid(space)
+    ohlcv = load_csv(args.csv)
+    step = float(np.median(np.diff(ohlcv[:, 0]))) if len(ohlcv) > 1 else None
+    if step and step != timeframe_ms(args.timeframe):
+        sys.exit(f"{args.csv}: ระยะห่างแท่ง {step / 60000:g}m ไม่ตรงกับ --timeframe {args.timeframe}")
+    tf_data = {k: load_csv(v) for k, v in (x.split("=", 1) for x in args.tf)}
+    windows = None
+    if args.wf:
+        train, test = (int(x) for x in args.wf.split(":"))
+        windows = walk_forward(len(ohlcv), train, test)
+
+    t0 = time.perf_counter()
+    df = run_sweep(ohlcv, config_from(vars(live)), combos, args.timeframe, tf_data, windows, args.workers, args.metric)
+    df.to_csv(args.out, index=False)
+    print(f"{len(combos)} combos x {len(windows or [0])} windows in {time.perf_counter() - t0:.1f}s -> {args.out}")
+    print(df.head(20).to_string())
+    if windows:
+        print(walk_forward_report(df, space, args.metric).to_string())
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# โมดูลของบอทอยู่ที่ root ของ repo (ไม่ใช่ package): ให้ pytest import ได้ไม่ว่าจะรันจาก directory ไหน
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
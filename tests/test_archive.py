@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import ccxt
+import numpy as np
+import pytest
+
+from archive import Archive, Downloader, Throttle
+from candles import TS, resample
+
+SYM = "BTC/USDT:USDT"
+MIN = 60_000
+NOW = 1_717_200_000_000 + 30_000                 # ms, กลางแท่ง 1m
+N = 5_000
+
+def synthetic():
+    ts = (NOW // MIN * MIN) - MIN * np.arange(N - 1, -1, -1, dtype=np.int64)   # แถวสุดท้าย = แท่งที่ยังไม่ปิด
+    rng = np.random.default_rng(0)
+    c = 30000 * np.exp(np.cumsum(rng.normal(0, 1e-3, N)))
+    o = np.r_[30000, c[:-1]]
+    return np.column_stack([ts, o, np.maximum(o, c) + 1, np.minimum(o, c) - 1, c, rng.random(N)])
+
+BASE = synthetic()
+HOLE = (int(BASE[2000, TS]), int(BASE[2030, TS]))          # ช่วงปิดปรับปรุง: exchange ไม่มีแท่งจริง
+SERVED = BASE[((BASE[:, TS] < HOLE[0]) | (BASE[:, TS] >= HOLE[1])) & (BASE[:, TS] < NOW // MIN * MIN)]
+
+class FakeExchange:
+    """fetch_ohlcv แบบ Binance: หน้าละ limit แท่งจาก since, ข้ามช่วงที่ไม่มี; fail/drop จำลองปัญหาชั่วคราว"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = []
+        self.drop = set()
+        self.last_response_headers = {}
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls += 1
+        if self.fail:
+            raise self.fail.pop(0)
+        a = SERVED if timeframe == "1m" else resample(SERVED, timeframe)
+        a = a[a[:, TS] >= since][:limit]
+        return [r for r in a.tolist() if int(r[0]) not in self.drop]
+
+class Clock:
+    def __init__(self):
+        self.t = NOW / 1000
+        self.slept = []
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.t += s
+
+@pytest.fixture
+def env(tmp_path):
+    clock = Clock()
+    fx = FakeExchange()
+    arc = Archive(str(tmp_path / "history"))
+
+    def downloader(archive=arc):
+        th = Throttle(1200, clock=clock, sleep=clock.sleep)
+        return Downloader(fx, archive, limit=500, clock=clock, sleep=clock.sleep, throttle=th)
+    return fx, arc, downloader, tmp_path
+
+def closed_since(since):
+    return SERVED[SERVED[:, TS] >= since]
+
+def test_download_matches_exchange_and_records_hole(env):
+    fx, arc, downloader, _ = env
+    since = int(BASE[100, TS])
+    downloader().download(SYM, "1m", since)
+    s = arc.series(SYM, "1m")
+    assert np.array_equal(s.ohlcv(), closed_since(since))
+    assert s.gaps() == [HOLE]                                # ช่องกลางหน้า: ยังไม่รู้ว่าเป็น hole
+    assert downloader().fill_gaps(SYM, "1m") == 0
+    assert s.holes == [HOLE] and s.gaps() == []
+    assert s.verify()["ok"]
+
+def test_resume_after_crash_and_torn_append(env):
+    fx, arc, downloader, tmp_path = env
+    since = int(BASE[100, TS])
+
+    class Crash(Exception):
+        pass
+
+    def progress(series, added):
+        if added >= 1500:
+            raise Crash()
+    with pytest.raises(Crash):
+        downloader().download(SYM, "1m", since, progress=progress)
+    s = arc.series(SYM, "1m")
+    assert 0 < len(s) < len(closed_since(since))
+    with open(s._file("close"), "ab") as f:
+        f.write(b"x" * 13)                                   # append ที่เขียนไม่จบ
+    arc2 = Archive(str(tmp_path / "history"))
+    fx.fail = [ccxt.NetworkError("boom"), ccxt.RateLimitExceeded("429")]
+    calls = fx.calls
+    downloader(arc2).download(SYM, "1m", since)
+    s2 = arc2.series(SYM, "1m")
+    assert np.array_equal(s2.ohlcv(), closed_since(since))
+    assert fx.calls - calls < len(closed_since(since)) // 500 + 6    # ต่อจากเดิม ไม่เริ่มใหม่
+    calls = fx.calls
+    assert downloader(arc2).download(SYM, "1m", since) == 0
+    assert fx.calls - calls <= 1
+
+def test_fill_gaps_merges_once(env):
+    fx, arc, downloader, _ = env
+    since = int(BASE[100, TS])
+    dropped = [int(BASE[i, TS]) for i in (1000, 1001, 3000, 4000, 4500)]
+    fx.drop = set(dropped)
+    dl = downloader()
+    dl.download(SYM, "1m", since)
+    s = arc.series(SYM, "1m")
+    assert len(s.gaps()) == 5                                # 4 ช่องที่หาย + ช่วงปิดปรับปรุง
+    fx.drop = set()
+    gen = s.gen
+    assert dl.fill_gaps(SYM, "1m") == len(dropped)
+    assert s.gen == gen + 1                                  # เขียน series ใหม่ครั้งเดียวทุก gap
+    assert s.gaps() == [] and s.holes == [HOLE]
+    assert np.array_equal(s.ohlcv(), closed_since(since))
+
+def test_gap_missing_on_exchange_becomes_hole(env):
+    fx, arc, downloader, _ = env
+    since = int(BASE[100, TS])
+    missing = int(BASE[3000, TS])
+    fx.drop = {missing}
+    dl = downloader()
+    dl.download(SYM, "1m", since)
+    assert dl.fill_gaps(SYM, "1m") == 0                      # exchange ไม่มีจริง
+    s = arc.series(SYM, "1m")
+    assert (missing, missing + MIN) in s.holes
+    assert s.gaps() == []
+
+def test_head_extension_and_range_query(env):
+    fx, arc, downloader, _ = env
+    dl = downloader()
+    dl.download(SYM, "1m", int(BASE[3000, TS]))
+    dl.download(SYM, "1m", int(BASE[0, TS]))
+    s = arc.series(SYM, "1m")
+    assert np.array_equal(s.ohlcv(), SERVED)
+    a, b = int(BASE[500, TS]), int(BASE[900, TS])
+    cols = s.columns(a, b)
+    assert cols["ts"][0] == a and cols["ts"][-1] == b - MIN
+    assert np.shares_memory(s.frame(a, b)["close"].to_numpy(), s._mapped()["close"])
+
+def test_higher_timeframe(env):
+    fx, arc, downloader, _ = env
+    dl = downloader()
+    dl.download(SYM, "5m", int(BASE[0, TS]))
+    dl.fill_gaps(SYM, "5m")
+    s = arc.series(SYM, "5m")
+    assert s.verify()["ok"]
+    want = resample(SERVED, "5m")
+    want = want[(want[:, TS] >= BASE[0, TS]) & (want[:, TS] + 5 * MIN <= NOW)]
+    assert np.array_equal(s.ohlcv(), want)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import backtest
+from backtest import SimExchange, indicator_series, replay, run_backtest
+
+CFG = {
+    "EMA_ENABLED": True, "EMA_FAST": 50, "EMA_SLOW": 200,
+    "MACD_ENABLED": True, "MACD_TF": "30m", "USE_BREAKEVEN_MACD": False, "BREAKEVEN_MACD_TF": "30m",
+    "USE_REPAINT": False, "NW_BANDWIDTH": 8.0, "NW_MULT": 2, "NW_FACTOR": 1.5,
+    "TP_BUFFER": 300, "SL_DISTANCE": 800, "USE_BREAKEVEN": True, "BREAKEVEN_OFFSET": 250, "USE_MID_AS_TP": True,
+    "LEVERAGE": 10, "POSITION_MARGIN_FRACTION": 0.7, "NATIVE_STOPS": False,
+}
+
+def ohlcv(n=4000, seed=1):
+    """sine + random walk + หาง t (แท่งกระชากแตะ band ให้ได้ทั้ง TP / SL / BE)"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    close = 30000 + 1500 * np.sin(t / 40) + np.cumsum(rng.normal(0, 40, n)) + rng.standard_t(2, n) * 150
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.uniform(0, 80, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 80, n)
+    ts = 1_700_000_000_000 + t * 1_800_000
+    return np.column_stack([ts, open_, high, low, close, rng.uniform(10, 100, n)])
+
+def macd_up(dp,dn,ep,en):
+    return dp <= ep and dn > en
+
+def macd_down(dp,dn,ep,en):
+    return dp >= ep and dn < en
+
+def _ref_trades(series, cfg):
+    """decision loop เดิมของ main() (ก่อนแยก NWStrategy) ทีละแท่ง: ราคาปิด = last_close = ticker,
+    MACD / EMA / NW จาก series เดียวกับ replay, order ผ่าน SimExchange"""
+    ex = SimExchange(1000.0, 0.0004, cfg["LEVERAGE"], cfg["POSITION_MARGIN_FRACTION"], 0.001)
+    stats = {"pnl": 0.0, "trades": []}
+    macd = dict(series["macd"])
+    EMA_ENABLED, MACD_ENABLED, USE_MID_AS_TP = cfg["EMA_ENABLED"], cfg["MACD_ENABLED"], cfg["USE_MID_AS_TP"]
+    USE_BREAKEVEN_MACD, USE_BREAKEVEN = cfg["USE_BREAKEVEN_MACD"], cfg["USE_BREAKEVEN"]
+    BREAKEVEN_OFFSET, SL_DISTANCE, TP_BUFFER = cfg["BREAKEVEN_OFFSET"], cfg["SL_DISTANCE"], cfg["TP_BUFFER"]
+    position = None; sl_lock = False; pending = None
+
+    def live_macd(tf, i):
+        return macd[tf][i]
+
+    def close_trade(side, entry, last_price, qty, reason, now_ts):
+        pnl = (last_price - entry) * qty if side == "long" else (entry - last_price) * qty
+        stats["pnl"] += pnl
+        stats["trades"].append({"time": datetime.fromtimestamp(now_ts).strftime("%H:%M:%S"), "side": side.upper(),
+                                "entry": entry, "exit": last_price, "pnl": pnl, "reason": reason})
+        ex.market_order("sell" if side == "long" else "buy", qty, reduce_only=True)
+
+    for i in range(len(series["c"])):
+        upper, lower, mid = series["U"][i], series["L"][i], series["M"][i]
+        if upper != upper:
+            continue
+        e_fast = series["ef"][i] if EMA_ENABLED else None
+        e_slow = series["es"][i] if EMA_ENABLED else None
+        if EMA_ENABLED and (e_fast is None or e_slow is None):
+            continue
+        now_ts = series["t"][i]
+        last_close = last_price = ex.price = series["c"][i]
+        trend = "BUY" if EMA_ENABLED and e_fast > e_slow else "SELL" if EMA_ENABLED else None
+
+        macd_side_ok = None
+        if MACD_ENABLED:
+            mac = live_macd(cfg["MACD_TF"], i)
+            if mac:
+                dp,dn,ep,en = mac
+                if EMA_ENABLED:
+                    macd_side_ok = macd_up(dp,dn,ep,en) if trend=="BUY" else macd_down(dp,dn,ep,en)
+                else:
+                    macd_side_ok = True
+
+        amt = abs(ex.amount)
+        if amt == 0 and position is not None:
+            position = None
+
+        if position and amt > 0:
+            side = position["side"]; entry = position["entry"]; sl = position["sl"]; tp = position.get("tp")
+            if USE_BREAKEVEN_MACD:
+                mac_be = live_macd(cfg["BREAKEVEN_MACD_TF"], i)
+                if mac_be:
+                    dp,dn,ep,en = mac_be
+                    if side == "long" and macd_down(dp,dn,ep,en):
+                        if (last_close - entry) * position["qty"] > 0:
+                            if position["sl"] < entry + BREAKEVEN_OFFSET:
+                                position["sl"] = entry + BREAKEVEN_OFFSET
+                        else:
+                            close_trade(side, entry, last_price, position["qty"], "SL", now_ts)
+                            position = None; sl_lock = True; continue
+                    if side == "short" and macd_up(dp,dn,ep,en):
+                        if (entry - last_close) * position["qty"] > 0:
+                            if position["sl"] > entry - BREAKEVEN_OFFSET:
+                                position["sl"] = entry - BREAKEVEN_OFFSET
+                        else:
+                            close_trade(side, entry, last_price, position["qty"], "SL", now_ts)
+                            position = None; sl_lock = True; continue
+            if side=="long" and last_price <= sl:
+                reason = "BE" if abs(sl - (entry + BREAKEVEN_OFFSET)) < 1e-6 else "SL"
+                close_trade(side, entry, last_price, position["qty"], reason, now_ts)
+                position = None; sl_lock = True; continue
+            if side=="short" and last_price >= sl:
+                reason = "BE" if abs(sl - (entry - BREAKEVEN_OFFSET)) < 1e-6 else "SL"
+                close_trade(side, entry, last_price, position["qty"], reason, now_ts)
+                position = None; sl_lock = True; continue
+            if tp is not None:
+                if side=="long" and last_price >= tp:
+                    close_trade(side, entry, last_price, position["qty"], "TP_mid" if USE_MID_AS_TP else "TP_upper", now_ts)
+                    position = None; continue
+                if side=="short" and last_price <= tp:
+                    close_trade(side, entry, last_price, position["qty"], "TP_mid" if USE_MID_AS_TP else "TP_lower", now_ts)
+                    position = None; continue
+            if EMA_ENABLED:
+                trend_now = "BUY" if e_fast > e_slow else "SELL"
+                if (side=="long" and trend_now=="SELL" and last_price <= mid) or \
+                   (side=="short" and trend_now=="BUY" and last_price >= mid):
+                    close_trade(side, entry, last_price, position["qty"], "TP_mid_trend_flip", now_ts)
+                    position = None; continue
+            if not USE_BREAKEVEN_MACD and USE_BREAKEVEN and not sl_lock:
+                if side=="long" and last_close > mid and position["sl"] < entry + BREAKEVEN_OFFSET:
+                    position["sl"] = entry + BREAKEVEN_OFFSET
+                if side=="short" and last_close < mid and position["sl"] > entry - BREAKEVEN_OFFSET:
+                    position["sl"] = entry - BREAKEVEN_OFFSET
+            continue
+
+        if sl_lock:
+            if (last_close > mid) or (last_close < mid):
+                sl_lock = False
+            continue
+
+        if MACD_ENABLED and pending is not None:
+            side = pending["side"]; p_lower = pending["lower"]; p_upper = pending["upper"]; p_mid = pending["mid"]
+            if macd_side_ok:
+                if not EMA_ENABLED:
+                    mac = live_macd(cfg["MACD_TF"], i)
+                    if mac:
+                        dp,dn,ep,en = mac
+                        if side=="long" and not macd_up(dp,dn,ep,en):
+                            pending = None; continue
+                        if side=="short" and not macd_down(dp,dn,ep,en):
+                            pending = None; continue
+                if side=="long":
+                    if not (last_price < p_lower or last_price > p_mid):
+                        qty = ex.order_size(last_price)
+                        ex.market_order("buy", qty)
+                        tp_val = p_mid if USE_MID_AS_TP else (p_upper - TP_BUFFER)
+                        position = {"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
+                else:
+                    if not (last_price > p_upper or last_price < p_mid):
+                        qty = ex.order_size(last_price)
+                        ex.market_order("sell", qty)
+                        tp_val = p_mid if USE_MID_AS_TP else (p_lower + TP_BUFFER)
+                        position = {"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
+                pending = None
+            continue
+
+        for side, touched, ok in (("long", last_close <= lower, trend == "BUY"), ("short", last_close >= upper, trend == "SELL")):
+            if (not EMA_ENABLED or ok) and touched:
+                if MACD_ENABLED:
+                    pending = {"side":side,"touch_price":last_price,"lower":lower,"upper":upper,"mid":mid,"ts":now_ts}
+                else:
+                    qty = ex.order_size(last_price)
+                    ex.market_order("buy" if side == "long" else "sell", qty)
+                    if side == "long":
+                        tp_val = mid if USE_MID_AS_TP else (upper - TP_BUFFER)
+                        position = {"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
+                    else:
+                        tp_val = mid if USE_MID_AS_TP else (lower + TP_BUFFER)
+                        position = {"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
+                break
+    return stats, ex.balance
+
+@pytest.mark.parametrize("overrides", [
+    {},
+    {"MACD_ENABLED": False},
+    {"EMA_ENABLED": False, "MACD_ENABLED": False},
+    {"EMA_ENABLED": False, "MACD_ENABLED": False, "USE_MID_AS_TP": False},
+    {"USE_BREAKEVEN_MACD": True},
+    {"USE_REPAINT": True, "USE_BREAKEVEN": False},
+])
+def test_replay_matches_original_loop(overrides):
+    cfg = dict(CFG, **overrides)
+    data = ohlcv()
+    stats, balance = _ref_trades(indicator_series(data, cfg), cfg)
+    res = run_backtest(data, cfg)
+    assert len(stats["trades"]) >= 5
+    assert res["trades"] == stats["trades"]
+    assert res["pnl"] == stats["pnl"] and res["balance"] == balance
+
+def test_replay_strategy_log_is_quiet_by_default(caplog):
+    cfg = dict(CFG, MACD_ENABLED=False, EMA_ENABLED=False)
+    series = indicator_series(ohlcv(), cfg)
+    with caplog.at_level(logging.INFO):
+        backtest.strategy_log.setLevel(logging.WARNING)
+        quiet = replay(series, cfg)
+        assert not [r for r in caplog.records if r.levelno < logging.WARNING]
+        loud = replay(series, cfg, log=logging.getLogger("test.replay"))
+    assert any("SL Lock released" in r.getMessage() for r in caplog.records)
+    assert loud["trades"] == quiet["trades"]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import candles
+from candles import CLOSE, TS, CandleCache
+
+MIN = 60_000
+T0 = 1_717_200_000_000                   # หาร 1 วันลงตัว
+
+def base_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    c = 30000 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    o = np.r_[30000, c[:-1]]
+    return np.column_stack([T0 + MIN * np.arange(n, dtype=np.float64), o,
+                            np.maximum(o, c) + 1, np.minimum(o, c) - 1, c, rng.random(n)])
+
+class Clock:
+    def __init__(self, t):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+class FakeExchange:
+    """fetch_ohlcv แบบ Binance บนแท่ง 1m ที่เปิดแล้ว ณ clock(); TF อื่นรวมจาก 1m ตรงๆ ทีละกลุ่ม"""
+
+    def __init__(self, rows, clock):
+        self.rows = rows
+        self.clock = clock
+        self.calls = []
+
+    def _visible(self):
+        return self.rows[self.rows[:, TS] <= self.clock() * 1000]
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((timeframe, since, limit))
+        a = self._visible()
+        if timeframe != "1m":
+            a = direct(a, timeframe)
+        a = a[a[:, TS] >= since][:limit] if since is not None else a[-limit:]
+        return a.tolist()
+
+def direct(rows, timeframe):
+    """แท่ง TF ที่ใหญ่กว่าแบบ loop ธรรมดา (อ้างอิงแยกจาก candles.resample)"""
+    tf = candles.Timeframe(timeframe)
+    out = []
+    for r in rows.tolist():
+        k = tf.open_time(r[0])
+        if out and out[-1][0] == k:
+            b = out[-1]
+            b[2], b[3], b[4], b[5] = max(b[2], r[2]), min(b[3], r[3]), r[4], b[5] + r[5]
+        else:
+            out.append([float(k)] + r[1:])
+    return np.array(out).reshape(-1, 6)
+
+def same(a, b):
+    """ts/OHLC ตรงกันทุกบิต; volume ต่างได้แค่ลำดับการบวก"""
+    a, b = np.asarray(a), np.asarray(b)
+    return a.shape == b.shape and np.array_equal(a[:, :5], b[:, :5]) and np.allclose(a[:, 5], b[:, 5], rtol=1e-12)
+
+@pytest.fixture(autouse=True)
+def registry():
+    candles._caches.clear()
+    candles.use_base_timeframe(None)
+    yield
+    candles._caches.clear()
+    candles.use_base_timeframe(None)
+
+def setup(n=3000, at=499, size=100, **kw):
+    rows = base_rows(n)
+    clock = Clock((rows[at, TS] + 30_000) / 1000)
+    ex = FakeExchange(rows, clock)
+    return rows, clock, ex, CandleCache(ex, "BTC/USDT:USDT", "1m", size, clock=clock, **kw)
+
+def test_request_shape_since_limit():
+    rows, clock, ex, c = setup()
+    assert c.refresh_params() == {"limit": 100}
+    c.refresh()
+    assert np.array_equal(c.view(), rows[400:500])
+    clock.t += 3 * 60
+    assert c.refresh_params() == {"since": int(rows[499, TS]), "limit": 5}
+    c.refresh()
+    assert ex.calls[-1] == ("1m", int(rows[499, TS]), 5)
+    assert np.array_equal(c.view(), rows[403:503])
+
+def test_forming_bar_overwritten_in_place():
+    rows, clock, ex, c = setup()
+    c.refresh()
+    data = c._data
+    rows[499, CLOSE] += 7.5                              # แท่งที่ยังไม่ปิดเปลี่ยน
+    clock.t += 2                                         # เลย min_interval แต่ยังแท่งเดิม
+    c.refresh()
+    assert len(c) == 100 and c._n == 100 and c._data is data
+    assert c.view()[-1, CLOSE] == rows[499, CLOSE]
+    assert np.array_equal(c.view(), rows[400:500])
+
+def test_ring_compaction_keeps_views_contiguous():
+    rows, clock, ex, c = setup(size=10)
+    c.refresh()
+    data = c._data
+    for i in range(500, 560):
+        clock.t += 60
+        c.refresh()
+        v = c.view()
+        assert np.array_equal(v, rows[i - 9:i + 1])
+        assert c._data is data and c._n <= 20           # ย้ายกลับต้น array ไม่ realloc
+        assert np.shares_memory(v, data)
+        assert c.closes().flags["C_CONTIGUOUS"]
+        assert np.array_equal(c.closes(3), rows[i - 2:i + 1, CLOSE])
+    assert all(lim <= 3 for tf, since, lim in ex.calls[1:])
+
+def test_full_reload_after_long_gap():
+    rows, clock, ex, c = setup()
+    c.refresh()
+    clock.t += 150 * 60                                  # หลุดนานกว่า size
+    assert c.refresh_params() == {"limit": 100}
+    c.refresh()
+    assert np.array_equal(c.view(), rows[550:650])
+
+def test_min_interval_suppresses_repeat_fetches():
+    rows, clock, ex, c = setup(min_interval=1.0)
+    c.refresh().refresh().refresh()
+    assert len(ex.calls) == 1
+    clock.t += 0.5
+    c.refresh()
+    assert len(ex.calls) == 1
+    clock.t += 0.6
+    c.refresh()
+    assert len(ex.calls) == 2
+    c.refresh(force=True)
+    assert len(ex.calls) == 3
+    c.streaming = True                                   # stream ป้อนแท่งให้แล้ว
+    clock.t += 10
+    c.refresh()
+    assert len(ex.calls) == 3
+
+# ---------------- Timeframe / ResampledCache ----------------
+def ms(*ymd_hm):
+    from datetime import datetime, timezone
+    return int(datetime(*ymd_hm, tzinfo=timezone.utc).timestamp() * 1000)
+
+def test_week_buckets_open_on_monday():
+    tf = candles.Timeframe("1w")
+    assert tf.open_time(ms(2024, 6, 5, 13, 7)) == ms(2024, 6, 3)          # พุธ -> จันทร์
+    assert tf.open_time(ms(2024, 6, 3)) == ms(2024, 6, 3)
+    assert tf.open_time(ms(2024, 6, 2, 23, 59)) == ms(2024, 5, 27)        # อาทิตย์ -> จันทร์ก่อน
+    assert tf.close_time(ms(2024, 6, 5)) == ms(2024, 6, 10)
+    assert tf.open_time(0) == ms(1969, 12, 29)
+
+@pytest.mark.parametrize("at, start, end", [
+    ((2024, 2, 29, 23, 59), (2024, 2, 1), (2024, 3, 1)),                  # ปีอธิกสุรทิน 29 วัน
+    ((2023, 2, 15), (2023, 2, 1), (2023, 3, 1)),
+    ((2024, 4, 30, 12), (2024, 4, 1), (2024, 5, 1)),                      # 30 วัน
+    ((2024, 12, 31, 23, 59), (2024, 12, 1), (2025, 1, 1)),                # ข้ามปี
+    ((2025, 1, 1), (2025, 1, 1), (2025, 2, 1)),
+])
+def test_month_buckets(at, start, end):
+    tf = candles.Timeframe("1M")
+    assert tf.open_time(ms(*at)) == ms(*start)
+    assert tf.close_time(ms(*at)) == ms(*end)
+    assert tf.open_times([ms(*at), ms(*start)]).tolist() == [ms(*start)] * 2
+
+def test_intraday_and_invalid_timeframes():
+    tf = candles.Timeframe("4h")
+    assert tf.open_time(ms(2024, 6, 5, 13, 7)) == ms(2024, 6, 5, 12)
+    assert candles.Timeframe("3d").open_time(ms(1970, 1, 5)) == ms(1970, 1, 4)
+    for bad in ("2w", "0m", "5x", "", None):
+        with pytest.raises(ValueError):
+            candles.Timeframe(bad)
+
+@pytest.mark.parametrize("timeframe", ["5m", "30m", "1h", "4h", "1d"])
+def test_resample_matches_direct_aggregation(timeframe):
+    rows = base_rows(3000)
+    assert same(candles.resample(rows, timeframe), direct(rows, timeframe))
+
+def resampled(timeframe, at, size=50):
+    rows = base_rows(6000)
+    clock = Clock((rows[at, TS] + 30_000) / 1000)
+    ex = FakeExchange(rows, clock)
+    candles.use_base_timeframe("1m")
+    c = candles.get_cache(ex, "BTC/USDT:USDT", timeframe, size)
+    assert isinstance(c, candles.ResampledCache)
+    c.clock = c.base.clock = clock
+    return rows, clock, ex, c
+
+def test_forming_resampled_bar_matches_direct_fetch():
+    rows, clock, ex, c = resampled("30m", 1000)
+    c.refresh()
+    for _ in range(70):                                  # ไล่ทีละนาทีข้ามขอบแท่ง 30m
+        clock.t += 60
+        c.refresh()
+        want = np.array(ex.fetch_ohlcv(c.symbol, "30m", limit=c.size))
+        assert same(c.view(), want)            # รวมแท่งที่ยังไม่ปิด
+    direct_calls = [x for x in ex.calls if x[0] == "30m"]
+    assert len(direct_calls) == 1 + 70                   # โหลดประวัติครั้งเดียว + ที่ test ยิงเทียบเอง
+
+def test_resampled_falls_back_when_base_does_not_reach_bar_open():
+    rows, clock, ex, c = resampled("30m", 1000)
+    c.refresh()
+    n30 = sum(1 for x in ex.calls if x[0] == "30m")
+    clock.t += 300 * 60                                  # หลุดนานกว่าที่ base เก็บ (2*30+60 แท่ง)
+    c.refresh()
+    assert sum(1 for x in ex.calls if x[0] == "30m") == n30 + 1     # ดึง 30m ตรงก่อน
+    want = np.array(ex.fetch_ohlcv(c.symbol, "30m", limit=c.size))
+    assert same(c.view(), want)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import types
+
+import pytest
+
+import bench
+import host
+import snapshot
+from backtest import SimExchange
+from candles import use_base_timeframe
+from orders import STOP
+
+SYM = "BTC/USDT:USDT"
+
+class Real(bench.FakeExchange):
+    """exchange จริงจำลอง: market order fill ที่ราคา sim + slippage 1 USDT, stop จริงอยู่บน sim"""
+    markets = {}
+
+    def create_market_order(self, symbol, side, qty, price=None, params=None):
+        f = super().create_market_order(symbol, side, qty, price, params)
+        px = f["price"] + (1.0 if side == "buy" else -1.0)
+        return {"filled": f["qty"], "average": px, "fee": {"cost": f["fee"]}, "status": "closed"}
+
+    def fetch_order(self, id, symbol=None):
+        return self.sim.fetch_order(id, symbol)
+
+    def fetch_open_orders(self, symbol=None):
+        return self.sim.fetch_open_orders(symbol)
+
+    def set_leverage(self, leverage, symbol=None):
+        pass
+
+class P:
+    def __init__(self, name):
+        self.name, self.symbol, self.alive, self.wake = name, SYM, True, 0
+        self.capital, self.leverage, self.margin_fraction = 1000, 10, 0.7
+        self.mod = types.SimpleNamespace()
+
+    def files(self):
+        return {}
+
+    def attach(self, account, notify, clock=None):
+        return self
+
+@pytest.fixture
+def env():
+    sim = SimExchange(10000)
+    ex = Real(bench.synthetic_ohlcv(600, "1m", 1), SYM, sim)
+    h = host.Host(ex, [P("a"), P("b")], state_file=None)
+    h.accounts = {n: host.StrategyAccount(h, n, SYM, 1000) for n in "ab"}
+    h.refresh()
+    return h, sim, h.accounts["a"], h.accounts["b"]
+
+def stop(a, side, px, qty):
+    return a.create_order(SYM, STOP, side, qty, None, {"stopPrice": px, "reduceOnly": True})
+
+def exchange_stops(sim):
+    return [(o["side"], o["amount"], o["stopPrice"]) for o in sim.fetch_open_orders() if o["type"] == STOP]
+
+def test_internal_cross_and_attribution(env):
+    h, sim, a, b = env
+    a.create_market_order(SYM, "buy", 0.1)
+    b.create_market_order(SYM, "sell", 0.04)
+    h.settle()
+    assert sim.amount == pytest.approx(0.06)
+    assert b.fees == 0 and b.slippage == 0 and b.crossed == pytest.approx(0.04)
+    assert a.slippage == pytest.approx(0.06) and a.crossed == pytest.approx(0.04)
+    assert a.fees == pytest.approx(sim.fees)
+
+def test_dust_delta_keeps_fills_pending(env):
+    h, sim, a, b = env
+    a.create_market_order(SYM, "buy", 0.0005)           # ต่ำกว่า step 0.001
+    fee = a.fees
+    h.settle()
+    assert sim.amount == 0 and len(h._pending[SYM]) == 1
+    assert a.crossed == 0 and a.fees == fee              # ยังไม่ถือว่าหักล้างภายใน / ยังไม่คืน fee
+    a.create_market_order(SYM, "buy", 0.0007)
+    h.settle()
+    assert sim.amount == pytest.approx(0.001) and h._pending[SYM] == []
+    assert a.slippage == pytest.approx(0.001)
+    assert a.crossed == pytest.approx(0.0002)
+    assert a.fees == pytest.approx(sim.fees)
+
+def test_exchange_stop_tracks_widest_sl(env):
+    h, sim, a, b = env
+    px = a.price
+    a.create_market_order(SYM, "buy", 0.1)
+    stop(a, "sell", px * 0.99, 0.1)
+    b.create_market_order(SYM, "buy", 0.05)
+    sl_b = stop(b, "sell", px * 0.98, 0.05)
+    h.settle()
+    assert exchange_stops(sim) == [("sell", 0.15, round(px * 0.98, 1))]
+    b.cancel_order(sl_b["id"])
+    stop(b, "sell", px * 0.985, 0.05)
+    h.settle()
+    assert exchange_stops(sim) == [("sell", 0.15, round(px * 0.985, 1))]
+    a.create_market_order(SYM, "sell", 0.1, params={"reduceOnly": True})
+    h.settle()
+    assert exchange_stops(sim) == [("sell", 0.05, round(px * 0.985, 1))]
+    b.create_market_order(SYM, "sell", 0.1)             # กลับเป็น short ไม่มี SL เสมือน
+    h.settle()
+    assert exchange_stops(sim) == []
+    stop(b, "buy", px * 1.02, 0.05)
+    stop(a, "buy", px * 1.03, 0.05)                      # a ไม่มี position: ไม่นับ
+    h.settle()
+    assert exchange_stops(sim) == [("buy", 0.05, round(px * 1.02, 1))]
+
+def test_exchange_stop_fill_is_attributed(env):
+    h, sim, a, b = env
+    px = a.price
+    a.create_market_order(SYM, "buy", 0.1)
+    stop(a, "sell", px * 0.99, 0.1)
+    h.settle()
+    orders = h.orders
+    sim.trigger(px, px, px * 0.98)                       # stop จริงทำงานระหว่าง tick
+    a.trigger(px, px, px * 0.98)
+    h.real[SYM] = sim.amount
+    h.settle()
+    assert sim.amount == 0 and h.orders == orders        # ไม่ต้องส่ง order สุทธิซ้ำ
+    assert a.amount == 0 and a.crossed == 0
+    assert h.guards[SYM].legs == {} and exchange_stops(sim) == []
+    assert a.fees == pytest.approx(sim.fees)
+
+@pytest.mark.parametrize("sl_b", [True, False])
+def test_restart_after_exchange_stop_fill(env, tmp_path, sl_b):
+    h, sim, a, b = env
+    px = a.price
+    a.create_market_order(SYM, "buy", 0.1)
+    stop(a, "sell", px * 0.99, 0.1)
+    b.create_market_order(SYM, "buy", 0.05)
+    if sl_b:
+        stop(b, "sell", px * 0.995, 0.05)
+    h.settle()
+    path = str(tmp_path / "host_state.npz")
+    snapshot.save(path, h.state())
+    assert h.state()["last"][SYM] == h._last[SYM]
+    sim.trigger(px, px, px * 0.98)                       # stop จริงทำงานตอน host หยุด
+    assert sim.amount == 0
+    h2 = host.Host(h.ex, [P("a"), P("b")], state_file=path)
+    try:
+        h2.start()
+    finally:
+        use_base_timeframe(None)
+    assert h2._last[SYM] == h._last[SYM]
+    h2.settle()
+    a2, b2 = h2.accounts["a"], h2.accounts["b"]
+    assert sim.amount == 0 and h2.orders == 0             # ไม่เปิด position ที่ stop ปิดไปแล้วกลับคืน
+    assert a2.amount == 0 and b2.amount == 0
+    assert a2.fills[-1]["price"] == round(px * 0.99, 1)
+    assert a2.crossed == pytest.approx(0, abs=1e-12) and b2.crossed == pytest.approx(0, abs=1e-12)
+    assert h2.guards[SYM].legs == {} and exchange_stops(sim) == []
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from indicators import EMAState, MACDState, ema, macd
+
+def closes(n=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    return 30000 * np.exp(np.cumsum(rng.normal(0, 2e-3, n)))
+
+def test_batch_matches_streaming():
+    c = closes(500)
+    assert ema(c, 50) == EMAState(50).seed(c).value
+    assert macd(c) == MACDState().seed(c).snapshot()
+    assert ema(c[:10], 50) is None and macd(c[:30]) is None
+
+def test_sync_is_incremental_and_tracks_window():
+    c = closes()
+    ts = np.arange(len(c), dtype=np.float64) * 60_000
+    window = 600
+    e, m = EMAState(100), MACDState()
+    for i in range(window, len(c) + 1, 7):
+        w = slice(i - window, i)
+        before = e.count
+        e.sync(ts[w], c[w])
+        m.sync(ts[w], c[w])
+        if before:
+            assert e.count - before == 7 or i == window        # ต่อแท่งใหม่เท่านั้น ไม่ seed ใหม่ทั้ง window
+        assert e.value == pytest.approx(ema(c[w], 100), rel=1e-6)     # ต่างแค่ seed ของ window ที่ลดลง (1 - k)^n
+        assert m.snapshot() == pytest.approx(macd(c[w]), rel=1e-6, abs=1e-9)
+
+def test_sync_reseeds_after_gap():
+    c = closes(1000)
+    ts = np.arange(len(c), dtype=np.float64) * 60_000
+    e = EMAState(20).sync(ts[:300], c[:300])
+    e.sync(ts[500:800], c[500:800])                             # แท่งแรกใหม่กว่า last_ts -> seed ใหม่
+    assert e.count == 300 and e.value == ema(c[500:800], 20)
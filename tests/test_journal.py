@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import json
+
+from journal import Journal
+
+TS = 1_700_000_000.0
+
+def trade(pnl, reason="TP_mid"):
+    return {"pnl": pnl, "reason": reason}
+
+def reopen(path):
+    return Journal(str(path), clock=lambda: TS)
+
+def test_commit_survives_restart(tmp_path):
+    p = tmp_path / "trades.journal"
+    j = reopen(p)
+    j.stats["trades"] += [trade(1.5), trade(-0.5, "SL")]
+    assert j.commit() == 2
+    assert j.commit() == 0                       # ไม่มี trade ใหม่ = ไม่เขียน
+    j.close()
+    j = reopen(p)
+    assert [t["pnl"] for t in j.stats["trades"]] == [1.5, -0.5]
+    assert j.month(j.stats["month"])["n"] == 2
+
+def test_torn_line_is_dropped(tmp_path):
+    p = tmp_path / "trades.journal"
+    j = reopen(p)
+    j.stats["trades"].append(trade(1.0))
+    j.commit()
+    j.close()
+    with open(p, "a") as f:
+        f.write('{"seq": 2, "ts": 1')                # crash กลาง write
+    j = reopen(p)
+    assert len(j.stats["trades"]) == 1
+    assert p.read_text().endswith("\n")
+
+def test_complete_json_without_newline_is_torn(tmp_path):
+    """บรรทัดสุดท้ายเป็น JSON ครบแต่ไม่มี \\n: ต้องตัดทิ้ง ไม่งั้น append ถัดไปต่อบรรทัดเดียวกัน
+    แล้ว restart ครั้งหลังจะตัด trade ที่ commit แล้วทิ้งไปด้วย"""
+    p = tmp_path / "trades.journal"
+    j = reopen(p)
+    j.stats["trades"].append(trade(1.0))
+    j.commit()
+    j.close()
+    rec = {"seq": 2, "ts": TS, "k": "trade", "trade": trade(9.0)}
+    with open(p, "a") as f:
+        f.write(json.dumps(rec))                     # ไม่มี \n = write ยังไม่จบ
+    j = reopen(p)
+    assert [t["pnl"] for t in j.stats["trades"]] == [1.0]
+    j.stats["trades"].append(trade(2.0))
+    j.commit()
+    j.close()
+    j = reopen(p)
+    assert [t["pnl"] for t in j.stats["trades"]] == [1.0, 2.0]
+
+def test_compaction_keeps_aggregates(tmp_path):
+    p = tmp_path / "trades.journal"
+    j = Journal(str(p), compact_every=3, clock=lambda: TS)
+    for i in range(7):
+        j.stats["trades"].append(trade(float(i)))
+        j.commit()
+    j.close()
+    j = reopen(p)
+    assert len(j.stats["trades"]) == 7
+    assert j.month(j.stats["month"])["pnl"] == sum(range(7))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import json, socket
+
+import pytest
+
+from notifier import MAX_TEXT, Notifier, serve_stub
+
+@pytest.fixture
+def stub():
+    server, url = serve_stub()
+    yield server, url
+    server.shutdown()
+
+def dead_url():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return f"http://127.0.0.1:{port}"
+
+def test_burst_is_coalesced_into_one_request(stub):
+    server, url = stub
+    n = Notifier("t", "1", url=url, coalesce_sec=0.2)
+    for i in range(3):
+        n.send(f"m{i}")
+    assert n.flush(5)
+    n.stop()
+    assert server.received == ["m0\n\nm1\n\nm2"]
+    assert n.sent == 3 and n.requests == 1
+
+def test_retry_after_server_error(stub):
+    server, url = stub
+    server.fail = 2
+    n = Notifier("t", "1", url=url, coalesce_sec=0.0)
+    n.send("hello")
+    assert n.flush(5)
+    n.stop()
+    assert server.received == ["hello"] and n.requests == 3
+
+def test_tags_suppress_duplicates(stub):
+    server, url = stub
+    n = Notifier("t", "1", url=url, coalesce_sec=0.0)
+    assert n.send("tp1", tag="tp1:done")
+    assert not n.send("tp1 again", tag="tp1:done")
+    n.clear_sent("tp1")
+    assert n.send("tp1 next cycle", tag="tp1:done")
+    n.flush(5)
+    n.stop()
+    assert "\n\n".join(server.received) == "tp1\n\ntp1 next cycle"
+
+def test_undelivered_messages_are_spooled_and_sent_on_next_start(tmp_path, stub):
+    spool = tmp_path / "tg_unsent.json"
+    down = Notifier("t", "1", url=dead_url(), coalesce_sec=0.0, spool_path=str(spool))
+    down.send("alert before crash")
+    assert not down.flush(0.3)
+    down.stop(timeout=0.3)
+    assert json.loads(spool.read_text()) == ["alert before crash"]
+
+    server, url = stub
+    up = Notifier("t", "1", url=url, coalesce_sec=0.0, spool_path=str(spool))
+    assert up.flush(5)                               # ไม่ต้องมี send() ใหม่มากระตุ้น
+    up.stop()
+    assert server.received == ["alert before crash"]
+    assert not spool.exists()
+
+def test_disabled_calls_fallback(tmp_path):
+    seen = []
+    spool = tmp_path / "tg_unsent.json"
+    spool.write_text('["old"]')
+    n = Notifier("YOUR_TELEGRAM_TOKEN", "1", spool_path=str(spool), on_disabled=seen.append)
+    assert not n.send("x")
+    assert seen == ["x"] and spool.read_text() == '["old"]'
+
+def test_importing_main_leaves_spool_alone():
+    import main
+    assert main.notifier is None                    # backtest/sweep/archive/runner import main
+
+def test_rejected_batch_is_resent_one_by_one():
+    server, url = serve_stub(reject=lambda text: "<b>bad" in text)
+    try:
+        n = Notifier("t", "1", url=url, parse_mode="HTML", coalesce_sec=0.2)
+        for m in ("<b>m0</b>", "<b>bad", "<i>m2</i>"):
+            n.send(m)
+        assert n.flush(5)
+        n.stop()
+    finally:
+        server.shutdown()
+    assert server.received == ["<b>m0</b>", "<i>m2</i>"]
+    assert n.sent == 2 and n.dropped == 1 and n.requests == 4
+
+@pytest.mark.parametrize("tail", ["<i>x</i>", "&amp;", "<a href='https://example.com/x'>link</a>"])
+def test_long_html_is_clipped_on_tag_boundary(tail):
+    n = Notifier(None, None, parse_mode="HTML")
+    msg = "<b>" + "x" * (MAX_TEXT - 10) + tail * 50 + "</b>"
+    out = n._clip(msg)
+    assert len(out) <= MAX_TEXT
+    assert out.endswith("…</b>")
+    body = out[3:-len("…</b>")]
+    assert body.count("<") == body.count(">")
+    assert body.count("&") == body.count(";")
+    assert Notifier(None, None)._clip("y" * 5000) == "y" * MAX_TEXT
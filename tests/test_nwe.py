@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+import pytest
+
+from nwe import NW_MIN_BARS, NW_WINDOW, NWEndpoint, NWEngine
+
+def nwe_luxalgo_repaint(closes, h, mult, factor):
+    """ของเดิมใน main.py (loop ทีละค่า)"""
+    n = len(closes)
+    if n < 200:
+        return None, None, None
+    win = min(499, n - 1)
+    coefs = [math.exp(-(i * i) / (2 * (h ** 2))) for i in range(win)]
+    den = sum(coefs)
+    num = sum(closes[-1 - j] * coefs[j] for j in range(win))
+    mean = num / den
+    win_s = int(h * 10)
+    win_s = min(win_s, win - 1)
+    diffs = [abs(closes[-1 - i] - closes[-1 - i - 1]) for i in range(1, win_s)]
+    mae = (sum(diffs) / len(diffs)) * mult * factor if diffs else 0.0
+    return mean + mae, mean - mae, mean
+
+def closes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 30000 * np.exp(np.cumsum(rng.standard_t(4, n) * 2e-3))
+
+PARAMS = [(8.0, 4, 1.5), (3.0, 2, 1.0), (0.1, 3, 1.5)]       # h=0.1 -> win_s <= 1 (mae = 0)
+
+@pytest.mark.parametrize("h, mult, factor", PARAMS)
+@pytest.mark.parametrize("n", [150, NW_MIN_BARS - 1, NW_MIN_BARS, 201, 350, NW_WINDOW, NW_WINDOW + 1, NW_WINDOW + 2, 1200])
+def test_envelope_matches_original_loop(n, h, mult, factor):
+    c = closes(n, seed=n)
+    ref = nwe_luxalgo_repaint(c.tolist(), h, mult, factor)
+    got = NWEngine(h, mult, factor).envelope(c)
+    if ref[0] is None:
+        assert got == (None, None, None)
+    else:
+        assert got == pytest.approx(ref, rel=1e-12)
+
+@pytest.mark.parametrize("h, mult, factor", PARAMS)
+def test_envelope_series_matches_original_loop_per_bar(h, mult, factor):
+    c = closes(900, seed=1)
+    upper, lower, mid = NWEngine(h, mult, factor).envelope_series(c)
+    assert np.isnan(mid[:NW_MIN_BARS - 1]).all()
+    # warmup (kernel เปลี่ยนทุกแท่ง), รอยต่อ warmup -> steady, steady (convolution)
+    idx = sorted(set(range(NW_MIN_BARS - 1, len(c), 17)) | {NW_MIN_BARS - 1, NW_WINDOW - 1, NW_WINDOW, NW_WINDOW + 1, len(c) - 1})
+    for i in idx:
+        ref = nwe_luxalgo_repaint(c[:i + 1].tolist(), h, mult, factor)
+        assert (upper[i], lower[i], mid[i]) == pytest.approx(ref, rel=1e-12), i
+
+def endpoint_ref(c, h, mult, factor, window=NW_WINDOW):
+    """non-repaint แบบตรงไปตรงมา: mid ของแท่ง i = repaint mid ณ แท่ง i, mae = เฉลี่ย |close - mid| ย้อนหลัง window แท่ง"""
+    res, out = [], []
+    for i in range(len(c)):
+        mid = nwe_luxalgo_repaint(c[:i + 1], h, mult, factor)[2]
+        if mid is not None:
+            res.append((i, abs(c[i] - mid)))
+        r = [x for j, x in res if j > i - window]
+        if mid is None:
+            out.append((None, None, None))
+            continue
+        mae = sum(r) / len(r) * mult * factor
+        out.append((mid + mae, mid - mae, mid))
+    return out
+
+@pytest.mark.parametrize("h, mult, factor", PARAMS[:2])
+def test_endpoint_update_and_peek_match_series(h, mult, factor):
+    c = closes(1300, seed=2)
+    ts = np.arange(len(c), dtype=np.float64) * 1_800_000
+    eng = NWEngine(h, mult, factor)
+    series = np.column_stack(eng.endpoint_series(c))
+    ref = endpoint_ref(c[:700].tolist(), h, mult, factor)
+    for i in (NW_MIN_BARS - 1, 300, NW_WINDOW, 699):
+        assert tuple(series[i]) == pytest.approx(ref[i], rel=1e-9)
+    ep = NWEndpoint(h, mult, factor)
+    for i in range(len(c)):
+        if i % 5 == 0 and i:
+            # แท่งที่ยังไม่ปิด: peek ด้วยราคาปิดจริงของแท่ง i = ค่าหลัง update แท่ง i และไม่แก้ state
+            before = (ep.count, ep.value)
+            peeked = ep.peek(c[i])
+            assert (ep.count, ep.value) == before
+            if i < NW_MIN_BARS - 1:
+                assert peeked == (None, None, None)
+            else:
+                assert peeked == pytest.approx(tuple(series[i]), rel=1e-9)
+        got = ep.update(float(c[i]), ts[i])
+        if i < NW_MIN_BARS - 1:
+            assert got == (None, None, None)
+        else:
+            assert got == pytest.approx(tuple(series[i]), rel=1e-9), i
+
+def test_endpoint_sync_sliding_window_and_gap():
+    h, mult, factor = PARAMS[0]
+    c = closes(2600, seed=3)
+    ts = np.arange(len(c), dtype=np.float64) * 1_800_000
+    series = np.column_stack(NWEngine(h, mult, factor).endpoint_series(c))
+    ep = NWEndpoint(h, mult, factor)
+    w = 2 * NW_WINDOW
+    for end in range(w, 1800, 13):                  # window ของ cache เลื่อน: ต่อเฉพาะแท่งใหม่
+        count = ep.count
+        got = ep.sync(ts[end - w:end], c[end - w:end])
+        assert got == pytest.approx(tuple(series[end - 1]), rel=1e-9)
+        assert ep.count == (w if end == w else count + 13)
+    assert ep.sync(ts[end - w:end], c[end - w:end]) == got        # ไม่มีแท่งใหม่
+    # ประวัติขาดช่วง: seed ใหม่จาก window ใหม่ = endpoint_series ของ window นั้น
+    a, b = 2000, 2600
+    got = ep.sync(ts[a:b], c[a:b])
+    assert ep.count == b - a and ep.last_ts == ts[b - 1]
+    assert got == pytest.approx(tuple(np.column_stack(NWEngine(h, mult, factor).endpoint_series(c[a:b]))[-1]), rel=1e-9)
+    assert ep.peek(c[b - 1]) == pytest.approx(
+        tuple(np.column_stack(NWEngine(h, mult, factor).endpoint_series(np.append(c[a:b], c[b - 1])))[-1]), rel=1e-9)
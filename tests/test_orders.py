@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from backtest import SimExchange
+from orders import STOP, TAKE, ProtectiveOrders
+
+SYM = "BTC/USDT:USDT"
+
+class Flaky(SimExchange):
+    """SimExchange ที่ cancel_order / fetch_order ล้มตามจำนวนครั้งที่ตั้งไว้ (network error ชั่วคราว)"""
+
+    def __init__(self, *a, **k):
+        super().__init__(*a, **k)
+        self.fail_cancel = 0
+        self.fail_fetch = 0
+
+    def cancel_order(self, id, symbol=None):
+        if self.fail_cancel:
+            self.fail_cancel -= 1
+            raise ConnectionError("cancel timeout")
+        return super().cancel_order(id, symbol)
+
+    def fetch_order(self, id, symbol=None):
+        if self.fail_fetch:
+            self.fail_fetch -= 1
+            raise ConnectionError("fetch timeout")
+        return super().fetch_order(id, symbol)
+
+@pytest.fixture
+def ex():
+    ex = Flaky(1000.0)
+    ex.price = 100.0
+    ex.market_order("buy", 1.0)
+    return ex
+
+def live(ex):
+    return {o["id"] for o in ex.fetch_open_orders(SYM)}
+
+def test_sl_fill_is_reported_once(ex):
+    po = ProtectiveOrders(ex, SYM).open("long")
+    sl = po.place("sl", STOP, 95.0, 1.0)
+    tp = po.place("tp", TAKE, 110.0, 1.0)
+    assert live(ex) == {sl["id"], tp["id"]}
+    assert po.reconcile() == []
+    ex.trigger(100.0, 101.0, 94.0)
+    exits = po.reconcile()
+    assert [(e["tag"], e["qty"], e["price"]) for e in exits] == [("sl", 1.0, 95.0)]
+    assert po.reconcile() == []
+    assert ex.amount == 0
+
+def test_move_stop_creates_before_cancel(ex):
+    po = ProtectiveOrders(ex, SYM).open("long")
+    old = po.place("sl", STOP, 95.0, 1.0)
+    new = po.place("sl", STOP, 99.0, 1.0)
+    assert live(ex) == {new["id"]}
+    assert ex.fetch_order(old["id"])["status"] == "canceled"
+
+def test_failed_cancel_is_retried_until_confirmed(ex):
+    po = ProtectiveOrders(ex, SYM).open("long")
+    tp = po.place("tp", TAKE, 110.0, 1.0)
+    ex.fail_cancel, ex.fail_fetch = 1, 1
+    assert po.cancel_all() == []
+    assert "tp" not in po.legs
+    assert live(ex) == {tp["id"]}                  # ยังอยู่บน exchange: ต้องไม่ถูกลืม
+    assert tp["id"] in po.snapshot()["stale"]
+    po.reconcile()
+    assert live(ex) == set()
+    assert po.snapshot()["stale"] == {}
+
+def test_stale_leg_survives_restart(ex):
+    po = ProtectiveOrders(ex, SYM).open("long")
+    tp = po.place("tp", TAKE, 110.0, 1.0)
+    ex.fail_cancel, ex.fail_fetch = 1, 1
+    po.cancel("tp")
+    po2 = ProtectiveOrders(ex, SYM).restore(po.snapshot())
+    po2.reconcile()
+    assert live(ex) == set() and ex.fetch_order(tp["id"])["status"] == "canceled"
+
+def test_stale_leg_that_filled_reports_exit(ex):
+    po = ProtectiveOrders(ex, SYM).open("long")
+    po.place("tp", TAKE, 110.0, 1.0)
+    ex.fail_cancel, ex.fail_fetch = 1, 1
+    po.cancel("tp")
+    ex.trigger(100.0, 111.0, 100.0)                 # fill ก่อนยกเลิกซ้ำทัน
+    exits = po.reconcile()
+    assert [(e["tag"], e["qty"]) for e in exits] == [("tp", 1.0)]
+    assert po.snapshot()["stale"] == {}
+
+def test_cancel_stray_leaves_own_legs(ex):
+    stray = ex.create_order(SYM, STOP, "sell", 1.0, None, {"stopPrice": 90.0, "reduceOnly": True})
+    po = ProtectiveOrders(ex, SYM).open("long")
+    sl = po.place("sl", STOP, 95.0, 1.0)
+    assert po.cancel_stray() == 1
+    assert live(ex) == {sl["id"]}
+    assert ex.fetch_order(stray["id"])["status"] == "canceled"
+
+def test_nw_sl_failure_cancels_tp():
+    """ขยับ SL ไม่สำเร็จ -> เทียบราคาเองทั้งคู่: TP บน exchange ต้องไม่ค้างอยู่โดยไม่มี SL ระดับเดียวกัน"""
+    import main
+    from strategy_nw import NWStrategy, config_from
+
+    ex = SimExchange(1000.0)
+    ex.price = 100.0
+    st = NWStrategy(config_from(vars(main), NATIVE_STOPS=True, SL_DISTANCE=5.0, BREAKEVEN_OFFSET=1.0), ex)
+    st._open("long", 100.0, 110.0)
+    assert {leg["type"] for leg in st.orders.legs.values()} == {STOP, TAKE}
+    ex.price = 94.0                                  # SL ใหม่ที่ 96 จะ trigger ทันที -> exchange ปฏิเสธ
+    st._set_sl(st.position, 96.0)
+    assert st.position["protected"] is False
+    assert [o["type"] for o in ex.fetch_open_orders(SYM)] == [STOP]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import main
+from runner import PRIO_ACCOUNT, PRIO_DATA, PRIO_ORDER, IntentBroker, WeightBudget, symbol_config
+from strategy_nw import NWStrategy
+
+class Counting(WeightBudget):
+    dispatches = 0
+
+    def _dispatch(self):
+        self.dispatches += 1
+        super()._dispatch()
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 30))
+
+def test_priority_order_when_blocked():
+    async def go():
+        b = WeightBudget(limit=10, window=0.2)
+        await b.acquire(10, PRIO_ORDER)
+        done = []
+
+        async def one(name, prio):
+            await b.acquire(1, prio)
+            done.append(name)
+        tasks = [asyncio.create_task(one(n, p)) for n, p in
+                 (("data", PRIO_DATA), ("account", PRIO_ACCOUNT), ("order", PRIO_ORDER), ("data2", PRIO_DATA))]
+        await asyncio.sleep(0.05)
+        assert done == []
+        await asyncio.gather(*tasks)
+        return done
+    assert run(go()) == ["order", "account", "data", "data2"]
+
+def test_ceilings_reserve_budget_for_orders():
+    async def go():
+        b = WeightBudget(limit=10, window=5.0)
+        await b.acquire(8, PRIO_DATA)                    # data ใช้ได้ถึง 0.8 ของ limit
+        data = asyncio.create_task(b.acquire(1, PRIO_DATA))
+        await asyncio.sleep(0.02)
+        assert not data.done()
+        await asyncio.wait_for(b.acquire(1, PRIO_ACCOUNT), 0.5)     # account ถึง 0.9
+        account = asyncio.create_task(b.acquire(1, PRIO_ACCOUNT))
+        await asyncio.sleep(0.02)
+        assert not account.done() and not data.done()
+        await asyncio.wait_for(b.acquire(1, PRIO_ORDER), 0.5)       # ส่วนที่เหลือกันไว้ให้ order
+        assert b.used == 10
+        data.cancel()
+        account.cancel()
+    run(go())
+
+def test_single_timer_chain():
+    n, windows = 200, 20                                 # limit 10 ต่อ window -> ~20 window
+    async def go():
+        b = Counting(limit=10, window=0.05)
+
+        async def worker():
+            for _ in range(n // 20):
+                await b.acquire(1, PRIO_ORDER)
+        await asyncio.gather(*(worker() for _ in range(20)))
+        return b
+    b = run(go())
+    assert b.used <= 10
+    assert b.dispatches <= n + 2 * windows               # acquire ละครั้ง + timer ไม่เกินไม่กี่ครั้งต่อ window
+
+def test_native_stops_is_disabled_in_runner(caplog):
+    cfg = symbol_config(dict(vars(main), NATIVE_STOPS=True))
+    assert cfg["NATIVE_STOPS"] is False
+    assert "NATIVE_STOPS not supported in runner" in caplog.text
+    caplog.clear()
+    st = NWStrategy(cfg, IntentBroker(None))
+    assert st.orders is None and not caplog.records
+
+    NWStrategy(dict(cfg, NATIVE_STOPS=True), IntentBroker(None))      # broker อื่นที่ไม่มี protective: ไม่เงียบ
+    assert "price polling" in caplog.text
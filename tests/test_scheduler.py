@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from scheduler import Scheduler
+
+T0 = 1_717_200_000.0 + 100.0          # 100 วินาทีหลังขอบแท่ง 30m (1717200000 หาร 1800 ลงตัว)
+
+class Clock:
+    def __init__(self, t=T0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+def sched(rand=lambda: 0.5, **kw):
+    clock = Clock()
+    kw.setdefault("loop_sec", 10)
+    return Scheduler(clock=clock, rand=rand, **kw), clock
+
+def test_cap_depends_on_active():
+    s, _ = sched(idle_sec=60)
+    assert s.delay() == 60
+    assert s.delay(active=True) == 10
+    s, _ = sched(idle_sec=5)                                # idle ไม่ต่ำกว่า loop_sec
+    assert s.delay() == 10
+
+def test_proximity_interpolates_between_near_and_far():
+    s, _ = sched(min_sec=1, near=0.002, far=0.02)
+    assert s.delay(100.0, [100.1], active=True) == 1        # 0.1% <= near
+    assert s.delay(100.0, [103.0], active=True) == 10       # 3% >= far
+    mid = s.delay(100.0, [98.9], active=True)               # 1.1% = กึ่งกลาง near..far
+    assert mid == pytest.approx(5.5)
+    assert s.delay(100.0, [None, 130.0, 100.1], active=True) == 1   # ใช้ระดับที่ใกล้ที่สุด ข้าม None
+    assert s.delay(0.0, [1.0], active=True) == 10           # ไม่มีราคา -> ไม่ใช้ proximity
+
+def test_wakes_at_candle_close_plus_lag():
+    s, clock = sched(idle_sec=3600, lag=0.5)
+    assert s.delay(timeframes=["30m"]) == pytest.approx(1800 - 100 + 0.5)
+    assert s.delay(timeframes=["30m", "1m"]) == pytest.approx(60 - 100 % 60 + 0.5)
+    clock.t = T0 - 100 + 1800 - 0.2                         # เลยเวลาปิดแล้วแต่ยังอยู่ใน lag
+    assert s.delay(timeframes=["30m"]) == pytest.approx(0.7)
+
+def test_deadlines_and_past_events():
+    s, _ = sched(idle_sec=60, lag=0.5)
+    assert s.delay(deadlines=[T0 + 3]) == pytest.approx(3.5)
+    assert s.delay(deadlines=[T0 - 5, None]) == 60          # เลยไปแล้ว/None ไม่นับ
+    assert s.delay(100.0, [100.1], deadlines=[T0 + 30]) == 1
+
+def test_failure_backoff_with_jitter_and_reset():
+    s, _ = sched(error_sec=2, max_error_sec=30)
+    assert [s.failure() for _ in range(6)] == [2, 4, 8, 16, 30, 30]
+    s.success()
+    assert s.failure() == 2
+    lo, _ = sched(rand=lambda: 0.0, error_sec=2, max_error_sec=30)
+    hi, _ = sched(rand=lambda: 0.999, error_sec=2, max_error_sec=30)
+    assert lo.failure() == 1
+    assert hi.failure() == pytest.approx(2.998)
+    for _ in range(5):
+        hi.failure()
+    assert hi.failure() == 30                               # jitter ไม่ดันเกินเพดาน
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json, time, asyncio, threading
+
+import numpy as np
+import pytest
+
+import stream
+from candles import CLOSE, HIGH, TS, get_cache
+from stream import MarketStream, serve_replay
+
+SYM = "BTC/USDT:USDT"
+TF_MS = 1_800_000
+
+class FakeExchange:
+    def __init__(self, n=300, t0=1_700_000_000_000):
+        rng = np.random.default_rng(5)
+        c = 30000 + np.cumsum(rng.normal(0, 50, n))
+        o = np.r_[30000, c[:-1]]
+        ts = t0 + TF_MS * np.arange(n, dtype=np.float64)
+        self.rows = np.column_stack([ts, o, np.maximum(o, c) + 10, np.minimum(o, c) - 10, c, rng.random(n)])
+        self.upto = n - 10               # REST ยังไม่เห็นแท่งท้าย
+        self.calls = {}
+        self.pos = []
+
+    def _c(self, k):
+        self.calls[k] = self.calls.get(k, 0) + 1
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self._c("fetch_ohlcv")
+        rows = self.rows[:self.upto]
+        rows = rows[rows[:, TS] >= since][:limit] if since is not None else rows[-limit:]
+        return rows.tolist()
+
+    def fetch_positions(self, symbols=None):
+        self._c("fetch_positions")
+        return self.pos
+
+def kline(row, closed):
+    t, o, h, l, c, v = row
+    return json.dumps({"stream": "btcusdt@kline_30m", "data": {"e": "kline", "k": {
+        "t": int(t), "o": str(o), "h": str(h), "l": str(l), "c": str(c), "v": str(v), "i": "30m", "x": closed}}})
+
+def account_update(amt, entry):
+    return json.dumps({"e": "ACCOUNT_UPDATE", "a": {"P": [{"s": "BTCUSDT", "pa": str(amt), "ep": str(entry), "ps": "BOTH"}]}})
+
+@pytest.fixture
+def server():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners = []
+
+    def start(messages):
+        r, url = asyncio.run_coroutine_threadsafe(
+            serve_replay(messages, delay=0.02, close_after=False), loop).result(10)
+        runners.append(r)
+        return url
+    yield start
+    for r in runners:
+        asyncio.run_coroutine_threadsafe(r.cleanup(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+def pump(st, until, timeout=5.0):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        st.wait(0.1)
+        st.sync()
+        if until():
+            return True
+    return False
+
+def test_market_and_user_stream_against_replay(server):
+    ex = FakeExchange()
+    rows = ex.rows
+    i = ex.upto                                          # แท่งแรกที่ REST ยังไม่มี
+    forming = rows[i + 1].copy()
+    forming[HIGH] += 5
+    forming[CLOSE] = forming[HIGH] - 1
+    market = [kline(rows[i - 1], True), kline(rows[i], True), kline(rows[i + 1], False), kline(forming, False),
+              json.dumps({"stream": "btcusdt@aggTrade", "data": {"e": "aggTrade", "p": "31234.5"}})]
+    user = [account_update(-0.5, 31000)]
+    url = server({"/stream": market, "/ws/": user})
+    st = MarketStream(ex, SYM, ["30m"], url=url, rest_url=url, min_wake=0, api_key="k").start()
+    try:
+        c = get_cache(ex, SYM, "30m", 600)
+        assert pump(st, lambda: st.price() == 31234.5 and st.position_amt() == 0.5 and c.last_ts() == forming[TS])
+        assert np.array_equal(c.view()[:i + 1], rows[:i + 1])          # แท่งปิดจาก REST + kline ต่อกันไม่ขาด
+        assert np.array_equal(c.view()[-1], forming)                   # แท่งที่ยังไม่ปิดถูกแทนที่
+        assert c.streaming
+        assert st.position == {"amt": 0.5, "side": "short", "entry": 31000.0}
+
+        rest = ex.calls.get("fetch_positions", 0)
+        st.invalidate_position()                         # order ที่ไม่มี ACCOUNT_UPDATE ตามมา
+        for _ in range(5):
+            st.sync()
+            assert st.position_amt() is not None
+        assert ex.calls["fetch_positions"] == rest + 1   # REST ครั้งเดียว ไม่ใช่ทุก tick
+        assert st.position_amt() == 0.0                  # REST: ไม่มี position
+    finally:
+        st.stop()
+        st._thread.join(5)
+    assert not st._thread.is_alive()                     # stop() ปิด websocket ทันที
+
+def test_listen_key_rest_uses_api_key(server):
+    seen = []
+
+    async def go(url):
+        import aiohttp
+        st = MarketStream(FakeExchange(), SYM, ["30m"], url=url, rest_url=url, api_key="k")
+        async with aiohttp.ClientSession() as s:
+            seen.append(await st._listen_key(s, "POST"))
+            seen.append(await st._listen_key(s, "PUT"))
+    asyncio.run(go(server([])))
+    assert seen == [{"listenKey": "replay"}] * 2
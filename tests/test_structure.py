@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from structure import StructureTracker
+
+def find_swings_from_ohlcv(ohlcv, left=2, right=2):
+    """ของเดิมใน main.py1"""
+    out=[]; highs=[c[2] for c in ohlcv]; lows=[c[3] for c in ohlcv]
+    n=len(ohlcv)
+    for i in range(left, n-right):
+        if highs[i]==max(highs[i-left:i+right+1]): out.append(('high',i,ohlcv[i][0],highs[i]))
+        if lows[i]==min(lows[i-left:i+right+1]):   out.append(('low', i,ohlcv[i][0],lows[i]))
+    return out
+
+def detect_bos_choch_from_swings(ohlcv, swings):
+    """ของเดิมใน main.py1"""
+    out=[]; last_trend=None
+    for k in range(1, len(swings)):
+        ptype, ip, _, pp = swings[k-1]
+        stype, i, ts, p = swings[k]
+        close = ohlcv[i][4]
+        sig=None; trend=last_trend
+        if stype=='high' and close>pp:
+            sig='BOS'; trend='up'
+        elif stype=='low' and close<pp:
+            sig='BOS'; trend='down'
+        else:
+            if last_trend=='up' and close<pp:
+                sig='CHOCH'; trend='down'
+            elif last_trend=='down' and close>pp:
+                sig='CHOCH'; trend='up'
+        if sig:
+            out.append({'signal':sig,'trend':trend,'price':p,'ts':ts,'i':i})
+            last_trend=trend
+    return out
+
+def recent_swing(swings, kind, lo, hi):
+    """find_recent_m5_swing_in_zone เดิม: swing ล่าสุดชนิด kind ที่ราคาอยู่ใน [lo, hi]"""
+    for stype, idx, ts, price in reversed(swings):
+        if stype == kind and lo <= price <= hi:
+            return price
+    return None
+
+def ohlcv(n, seed=0, grid=25.0):
+    """ราคาปัดเป็น grid -> high/low เท่ากันหลายแท่งติดกันบ่อย (swing เสมอ)"""
+    rng = np.random.default_rng(seed)
+    close = np.round(30000 * np.exp(np.cumsum(rng.standard_t(4, n) * 1.5e-3)) / grid) * grid
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + np.round(rng.uniform(0, 60, n) / grid) * grid
+    low = np.minimum(open_, close) - np.round(rng.uniform(0, 60, n) / grid) * grid
+    ts = np.arange(n, dtype=np.float64) * 300_000
+    return np.column_stack([ts, open_, high, low, close, np.ones(n)])
+
+def ticks(data, w):
+    """ทุกแท่งปิดใหม่ตามด้วยหลาย tick ของแท่งที่ยังไม่ปิด: high/low/close เปลี่ยนไปมา
+    รวมกรณีที่ high/low ของแท่งที่ยังไม่ปิดเท่ากับ / เลยจุดสูงสุด-ต่ำสุดของแท่งก่อนหน้าพอดี"""
+    for end in range(w, len(data) + 1):
+        base = data[end - w:end]
+        prev_hi, prev_lo = base[-4:-1, 2].max(), base[-4:-1, 3].min()
+        for hi, lo in ((base[-1, 2], base[-1, 3]), (prev_hi, prev_lo), (prev_hi + 25, base[-1, 3]),
+                       (base[-1, 2], prev_lo - 25), (base[-1, 2], base[-1, 3])):
+            o = base.copy()
+            o[-1, 2] = max(hi, o[-1, 1])
+            o[-1, 3] = min(lo, o[-1, 1])
+            o[-1, 4] = o[-1, 3] + (o[-1, 2] - o[-1, 3]) * ((end * 7) % 5) / 4
+            yield o
+
+@pytest.mark.parametrize("left, right, w", [(1, 1, 150), (2, 2, 200), (3, 1, 120)])
+def test_tracker_matches_batch_on_every_tick(left, right, w):
+    data = ohlcv(700, seed=left * 10 + right)
+    tr = StructureTracker(left, right)
+    signals = 0
+    for o in ticks(data, w):
+        rows = o.tolist()
+        sw = find_swings_from_ohlcv(rows, left, right)
+        sig = detect_bos_choch_from_swings(rows, sw)
+        tr.sync(o)
+        assert tr.last_signal(len(o)) == (sig[-1] if sig else None)
+        signals += bool(sig)
+        lo, hi = np.percentile(o[:, 4], [30, 70])
+        for kind in ("high", "low"):
+            assert tr.recent_swing(kind, lo, hi, len(o)) == recent_swing(sw, kind, lo, hi)
+    assert signals > 0
+
+def test_tracker_resyncs_after_gap():
+    data = ohlcv(900, seed=4)
+    tr = StructureTracker(2, 2)
+    for o in (data[:300], data[5:305], data[600:900], data[100:400]):
+        rows = o.tolist()
+        sig = detect_bos_choch_from_swings(rows, find_swings_from_ohlcv(rows, 2, 2))
+        assert tr.sync(o).last_signal(len(o)) == (sig[-1] if sig else None)
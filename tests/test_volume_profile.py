@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from volume_profile import VolumeProfile, poc, profiles
+
+def _ref_poc(ohlcv, low_bound, high_bound, buckets):
+    """calc_poc_in_range เดิมของ main.py1 (dict ทีละแท่ง)"""
+    if not ohlcv or high_bound<=low_bound: return None
+    lo=float(low_bound); hi=float(high_bound)
+    step=(hi-lo)/float(buckets)
+    if step<=0: return None
+    bins={}
+    for c in ohlcv:
+        if len(c)<5: continue
+        px=min(hi, max(lo, c[4])); vol=(c[5] if len(c)>5 and c[5] is not None else 0.0)
+        idx=int((px-lo)/step); idx=max(0, min(buckets-1, idx))
+        center=lo+(idx+0.5)*step
+        bins[center]=bins.get(center,0.0)+vol
+    if not bins: return None
+    return max(bins.items(), key=lambda kv: kv[1])[0]
+
+def ohlcv(n, seed=0, ties=False):
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.standard_t(4, n) * 2e-3))
+    vol = rng.lognormal(0.0, 0.5, n)
+    if ties:                                     # ราคา/volume ซ้ำกันเยอะ -> ช่องเสมอกันบ่อย
+        close = np.round(close / 50) * 50
+        vol = rng.integers(1, 4, n).astype(np.float64)
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 2e-3, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 2e-3, n))
+    ts = np.arange(n, dtype=np.float64) * 60_000
+    return np.column_stack([ts, open_, high, low, close, vol])
+
+def windows(data, w, steps):
+    """window ที่เลื่อนตาม steps ใส่ลง buffer เดิม (เหมือน view ของ CandleCache ที่ถูกเขียนทับ)
+    แท่งสุดท้ายเป็นแท่งที่ยังไม่ปิด: ราคา/volume เปลี่ยนทุก tick"""
+    buf = np.empty((w, data.shape[1]))
+    end = w
+    for k, s in enumerate(steps):
+        end += s
+        if end > len(data):
+            return
+        buf[:] = data[end - w:end]
+        buf[-1, 4] = buf[-1, 1] + (k % 5 - 2) * 30.0
+        buf[-1, 5] *= (k % 3) / 2.0
+        yield buf
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_incremental_poc_matches_calc_poc_in_range(ties):
+    data = ohlcv(1500, seed=3, ties=ties)
+    w = 300
+    vp, fixed = VolumeProfile(False), VolumeProfile(False)
+    steps = [0, 0, 1, 1, 0, 2, 1, 3, 1] * 70
+    for o in windows(data, w, steps):
+        rows = o.tolist()
+        lo, hi = np.percentile(o[:, 4], [10, 90])
+        vp.sync(o)
+        for a, b, n in ((lo, hi, 40), (lo, hi, 10), (o[:, 3].min(), o[:, 2].max(), 24)):
+            assert vp.poc(a, b, n) == _ref_poc(rows, a, b, n)
+        assert fixed.sync(o).poc(29000, 31000, 40) == _ref_poc(rows, 29000, 31000, 40)
+    # ช่วงคงที่: คิดทั้ง window ครั้งแรกและทุก 1 window ของแท่งที่เลื่อนไป นอกนั้น update ทีละแท่ง
+    assert fixed.rebuilds == 1 + sum(steps) // (w - 1)
+
+def test_spread_volumes_match_batch_after_shifts():
+    data = ohlcv(1200, seed=7)
+    vp = VolumeProfile(True)
+    for o in windows(data, 200, [0, 1, 1, 2, 0, 5, 1] * 50):
+        vp.sync(o)
+        lo, hi = float(o[:, 3].min()), float(o[:, 2].max())
+        for r in ((29000.0, 31000.0, 40), (lo, hi, 30)):
+            assert np.allclose(vp.volumes(*r), profiles(o, [r], True)[0], rtol=1e-9, atol=1e-9)
+            assert vp.poc(*r) == poc(o, *r, spread=True)
+
+def test_gap_and_restart_rebuild():
+    data = ohlcv(1000, seed=1)
+    vp = VolumeProfile(False)
+    for o in (data[:200], data[1:201], data[600:800], data[:200], data[100:300]):
+        vp.sync(o)
+        assert vp.poc(29000, 31000, 40) == _ref_poc(o.tolist(), 29000, 31000, 40)
+    assert vp.rebuilds == 4                      # ต่อกันได้เฉพาะ data[:200] -> data[1:201]
+    assert vp.sync(data[:1]).poc(29000, 31000, 40) == _ref_poc(data[:1].tolist(), 29000, 31000, 40)
+    assert vp.sync(data[:0]).poc(29000, 31000, 40) is None
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# volume_profile.py
+# Volume profile / POC ด้วย NumPy แทนการวน dict ทีละแท่งใน calc_poc_in_range (main.py1)
+#
+# สองแบบของการวาง volume ของแต่ละแท่ง:
+#   spread=False  ทั้งก้อนที่ราคาปิด (ราคานอกช่วงถูกดันเข้าช่องริม) = พฤติกรรมเดิมทุกประการ
+#   spread=True   เกลี่ยเท่าๆ กันตลอด low..high ของแท่ง นับเฉพาะส่วนที่อยู่ในช่วง (POC นิ่งกว่า)
+
+from collections import OrderedDict
+
+import numpy as np
+
+from candles import TS, HIGH, LOW, CLOSE, VOLUME
+
+NEAR_TIE = 1e-9              # ช่องที่ volume ต่างจากช่องสูงสุดไม่เกินนี้ (สัมพัทธ์) ถือว่าเสมอ
+CACHE_RANGES = 16            # ช่วง (low, high, buckets) ที่ VolumeProfile เก็บ volume ต่อช่องไว้ update ทีละแท่ง
+
+def _close_bins(closes, lo, hi, buckets):
+    """index ของช่องแบบเดียวกับ calc_poc_in_range เดิม (clamp ราคา แล้ว int((px-lo)/step))"""
+    step = (hi - lo) / float(buckets)
+    idx = ((np.clip(closes, lo, hi) - lo) / step).astype(np.int64)
+    return np.clip(idx, 0, buckets - 1)
+
+def _spread_cdf(lows, highs, vols, x):
+    """volume สะสมของราคา <= x แต่ละตัว (แท่งละ vol กระจายสม่ำเสมอบน [low, high]); (n,) x (m,) -> (m,)"""
+    w = highs - lows
+    pt = w <= 0
+    frac = np.empty((len(lows), len(x)))
+    if (~pt).any():
+        frac[~pt] = np.clip((x[None, :] - lows[~pt, None]) / w[~pt, None], 0.0, 1.0)
+    if pt.any():
+        frac[pt] = (x[None, :] >= lows[pt, None])
+    return vols @ frac
+
+def _rows(ohlcv):
+    a = np.asarray(ohlcv, dtype=np.float64)
+    if a.ndim != 2 or a.shape[1] < 5:
+        return None
+    return a
+
+def profiles(ohlcv, ranges, spread=False):
+    """volume ต่อช่องของหลายช่วงในรอบเดียว: ranges = [(low, high, buckets), ...] -> list ของ array (หรือ None)"""
+    a = _rows(ohlcv)
+    out = [None] * len(ranges)
+    if a is None or not len(a):
+        return out
+    vols = np.nan_to_num(a[:, VOLUME]) if a.shape[1] > VOLUME else np.zeros(len(a))
+    ok = [k for k, (lo, hi, b) in enumerate(ranges) if hi > lo and b > 0]
+    if not ok:
+        return out
+    if not spread:
+        # ทุกช่วงต่อกันเป็น histogram เดียว: ช่วง k ใช้ช่อง offset[k]..offset[k]+buckets
+        idx, w, offs, off = [], [], [], 0
+        for k in ok:
+            lo, hi, b = ranges[k]
+            idx.append(_close_bins(a[:, CLOSE], float(lo), float(hi), int(b)) + off)
+            w.append(vols)
+            offs.append(off)
+            off += int(b)
+        h = np.bincount(np.concatenate(idx), weights=np.concatenate(w), minlength=off)
+        for k, o in zip(ok, offs):
+            out[k] = h[o:o + int(ranges[k][2])]
+        return out
+    edges, offs = [], []
+    for k in ok:
+        lo, hi, b = ranges[k]
+        offs.append(sum(len(e) for e in edges))
+        edges.append(np.linspace(float(lo), float(hi), int(b) + 1))
+    cdf = _spread_cdf(a[:, LOW], a[:, HIGH], vols, np.concatenate(edges))
+    for k, o, e in zip(ok, offs, edges):
+        out[k] = np.diff(cdf[o:o + len(e)])
+    return out
+
+def _poc_from(vols, lo, hi, buckets, first_idx=None):
+    step = (hi - lo) / float(buckets)
+    if first_idx is not None:
+        # calc_poc_in_range เดิมคืนช่องที่ "เจอก่อน" เมื่อ volume เท่ากัน (ลำดับการใส่ dict)
+        cand = np.flatnonzero(vols == vols.max())
+        cand = cand[np.argsort(first_idx[cand], kind="stable")]
+        i = int(cand[0])
+    else:
+        i = int(np.argmax(vols))
+    return lo + (i + 0.5) * step
+
+def poc(ohlcv, low_bound, high_bound, buckets=40, spread=False):
+    """ราคากลางของช่องที่ volume มากที่สุดใน [low_bound, high_bound] หรือ None
+    (spread=False ให้ผลเท่ากับ calc_poc_in_range เดิม รวมถึงกรณีเสมอ)"""
+    a = _rows(ohlcv)
+    if a is None or not len(a) or high_bound <= low_bound:
+        return None
+    lo, hi = float(low_bound), float(high_bound)
+    if (hi - lo) / float(buckets) <= 0:
+        return None
+    vols = profiles(a, [(lo, hi, buckets)], spread)[0]
+    if spread:
+        return _poc_from(vols, lo, hi, buckets) if vols.any() else None
+    idx = _close_bins(a[:, CLOSE], lo, hi, buckets)
+    first = np.full(buckets, len(a))
+    np.minimum.at(first, idx, np.arange(len(a)))
+    return _poc_from(vols, lo, hi, buckets, first)
+
+class VolumeProfile:
+    """Profile ของ window ล่าสุดบน timeframe เดียว สำหรับ query หลายช่วง/หลายครั้งต่อ tick
+
+    sync(o) (o = ohlcv ที่แถวสุดท้ายเป็นแท่งที่ยังไม่ปิด) เทียบชุดแท่งปิดกับรอบก่อนด้วย ts:
+    volume ต่อช่องของทุกช่วงที่เคย query (ล่าสุด CACHE_RANGES ช่วง) บวกแท่งที่เพิ่ง
+    ปิดและลบแท่งที่หลุด window ออก O(แท่งที่เปลี่ยน) ไม่สร้างใหม่ทั้ง window
+    ช่วงใหม่ (หรือหลัง window ขาดช่วง / ครบ 1 window ของการ update เพื่อไม่ให้ผลรวมคลาด) คิดแบบ batch ครั้งเดียว
+    แท่งที่ยังไม่ปิดบวกแยกทุก query
+    """
+
+    def __init__(self, spread=False, max_ranges=CACHE_RANGES):
+        self.spread = spread
+        self.max_ranges = max_ranges
+        self.rebuilds = 0                # จำนวนครั้งที่คิด volume ของช่วงใหม่ทั้ง window
+        self._closed = None
+        self._ranges = OrderedDict()     # (lo, hi, buckets) -> [volume ต่อช่อง, จำนวนแท่งที่ update ไปแล้ว]
+        self._window = None
+        self._forming = None
+
+    def sync(self, o):
+        a = _rows(o)
+        if a is None or not len(a):
+            self._window = None
+            return self
+        self._shift(a[:-1])
+        self._window = a
+        self._forming = a[-1:]
+        return self
+
+    def _shift(self, closed):
+        old = self._closed
+        if old is not None and len(old) == len(closed) and (not len(old) or (
+                old[0, TS] == closed[0, TS] and old[-1, TS] == closed[-1, TS])):
+            return
+        added = evicted = None
+        if old is not None and len(old) and len(closed):
+            ts = old[:, TS]
+            i = int(np.searchsorted(ts, closed[0, TS]))
+            m = len(old) - i
+            if i < len(old) and m <= len(closed) and np.array_equal(ts[i:], closed[:m, TS]):
+                evicted, added = old[:i], closed[m:]
+        # view ของ CandleCache ถูกเขียนทับได้: เก็บสำเนาไว้ลบแท่งที่หลุด window รอบหน้า
+        self._closed = np.array(closed)
+        if added is None or len(added) + len(evicted) >= len(closed):
+            self._ranges.clear()
+            return
+        for key in list(self._ranges):
+            r = self._ranges[key]
+            r[1] += len(added)
+            if r[1] >= len(closed):
+                del self._ranges[key]
+                continue
+            if len(added):
+                r[0] += profiles(added, [key], self.spread)[0]
+            if len(evicted):
+                r[0] -= profiles(evicted, [key], self.spread)[0]
+
+    def volumes(self, low_bound, high_bound, buckets):
+        """volume ต่อช่อง (array ยาว buckets) ของ window ล่าสุด หรือ None"""
+        if self._window is None or high_bound <= low_bound or buckets <= 0:
+            return None
+        key = (float(low_bound), float(high_bound), int(buckets))
+        r = self._ranges.get(key)
+        if r is None:
+            self.rebuilds += 1
+            v = profiles(self._closed, [key], self.spread)[0]
+            r = self._ranges[key] = [np.zeros(key[2]) if v is None else v, 0]
+            while len(self._ranges) > self.max_ranges:
+                self._ranges.popitem(last=False)
+        else:
+            self._ranges.move_to_end(key)
+        return r[0] + profiles(self._forming, [key], self.spread)[0]
+
+    def poc(self, low_bound, high_bound, buckets=40):
+        """POC ของ window ล่าสุด; ถ้าช่องบนสุดเกือบเสมอกัน (ผลรวมที่บวก/ลบทีละแท่งปัดเศษต่างจากบวกตามลำดับ)
+        คิดใหม่แบบ batch เพื่อให้ได้ช่องเดียวกับ poc() เสมอ"""
+        v = self.volumes(low_bound, high_bound, buckets)
+        if v is None:
+            return None
+        lo, hi = float(low_bound), float(high_bound)
+        top = v.max()
+        if np.count_nonzero(v >= top - abs(top) * NEAR_TIE - 1e-12) > 1:
+            return poc(self._window, lo, hi, buckets, self.spread)
+        if self.spread and top <= 0:
+            return None
+        return _poc_from(v, lo, hi, buckets)
+
+    def pocs(self, ranges):
+        """POC ของหลายช่วง [(low, high, buckets), ...]"""
+        return [self.poc(lo, hi, b) for lo, hi, b in ranges]